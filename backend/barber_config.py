@@ -0,0 +1,124 @@
+import json
+import os
+import re
+
+# Same defaults the Node CLI writes in ensureSharedConfig()
+DEFAULT_TEAM_CONFIG = {
+    "ignorePatterns": [
+        "package.json",
+        "package-lock.json",
+        "*.svg",
+        "*.png",
+        "*.jpg",
+        "*.mp4",
+    ],
+    "largeDiffThreshold": 600,
+}
+
+# git's own defaults for diffs: a rename is a delete and an add at least 50% alike, and inexact
+# matching is skipped when there are more than renameLimit sources x destinations to compare.
+# A team config may override them with renameThreshold, copyThreshold and renameLimit.
+RENAME_THRESHOLD = 50
+COPY_THRESHOLD = 0
+RENAME_LIMIT = 1000
+# What git prints (and still exits 0) when renameLimit stopped it from comparing every pair
+RENAME_LIMIT_WARNINGS = ("rename detection was skipped", "only found copies from modified paths")
+
+
+def team_config_path(repo_root):
+    return os.path.join(repo_root, ".git-barber", "team-config.json")
+
+
+def load_team_config(repo_root):
+    """Read .git-barber/team-config.json, falling back to the CLI defaults for missing keys."""
+    config = dict(DEFAULT_TEAM_CONFIG)
+    try:
+        with open(team_config_path(repo_root), encoding="utf-8") as config_file:
+            config.update(json.load(config_file))
+    except (OSError, ValueError):
+        pass
+    return config
+
+
+def ignore_matcher(ignore_patterns):
+    """
+    Build a predicate with the same semantics as shouldIgnoreFile() in the CLI:
+    patterns with `*` match the whole path with `*` as any run of characters,
+    other patterns must equal the path exactly.
+    """
+    exact = {pattern for pattern in ignore_patterns if "*" not in pattern}
+    wildcards = [pattern for pattern in ignore_patterns if "*" in pattern]
+    regex = None
+    if wildcards:
+        regex = re.compile("|".join(
+            "(?:" + ".*".join(re.escape(part) for part in pattern.split("*")) + ")" for pattern in wildcards
+        ) + r"\Z", re.DOTALL)
+
+    def should_ignore(path):
+        return path in exact or (regex is not None and regex.match(path) is not None)
+
+    return should_ignore
+
+
+def ignore_pathspecs(ignore_patterns):
+    """
+    The same patterns as git `:(exclude)` pathspecs, so git skips the files
+    itself. Exact patterns are literal; in the rest only `*` is special, and
+    git's default pathspec matching lets it cross `/` like the CLI's `.*`.
+    """
+    pathspecs = []
+    for pattern in ignore_patterns:
+        if "*" in pattern:
+            pathspecs.append(":(exclude)" + re.sub(r"([\\?\[\]])", r"\\\1", pattern))
+        else:
+            pathspecs.append(":(exclude,literal)" + pattern)
+    return pathspecs
+
+
+def rename_settings(config, similarity=None, copies=None, limit=None):
+    """Rename detection for a diff: the given values, else the team config's, else git's defaults."""
+    return {
+        "similarity": similarity if similarity is not None else int(config.get("renameThreshold", RENAME_THRESHOLD)),
+        "copies": copies if copies is not None else int(config.get("copyThreshold", COPY_THRESHOLD)),
+        "limit": limit if limit is not None else int(config.get("renameLimit", RENAME_LIMIT)),
+    }
+
+
+def rename_args(similarity=RENAME_THRESHOLD, copies=COPY_THRESHOLD, limit=RENAME_LIMIT):
+    """
+    git diff options for the given settings: -M and -C take a similarity
+    percentage (0 turns each off), and -l bounds the work inexact matching
+    may do, so a huge directory move can't make detection quadratic.
+    """
+    if not similarity and not copies:
+        return ["--no-renames"]
+    args = [f"-M{similarity}%"] if similarity else []
+    if copies:
+        args.append(f"-C{copies}%")
+    return args + [f"-l{limit}"]
+
+
+def rename_limit_exceeded(stderr):
+    return any(warning in stderr for warning in RENAME_LIMIT_WARNINGS)
+
+
+def load_branch_config(repo_root):
+    """
+    Read the personal stack layout (baseBranches, branchTree, ancestors) from
+    .git-barber/my-basebranches.json, or from the older .git-barber/config.json.
+    """
+    for name in ("my-basebranches.json", "config.json"):
+        try:
+            with open(os.path.join(repo_root, ".git-barber", name), encoding="utf-8") as config_file:
+                config = json.load(config_file)
+        except (OSError, ValueError):
+            continue
+        if config.get("branchTree"):
+            break
+    else:
+        config = {}
+    return {
+        "baseBranches": config.get("baseBranches", {}),
+        "branchTree": config.get("branchTree", {}),
+        "ancestors": config.get("ancestors", {}),
+    }
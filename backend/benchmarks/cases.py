@@ -0,0 +1,289 @@
+import functools
+import itertools
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from git import Repo
+
+from barber_config import ignore_matcher
+from split_engine import SplitEngine
+from split_planner import plan_split
+
+
+class SkipCase(Exception):
+    """Raised by a case that cannot run in this environment (e.g. an optional dependency is missing)."""
+
+
+@dataclass
+class Case:
+    name: str
+    # "route" for the FastAPI app, "cli" for splitty/splitty2
+    group: str
+    run: Callable
+    # Untimed, around every run; `setup` may return a value that is passed to `run` and `teardown`
+    setup: Optional[Callable] = None
+    teardown: Optional[Callable] = None
+    # Drop the in-memory diff cache before every run, so git and the parser are measured
+    cold: bool = False
+
+
+class BenchContext:
+    """What every case gets: the synthetic repository, a test client bound to the app, and unique names."""
+
+    def __init__(self, repo, client):
+        self.repo = repo
+        self.path = repo.path
+        self.client = client
+        self.git_repo = Repo(repo.path)
+        self._counter = itertools.count()
+        self.stack_tips = {name: self.git(["rev-parse", name]).strip() for name in repo.stack}
+
+    def unique(self, prefix):
+        return f"bench/{prefix}-{next(self._counter)}"
+
+    def git(self, args, cwd=None, input=None):
+        return subprocess.run(["git", *args], cwd=cwd or self.path, input=input, check=True, capture_output=True,
+                              text=True).stdout
+
+    def delete_branches(self, names):
+        # Tolerates branches a failed run never created
+        if names:
+            self.git(["update-ref", "--stdin"], input="".join(f"delete refs/heads/{name}\n" for name in names))
+
+    def check(self, response, status=200):
+        if response.status_code != status:
+            raise RuntimeError(f"{response.request.method} {response.request.url.path} -> "
+                               f"{response.status_code}: {response.text[:500]}")
+        return response
+
+    @functools.cached_property
+    def changed_paths(self):
+        # As the split engine lists them: a rename is one path, so the cases never split one in two
+        with SplitEngine(self.git_repo, "main", "big") as engine:
+            return [path for path, _ in engine.changed_files()]
+
+
+def _get(path, **params):
+    def run(ctx, _=None):
+        ctx.check(ctx.client.get(path, params={"repo_path": ctx.path, **params}))
+    return run
+
+
+def _scan_repos(ctx, _=None):
+    # The workspace the synthetic repositories were generated in, rescanned incrementally every run
+    ctx.check(ctx.client.get("/repos/scan", params={"root": os.path.dirname(ctx.path), "refresh": True}))
+
+
+def _diff_params(**extra):
+    return {"base_branch": "main", "target_branch": "big", **extra}
+
+
+def _stream_diff(ctx, _=None):
+    params = {"repo_path": ctx.path, **_diff_params(detailed=True, stream=True)}
+    with ctx.client.stream("GET", "/diff", params=params) as response:
+        ctx.check(response)
+        for _ in response.iter_lines():
+            pass
+
+
+def _diff_hunks_setup(ctx):
+    index = ctx.check(ctx.client.get("/diff/files", params={"repo_path": ctx.path, **_diff_params(), "limit": 50}))
+    return [entry["cursor"] for entry in index.json()["files"]]
+
+
+def _diff_hunks(ctx, cursors):
+    ctx.check(ctx.client.get("/diff/hunks", params={"repo_path": ctx.path, "cursor": cursors}))
+
+
+def _stack_tree(ctx):
+    chain = ["main", *ctx.repo.stack]
+    return {parent: [child] for parent, child in zip(chain, chain[1:])}
+
+
+def _stack_diff_summary(ctx, _=None):
+    ctx.check(ctx.client.post("/stack-diff-summary", json={
+        "repo_path": ctx.path, "branch_tree": _stack_tree(ctx), "base_branches": ["main"],
+    }))
+
+
+def _reset_stack(ctx, _=None):
+    # Every run merges main down the same, freshly reset stack
+    for name in ctx.repo.stack:
+        ctx.git(["update-ref", f"refs/heads/{name}", ctx.stack_tips[name]])
+
+
+def _stack_sync(ctx, _=None):
+    result = ctx.check(ctx.client.post("/stack-sync", json={
+        "repo_path": ctx.path, "start_branch": "main", "branch_tree": _stack_tree(ctx),
+    })).json()
+    if result["conflict"] or result["failed"]:
+        raise RuntimeError(f"stack sync did not merge cleanly: {result}")
+
+
+def _split_setup(ctx):
+    return [ctx.unique("base"), ctx.unique("feature")]
+
+
+def _split(ctx, names):
+    paths = ctx.changed_paths
+    ctx.check(ctx.client.post("/split", json={
+        "repo_path": ctx.path, "base_branch": "main", "big_branch": "big",
+        "sub_base_branch": names[0], "sub_feature_branch": names[1], "sub_base_files": paths[:len(paths) // 2],
+    }))
+
+
+def _split_stack_setup(ctx):
+    return [ctx.unique("layer") for _ in range(4)]
+
+
+def _layers(paths, names):
+    size = -(-len(paths) // len(names))
+    return [(name, paths[position * size:(position + 1) * size]) for position, name in enumerate(names)]
+
+
+def _split_stack(ctx, names):
+    ctx.check(ctx.client.post("/split-stack", json={
+        "repo_path": ctx.path, "base_branch": "main", "big_branch": "big",
+        "layers": [{"branch": name, "files": files} for name, files in _layers(ctx.changed_paths, names)],
+    }))
+
+
+def _push_setup(ctx):
+    # A branch whose commit the remote doesn't have yet, so objects are actually sent
+    name = ctx.unique("push")
+    commit = ctx.git(["commit-tree", "-p", "feat/b0", "-m", name, "feat/b0^{tree}"]).strip()
+    ctx.git(["update-ref", f"refs/heads/{name}", commit])
+    return [name]
+
+
+def _push(ctx, names):
+    ctx.check(ctx.client.post("/push", json={"repo_path": ctx.path, "branch": names[0]}))
+
+
+def _push_background(ctx, names):
+    # Queues the push as a job and follows its progress stream until the job event
+    job = ctx.check(ctx.client.post("/push", params={"background": True},
+                                    json={"repo_path": ctx.path, "branches": names})).json()["job"]
+    with ctx.client.stream("GET", f"/jobs/{job['id']}/events") as response:
+        ctx.check(response)
+        for line in response.iter_lines():
+            if line.startswith("data: ") and '"type":"job"' in line and '"status":"succeeded"' not in line:
+                raise RuntimeError(f"push job failed: {line}")
+
+
+def _push_teardown(ctx, names):
+    ctx.git(["update-ref", "--stdin"], cwd=ctx.repo.remote,
+            input="".join(f"delete refs/heads/{name}\n" for name in names))
+    ctx.delete_branches(names)
+
+
+def _checkout(ctx, _=None):
+    for branch in ("feat/b0", "main"):
+        ctx.check(ctx.client.post("/checkout", json={"repo_path": ctx.path, "branch": branch}))
+
+
+# CLI: splitty drives git directly through GitPython and the split engine
+
+def _get_changed_files(ctx, _=None):
+    import splitty
+    splitty.get_changed_files(ctx.git_repo, "main", "big")
+
+
+def _engine_split(ctx, names):
+    # What splitty's manual and --auto splits run once the layers are chosen
+    with SplitEngine(ctx.git_repo, "main", "big") as engine:
+        paths = [path for path, _ in engine.changed_files()]
+        engine.split([(name, files, f"bench {name}") for name, files in _layers(paths, names)])
+
+
+def _auto_plan(ctx, _=None):
+    with SplitEngine(ctx.git_repo, "main", "big") as engine:
+        plan_split(engine, 600, ignore_matcher([]))
+
+
+# CLI: splitty2 is a thin client of the API; its session is routed into the in-process app
+
+def _splitty2(ctx):
+    try:
+        import requests
+        import splitty2
+    except ImportError as e:
+        raise SkipCase(f"splitty2 needs {e.name}")
+    if not getattr(splitty2.session, "_bench_mounted", False):
+        splitty2.session.mount(splitty2.API_BASE, _TestClientAdapter(ctx.client, requests))
+        splitty2.session._bench_mounted = True
+    return splitty2
+
+
+def _splitty2_branches(ctx, _=None):
+    _splitty2(ctx).get_repo_branches(ctx.path)
+
+
+def _splitty2_diff(ctx, _=None):
+    _splitty2(ctx).get_diff(ctx.path, "main", "big", detailed=True)
+
+
+def _splitty2_split(ctx, names):
+    paths = ctx.changed_paths
+    _splitty2(ctx).split_branches(ctx.path, "main", "big", names[0], names[1], paths[:len(paths) // 2], False)
+
+
+class _TestClientAdapter:
+    """A requests transport adapter that hands requests to the in-process test client instead of a socket."""
+
+    def __init__(self, client, requests):
+        self.client = client
+        self.requests = requests
+
+    def send(self, request, **kwargs):
+        answer = self.client.request(request.method, request.url, content=request.body,
+                                     headers=dict(request.headers))
+        response = self.requests.Response()
+        response.status_code = answer.status_code
+        response.headers = self.requests.structures.CaseInsensitiveDict(answer.headers)
+        response._content = answer.content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def _delete_created(ctx, names):
+    ctx.delete_branches(names)
+
+
+CASES = [
+    Case("is-git-repo", "route", _get("/is-git-repo")),
+    Case("repos-scan", "route", _scan_repos),
+    Case("current-branch", "route", _get("/current-branch")),
+    Case("branches", "route", _get("/branches")),
+    Case("branches-prefix", "route", _get("/branches", prefix="feat/b1")),
+    Case("branches-ahead-behind", "route", _get("/branches", ahead_behind="main")),
+    Case("diff-name-status", "route", _get("/diff", **_diff_params()), cold=True),
+    Case("diff-detailed", "route", _get("/diff", **_diff_params(detailed=True)), cold=True),
+    Case("diff-detailed-cached", "route", _get("/diff", **_diff_params(detailed=True))),
+    Case("diff-compact", "route", _get("/diff", **_diff_params(detailed=True, format="compact")), cold=True),
+    Case("diff-compact-cached", "route", _get("/diff", **_diff_params(detailed=True, format="compact"))),
+    Case("diff-stream", "route", _stream_diff, cold=True),
+    Case("diff-files", "route", _get("/diff/files", **_diff_params()), cold=True),
+    Case("diff-hunks", "route", _diff_hunks, setup=_diff_hunks_setup, cold=True),
+    Case("stack-diff-summary", "route", _stack_diff_summary, cold=True),
+    Case("stack-sync", "route", _stack_sync, setup=_reset_stack, teardown=_reset_stack),
+    Case("split-plan", "route", _get("/split-plan", base_branch="main", big_branch="big")),
+    Case("split", "route", _split, setup=_split_setup, teardown=_delete_created),
+    Case("split-stack", "route", _split_stack, setup=_split_stack_setup, teardown=_delete_created),
+    Case("push", "route", _push, setup=_push_setup, teardown=_push_teardown),
+    Case("push-background", "route", _push_background, setup=_push_setup, teardown=_push_teardown),
+    Case("checkout", "route", _checkout),
+    Case("splitty-get-changed-files", "cli", _get_changed_files),
+    Case("splitty-split", "cli", _engine_split, setup=_split_stack_setup, teardown=_delete_created),
+    Case("splitty-auto-plan", "cli", _auto_plan),
+    Case("splitty2-branches", "cli", _splitty2_branches),
+    Case("splitty2-diff", "cli", _splitty2_diff, cold=True),
+    Case("splitty2-split", "cli", _splitty2_split, setup=_split_setup, teardown=_delete_created),
+]
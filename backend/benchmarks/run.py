@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark the API routes and the CLIs against synthetic repositories.
+
+    python -m benchmarks.run --scale small --scale medium --output results.json
+    python -m benchmarks.run --scale small --baseline results.json --fail-on-regression
+
+Repositories are generated once per scale under --workdir and reused, each
+with a local bare `origin`; nothing touches the network.
+"""
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Every run of a big case would otherwise be logged as slow
+os.environ.setdefault("GIT_BARBER_SLOW_MS", "inf")
+
+import click
+from fastapi.testclient import TestClient
+
+from benchmarks.cases import CASES, BenchContext, SkipCase
+from benchmarks.synthetic import SCALES, build_repo
+from git_api import app
+from utils.diff_cache import diff_cache
+from utils.repo_pool import repo_pool
+from utils.repo_watch import repo_watches
+
+RESULTS_VERSION = 1
+
+
+def run_case(case, ctx, repeat, warmup):
+    samples = []
+    for iteration in range(warmup + repeat):
+        state = case.setup(ctx) if case.setup else None
+        if case.cold:
+            diff_cache.clear()
+        try:
+            started = time.perf_counter()
+            case.run(ctx, state)
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            if case.teardown:
+                case.teardown(ctx, state)
+        if iteration >= warmup:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+        "stdev_ms": round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+    }
+
+
+def environment():
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    source = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return {
+        "git": git_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "source_commit": source.stdout.strip() if source.returncode == 0 else None,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline, tolerance, noise_ms):
+    """Per-result median ratio against the baseline; slower by more than tolerance and noise_ms is a regression."""
+    previous = {(entry["scale"], entry["case"]): entry for entry in baseline["results"] if "median_ms" in entry}
+    rows = []
+    for entry in results:
+        before = previous.get((entry["scale"], entry["case"]))
+        if before is None or "median_ms" not in entry:
+            continue
+        ratio = entry["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        delta = entry["median_ms"] - before["median_ms"]
+        if ratio > 1 + tolerance and delta > noise_ms:
+            verdict = "regression"
+        elif ratio < 1 - tolerance and -delta > noise_ms:
+            verdict = "improvement"
+        else:
+            verdict = "same"
+        rows.append({"scale": entry["scale"], "case": entry["case"], "baseline_ms": before["median_ms"],
+                     "median_ms": entry["median_ms"], "ratio": round(ratio, 3), "verdict": verdict})
+    return rows
+
+
+@click.command()
+@click.option("--scale", "scales", multiple=True, type=click.Choice(sorted(SCALES)), default=["tiny", "small"],
+              show_default=True, help="Repository scales to run; repeatable")
+@click.option("--case", "patterns", multiple=True, help="Only cases matching this glob (e.g. 'diff-*'); repeatable")
+@click.option("--repeat", default=5, show_default=True, help="Timed runs per case")
+@click.option("--warmup", default=1, show_default=True, help="Untimed runs per case before timing")
+@click.option("--workdir", default=os.path.join(tempfile.gettempdir(), "git-barber-bench"), show_default=True,
+              help="Where the synthetic repositories are generated and reused")
+@click.option("--rebuild", is_flag=True, help="Regenerate the repositories even if they exist")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the results as JSON here")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Compare against earlier results")
+@click.option("--tolerance", default=0.10, show_default=True, help="Relative median change treated as noise")
+@click.option("--noise-ms", default=1.0, show_default=True, help="Absolute median change treated as noise")
+@click.option("--fail-on-regression", is_flag=True, help="Exit with status 1 if the baseline comparison regresses")
+def main(scales, patterns, repeat, warmup, workdir, rebuild, output, baseline, tolerance, noise_ms,
+         fail_on_regression):
+    cases = [case for case in CASES if not patterns or any(fnmatch.fnmatch(case.name, p) for p in patterns)]
+    if not cases:
+        raise click.UsageError("No case matches --case")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    client = TestClient(app)
+    try:
+        for scale in scales:
+            started = time.perf_counter()
+            repo = build_repo(SCALES[scale], workdir, rebuild)
+            click.echo(f"# {scale}: {repo.path} ready in {time.perf_counter() - started:.1f}s", err=True)
+            ctx = BenchContext(repo, client)
+            for case in cases:
+                entry = {"scale": scale, "case": case.name, "group": case.group, "cold": case.cold}
+                try:
+                    entry.update(run_case(case, ctx, repeat, warmup))
+                    summary = f"median {entry['median_ms']:.1f} ms  p95 {entry['p95_ms']:.1f} ms"
+                except SkipCase as e:
+                    entry["skipped"] = str(e)
+                    summary = f"skipped: {e}"
+                except Exception as e:
+                    entry["error"] = str(e)
+                    summary = f"error: {e}"
+                click.echo(f"{scale:>9}  {case.name:<28} {summary}", err=True)
+                results.append(entry)
+    finally:
+        repo_watches.clear()
+        repo_pool.clear()
+
+    report = {"version": RESULTS_VERSION, "environment": environment(),
+              "settings": {"repeat": repeat, "warmup": warmup}, "results": results}
+    if baseline:
+        with open(baseline, encoding="utf-8") as baseline_file:
+            report["comparison"] = compare(results, json.load(baseline_file), tolerance, noise_ms)
+        for row in report["comparison"]:
+            click.echo(f"{row['scale']:>9}  {row['case']:<28} {row['baseline_ms']:>10.1f} -> {row['median_ms']:>10.1f} ms"
+                       f"  x{row['ratio']:<6} {row['verdict']}", err=True)
+    if output:
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    failed = any(entry.get("error") for entry in results)
+    regressed = fail_on_regression and any(row["verdict"] == "regression" for row in report.get("comparison", []))
+    sys.exit(1 if failed or regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+from dataclasses import asdict, dataclass
+
+# Bump when the generated layout changes, so cached repositories are rebuilt
+LAYOUT_VERSION = 1
+EPOCH = 1_700_000_000
+
+
+@dataclass(frozen=True)
+class RepoSpec:
+    """Shape of a synthetic repository: `main`, a `big` branch on top of it, and `branches` feature branches."""
+
+    name: str
+    # Paths changed between main and big
+    files_changed: int
+    # Feature branches besides main, big and the stack
+    branches: int
+    # Lines per generated source file, and how many of them big rewrites in a modified file
+    lines_per_file: int = 40
+    lines_changed: int = 8
+    # Fractions of files_changed that are renames (with a small edit) and binary files
+    rename_ratio: float = 0.05
+    binary_ratio: float = 0.01
+    # Branches stacked on top of main for /stack-diff-summary and /stack-sync
+    stack_depth: int = 4
+    seed: int = 1
+
+    @property
+    def key(self):
+        return f"{self.name}-v{LAYOUT_VERSION}"
+
+
+SCALES = {
+    "tiny": RepoSpec("tiny", files_changed=10, branches=10),
+    "small": RepoSpec("small", files_changed=200, branches=100),
+    "medium": RepoSpec("medium", files_changed=2_000, branches=1_000),
+    "large": RepoSpec("large", files_changed=10_000, branches=5_000),
+    "huge": RepoSpec("huge", files_changed=50_000, branches=10_000, lines_per_file=20, lines_changed=4),
+    # Few files, each with a very long diff
+    "wide-diff": RepoSpec("wide-diff", files_changed=50, branches=10, lines_per_file=20_000, lines_changed=5_000),
+}
+
+
+@dataclass
+class SyntheticRepo:
+    path: str
+    remote: str
+    spec: RepoSpec
+    # Paths in the big branch's diff, as (path, status letter) with --no-renames
+    changes: list
+    stack: list
+
+
+def _source(rng, path, lines, salt=""):
+    words = ("alpha", "beta", "gamma", "delta", "value", "result", "items", "config")
+    body = [f"# {path}{salt}"]
+    for number in range(1, lines):
+        body.append(f"{rng.choice(words)}_{number} = {rng.randrange(1_000_000)}  # {salt}")
+    return "\n".join(body) + "\n"
+
+
+def _path(position):
+    # 50 files per directory, 20 directories per package
+    return f"src/pkg{position // 1000}/mod{position // 50 % 20}/file{position}.py"
+
+
+class _FastImport:
+    """Writes a `git fast-import` stream; marks are handed out in order."""
+
+    def __init__(self, repo_path):
+        self.process = subprocess.Popen(
+            ["git", "fast-import", "--quiet", "--done"], cwd=repo_path, stdin=subprocess.PIPE,
+        )
+        self.stdin = self.process.stdin
+        self.next_mark = 1
+        self.time = EPOCH
+
+    def blob(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        mark = self.next_mark
+        self.next_mark += 1
+        self.stdin.write(b"blob\nmark :%d\ndata %d\n" % (mark, len(data)))
+        self.stdin.write(data)
+        self.stdin.write(b"\n")
+        return mark
+
+    def commit(self, ref, message, parent=None, changes=(), deletes=()):
+        """`changes` are (path, blob mark); `parent` is a mark or a ref. Returns the commit's mark."""
+        mark = self.next_mark
+        self.next_mark += 1
+        # One minute apart, so branches sort deterministically by committer date
+        self.time += 60
+        message = message.encode("utf-8")
+        self.stdin.write(b"commit %s\nmark :%d\n" % (ref.encode("utf-8"), mark))
+        self.stdin.write(b"committer Bench <bench@example.com> %d +0000\n" % self.time)
+        self.stdin.write(b"data %d\n%s\n" % (len(message), message))
+        if parent is not None:
+            self.stdin.write(b"from %s\n" % (b":%d" % parent if isinstance(parent, int) else parent.encode("utf-8")))
+        for path in deletes:
+            self.stdin.write(b"D %s\n" % path.encode("utf-8"))
+        for path, blob in changes:
+            self.stdin.write(b"M 100644 :%d %s\n" % (blob, path.encode("utf-8")))
+        self.stdin.write(b"\n")
+        return mark
+
+    def reset(self, ref, mark):
+        self.stdin.write(b"reset %s\nfrom :%d\n\n" % (ref.encode("utf-8"), mark))
+
+    def close(self):
+        self.stdin.write(b"done\n")
+        self.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("git fast-import failed")
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def build_repo(spec: RepoSpec, root: str, rebuild: bool = False) -> SyntheticRepo:
+    """
+    Create (or reuse) the repository for `spec` under `root`, with a bare
+    `origin` next to it that already has main and big. Generation is seeded,
+    so the same spec always produces the same commits.
+    """
+    path = os.path.join(root, spec.key, "repo")
+    remote = os.path.join(root, spec.key, "origin.git")
+    manifest_path = os.path.join(root, spec.key, "manifest.json")
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        return SyntheticRepo(path, remote, spec, [tuple(change) for change in manifest["changes"]], manifest["stack"])
+
+    shutil.rmtree(os.path.join(root, spec.key), ignore_errors=True)
+    os.makedirs(path)
+    _git(path, "init", "-q", "-b", "main")
+    _git(path, "config", "user.name", "Bench")
+    _git(path, "config", "user.email", "bench@example.com")
+    rng = random.Random(spec.seed)
+
+    renamed = int(spec.files_changed * spec.rename_ratio)
+    binary = max(1, int(spec.files_changed * spec.binary_ratio)) if spec.binary_ratio else 0
+    deleted = int(spec.files_changed * 0.05)
+    added = int(spec.files_changed * 0.2)
+    modified = max(0, spec.files_changed - renamed - binary - deleted - added)
+    # Unchanged files give the trees realistic width
+    untouched = spec.files_changed // 2
+
+    stream = _FastImport(path)
+    base_files = {}
+    positions = iter(range(10 ** 9))
+    for group, count in (("modified", modified), ("renamed", renamed), ("deleted", deleted), ("untouched", untouched)):
+        base_files[group] = [_path(next(positions)) for _ in range(count)]
+    base_files["binary"] = [f"assets/image{number}.bin" for number in range(binary)]
+    base_content = {}
+    changes = []
+    for group, paths in base_files.items():
+        for file_path in paths:
+            if group == "binary":
+                content = bytes(rng.randrange(256) for _ in range(2048))
+            else:
+                content = _source(rng, file_path, spec.lines_per_file)
+            base_content[file_path] = content
+            changes.append((file_path, stream.blob(content)))
+    main = stream.commit("refs/heads/main", "Initial commit", changes=changes)
+
+    big_changes, big_deletes, diff = [], [], []
+    for file_path in base_files["modified"]:
+        lines = base_content[file_path].splitlines(keepends=True)
+        for number in rng.sample(range(1, len(lines)), min(spec.lines_changed, len(lines) - 1)):
+            lines[number] = f"changed_{number} = {rng.randrange(1_000_000)}\n"
+        big_changes.append((file_path, stream.blob("".join(lines))))
+        diff.append((file_path, "M"))
+    for file_path in base_files["renamed"]:
+        new_path = file_path.replace("/file", "/moved_file")
+        big_changes.append((new_path, stream.blob(base_content[file_path] + "# moved\n")))
+        big_deletes.append(file_path)
+        diff.extend([(file_path, "D"), (new_path, "A")])
+    for file_path in base_files["deleted"]:
+        big_deletes.append(file_path)
+        diff.append((file_path, "D"))
+    for file_path in base_files["binary"]:
+        big_changes.append((file_path, stream.blob(bytes(rng.randrange(256) for _ in range(2048)))))
+        diff.append((file_path, "M"))
+    for _ in range(added):
+        file_path = _path(next(positions))
+        big_changes.append((file_path, stream.blob(_source(rng, file_path, spec.lines_per_file, salt=" new"))))
+        diff.append((file_path, "A"))
+    # Two commits, so the planner has some co-change history to work with
+    middle = len(big_changes) // 2
+    big = stream.commit("refs/heads/big", "Big change, part 1", parent=main, changes=big_changes[:middle])
+    big = stream.commit("refs/heads/big", "Big change, part 2", parent=big, changes=big_changes[middle:],
+                        deletes=big_deletes)
+
+    parent = main
+    stack = []
+    for level in range(1, spec.stack_depth + 1):
+        name = f"stack-{level}"
+        file_path = f"stack/level{level}.py"
+        parent = stream.commit(f"refs/heads/{name}", f"Stack level {level}", parent=parent,
+                               changes=[(file_path, stream.blob(_source(rng, file_path, spec.lines_per_file)))])
+        stack.append(name)
+    # Move main on after the stack was cut, so syncing the stack has something to merge
+    stream.commit("refs/heads/main", "Main moves on", parent=main,
+                  changes=[("main-only.txt", stream.blob("main moved on\n"))])
+
+    for number in range(spec.branches):
+        file_path = f"features/feature{number}.py"
+        stream.commit(f"refs/heads/feat/b{number}", f"Feature {number}", parent=main,
+                      changes=[(file_path, stream.blob(_source(rng, file_path, 10)))])
+    stream.close()
+    _git(path, "checkout", "-q", "main")
+
+    _git(root, "init", "-q", "--bare", remote)
+    _git(path, "remote", "add", "origin", remote)
+    _git(path, "push", "-q", "origin", "main", "big")
+
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump({"spec": asdict(spec), "changes": sorted(diff), "stack": stack}, manifest_file)
+    return SyntheticRepo(path, remote, spec, sorted(diff), stack)
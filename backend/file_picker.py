@@ -0,0 +1,329 @@
+import fnmatch
+import re
+
+# Below this many files every directory starts expanded; above it only the top level is shown
+EXPAND_ALL_LIMIT = 300
+GLOB_CHARS = "*?["
+
+
+class _Dir:
+    __slots__ = ("name", "parent", "depth", "dirs", "files", "start", "end", "selected", "expanded")
+
+    def __init__(self, name, parent, depth, start):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.dirs = []
+        # Indexes of the files directly in this directory
+        self.files = []
+        # Every file under this directory is in [start, end) of the sorted paths
+        self.start = start
+        self.end = start
+        self.selected = 0
+        self.expanded = False
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+
+def _sort_key(path):
+    # Directories before the files next to them, so each directory's files are one contiguous range
+    parts = path.split("/")
+    return [(0, part) for part in parts[:-1]] + [(1, parts[-1])]
+
+
+class FileTree:
+    """
+    The changed files as a collapsible directory trie, for picking thousands
+    of files at once.
+
+    Files are sorted so every directory covers a contiguous range of them, and
+    each directory keeps a count of its selected files. Toggling a subtree is a
+    slice assignment plus a walk over its directories and ancestors, and
+    filtering runs over a lowercase path index built once, so neither depends
+    on how many rows are on screen. `rows()` is only rebuilt when the shape of
+    the visible tree changes (expanding, collapsing, filtering).
+    """
+
+    def __init__(self, entries):
+        order = sorted(range(len(entries)), key=lambda position: _sort_key(entries[position][0]))
+        self.order = order
+        self.paths = [entries[position][0] for position in order]
+        self.markers = [entries[position][1] for position in order]
+        self.names = [path.rsplit("/", 1)[-1] for path in self.paths]
+        self.index = [path.lower() for path in self.paths]
+        self.selected = bytearray(len(self.paths))
+        self.file_dirs = []
+        self.root = _Dir("", None, -1, 0)
+        self.root.expanded = True
+
+        stack = [self.root]
+        for position, path in enumerate(self.paths):
+            parts = path.split("/")[:-1]
+            # Close the directories this path is no longer under
+            common = 0
+            while common < len(parts) and common + 1 < len(stack) and stack[common + 1].name == parts[common]:
+                common += 1
+            for closed in stack[common + 1:]:
+                closed.end = position
+            del stack[common + 1:]
+            for depth in range(common, len(parts)):
+                directory = _Dir(parts[depth], stack[-1], depth, position)
+                directory.expanded = len(self.paths) <= EXPAND_ALL_LIMIT
+                stack[-1].dirs.append(directory)
+                stack.append(directory)
+            stack[-1].files.append(position)
+            self.file_dirs.append(stack[-1])
+        for directory in stack:
+            directory.end = len(self.paths)
+
+        self.matches = None
+        self._match_counts = None
+        self._last_query = ""
+        self._last_matched = None
+
+    @property
+    def selected_count(self):
+        return self.root.selected
+
+    def selected_paths(self):
+        """The selected files, in the order they were given."""
+        picked = sorted((self.order[position], self.paths[position])
+                        for position in range(len(self.paths)) if self.selected[position])
+        return [path for _, path in picked]
+
+    # Selection
+
+    def toggle_file(self, position):
+        delta = -1 if self.selected[position] else 1
+        self.selected[position] = 1 if delta > 0 else 0
+        directory = self.file_dirs[position]
+        while directory is not None:
+            directory.selected += delta
+            directory = directory.parent
+
+    def toggle_dir(self, directory):
+        """Select every (matching) file under `directory`, or deselect them all if they already are."""
+        if self.matches is not None:
+            positions = [position for position in range(directory.start, directory.end) if self.matches[position]]
+            value = 0 if all(self.selected[position] for position in positions) else 1
+            for position in positions:
+                if self.selected[position] != value:
+                    self.toggle_file(position)
+            return
+        value = 0 if directory.selected == directory.size else 1
+        delta = value * directory.size - directory.selected
+        self.selected[directory.start:directory.end] = bytes([value]) * directory.size
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            current.selected = value * current.size
+            pending.extend(current.dirs)
+        ancestor = directory.parent
+        while ancestor is not None:
+            ancestor.selected += delta
+            ancestor = ancestor.parent
+
+    def toggle_all(self):
+        self.toggle_dir(self.root)
+
+    def set_expanded(self, directory, expanded, recursive=False):
+        directory.expanded = expanded
+        if recursive:
+            pending = list(directory.dirs)
+            while pending:
+                current = pending.pop()
+                current.expanded = expanded
+                pending.extend(current.dirs)
+
+    # Filtering
+
+    def filter(self, query):
+        """
+        Show only the files matching `query`: a glob over the whole path when it
+        has any of `*?[`, otherwise a case-insensitive fuzzy (subsequence) match.
+        Typing more of a fuzzy query only searches what the shorter one matched.
+        """
+        query = query.strip().lower()
+        if not query:
+            self.matches = None
+            self._match_counts = None
+            self._last_query, self._last_matched = "", None
+            return
+        if any(char in query for char in GLOB_CHARS):
+            pattern = re.compile(fnmatch.translate(query))
+            matched = [position for position in range(len(self.paths)) if pattern.match(self.index[position])]
+        else:
+            pattern = re.compile(".*?".join(re.escape(char) for char in query))
+            narrowing = (self._last_matched is not None and query.startswith(self._last_query)
+                         and not any(char in self._last_query for char in GLOB_CHARS))
+            candidates = self._last_matched if narrowing else range(len(self.paths))
+            matched = [position for position in candidates if pattern.search(self.index[position])]
+        self._last_query, self._last_matched = query, matched
+
+        self.matches = bytearray(len(self.paths))
+        counts = {}
+        for position in matched:
+            self.matches[position] = 1
+            directory = self.file_dirs[position]
+            while directory is not None:
+                counts[id(directory)] = counts.get(id(directory), 0) + 1
+                directory = directory.parent
+        self._match_counts = counts
+
+    @property
+    def match_count(self):
+        return self._match_counts.get(id(self.root), 0) if self._match_counts is not None else len(self.paths)
+
+    def _visible_dir(self, directory):
+        return self._match_counts is None or id(directory) in self._match_counts
+
+    # Rows
+
+    def rows(self):
+        """
+        The visible rows as (label, node, depth, parent row): `node` is a
+        directory or a file index. Directory chains with a single child and no
+        files of their own are folded into one row ("src/pkg/mod"). Under a
+        filter every directory with a match is shown expanded.
+        """
+        rows = []
+        filtering = self.matches is not None
+
+        def walk(directory, depth, parent_row):
+            for child in directory.dirs:
+                if not self._visible_dir(child):
+                    continue
+                label = child.name
+                while not child.files and len(child.dirs) == 1:
+                    child = child.dirs[0]
+                    label += "/" + child.name
+                rows.append((label, child, depth, parent_row))
+                if filtering or child.expanded:
+                    walk(child, depth + 1, len(rows) - 1)
+            for position in directory.files:
+                if not filtering or self.matches[position]:
+                    rows.append((self.names[position], position, depth, parent_row))
+
+        walk(self.root, 0, None)
+        return rows
+
+    def check_mark(self, node):
+        if isinstance(node, _Dir):
+            if node.selected == 0:
+                return "[ ]"
+            return "[x]" if node.selected == node.size else "[-]"
+        return "[x]" if self.selected[node] else "[ ]"
+
+
+def _render(term, tree, rows, message, cursor, top, query, typing):
+    height, width = term.height, term.width
+    body = max(1, height - 3)
+    status = f"{tree.selected_count}/{len(tree.paths)} selected"
+    if tree.matches is not None:
+        status += f", {tree.match_count} match"
+    filter_line = f"Filter: {query}{'_' if typing else ''}" if typing or query else "Press / to filter"
+    output = [term.home, term.bold(term.truncate(message, width)), term.clear_eol, "\r\n",
+              term.truncate(f"{filter_line}   ({status})", width), term.clear_eol, "\r\n"]
+    # Only the rows inside the viewport are formatted and written
+    for row in range(top, top + body):
+        if row < len(rows):
+            label, node, depth, _ = rows[row]
+            if isinstance(node, _Dir):
+                arrow = "▾" if node.expanded or tree.matches is not None else "▸"
+                text = f"{'  ' * depth}{arrow} {tree.check_mark(node)} {label}/  ({node.selected}/{node.size})"
+            else:
+                text = f"{'  ' * depth}  {tree.check_mark(node)} {label} {tree.markers[node]}"
+            text = term.truncate(text, width)
+            output.append(term.reverse(text) if row == cursor else text)
+        output.extend([term.clear_eol, "\r\n"])
+    output.append(term.truncate(
+        "↑↓ move  SPACE toggle  →← expand/collapse  * expand all  a toggle all  / filter  ESC clear  ENTER done",
+        width))
+    output.append(term.clear_eos)
+    print("".join(output), end="", flush=True)
+    return body
+
+
+def pick_files(entries, message):
+    """
+    Let the user pick files out of `entries` ((path, marker) pairs) in a
+    full-screen tree view; returns the selected paths in their original order.
+    """
+    # blessed is only needed once the picker is actually shown
+    import blessed
+    import click
+
+    term = blessed.Terminal()
+    if not term.is_a_tty:
+        raise click.ClickException("Picking files needs an interactive terminal")
+    tree = FileTree(entries)
+    rows = tree.rows()
+    cursor, top = 0, 0
+    query, typing = "", False
+    with term.fullscreen(), term.cbreak(), term.hidden_cursor():
+        while True:
+            cursor = max(0, min(cursor, len(rows) - 1))
+            body = max(1, term.height - 3)
+            top = min(max(top, cursor - body + 1), cursor)
+            _render(term, tree, rows, message, cursor, top, query, typing)
+            key = term.inkey()
+            node = rows[cursor][1] if rows else None
+
+            if typing:
+                if key.code in (term.KEY_ENTER, term.KEY_DOWN):
+                    typing = False
+                elif key.code == term.KEY_ESCAPE:
+                    typing, query = False, ""
+                elif key.code in (term.KEY_BACKSPACE, term.KEY_DELETE):
+                    query = query[:-1]
+                elif key and not key.is_sequence and key.isprintable():
+                    query += str(key)
+                else:
+                    continue
+                tree.filter(query)
+                rows, cursor, top = tree.rows(), 0, 0
+                continue
+
+            if key.code == term.KEY_ENTER:
+                return tree.selected_paths()
+            if key == "\x03":
+                raise KeyboardInterrupt
+            if key.code == term.KEY_UP or key == "k":
+                cursor -= 1
+            elif key.code == term.KEY_DOWN or key == "j":
+                cursor += 1
+            elif key.code == term.KEY_PGUP:
+                cursor -= body
+            elif key.code == term.KEY_PGDOWN:
+                cursor += body
+            elif key.code == term.KEY_HOME:
+                cursor = 0
+            elif key.code == term.KEY_END:
+                cursor = len(rows) - 1
+            elif key == " " and node is not None:
+                if isinstance(node, _Dir):
+                    tree.toggle_dir(node)
+                else:
+                    tree.toggle_file(node)
+            elif key == "a":
+                tree.toggle_all()
+            elif key == "/":
+                typing = True
+            elif key.code == term.KEY_ESCAPE and query:
+                query = ""
+                tree.filter(query)
+                rows, cursor, top = tree.rows(), 0, 0
+            elif (key.code == term.KEY_RIGHT or key == "l") and isinstance(node, _Dir):
+                tree.set_expanded(node, True)
+                rows = tree.rows()
+            elif key == "*" and isinstance(node, _Dir):
+                tree.set_expanded(node, True, recursive=True)
+                rows = tree.rows()
+            elif key.code == term.KEY_LEFT or key == "h":
+                if isinstance(node, _Dir) and node.expanded and tree.matches is None:
+                    tree.set_expanded(node, False)
+                    rows = tree.rows()
+                elif rows and rows[cursor][3] is not None:
+                    cursor = rows[cursor][3]
@@ -11,6 +11,20 @@ from routes.commit import router as commit_router
 from routes.push import router as push_router
 from routes.is_git_repo import router as is_git_repo_router
 from routes.current_branch import router as current_branch_router
+from routes.stats import router as stats_router
+from routes.diff_store import router as diff_store_router
+from routes.jobs import router as jobs_router
+from routes.split import router as split_router
+from routes.stack import router as stack_router
+from routes.watch import router as watch_router
+from routes.metrics import router as metrics_router
+from routes.repos import router as repos_router
+import split_engine
+from utils.diff_store import diff_store
+from utils.metrics import MetricsMiddleware, metrics
+from utils.repo_pool import repo_pool
+from utils.repo_scan import repo_scanner
+from utils.repo_watch import repo_watches
 
 app = FastAPI()
 
@@ -20,7 +34,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Git-Barber-Profile"],
 )
+app.add_middleware(MetricsMiddleware)
+split_engine.git_call_listeners.append(metrics.observe_git)
 
 # Include route routers
 app.include_router(branches_router)
@@ -32,3 +49,22 @@ app.include_router(commit_router)
 app.include_router(push_router)
 app.include_router(is_git_repo_router)
 app.include_router(current_branch_router)
+app.include_router(stats_router)
+app.include_router(diff_store_router)
+app.include_router(jobs_router)
+app.include_router(split_router)
+app.include_router(stack_router)
+app.include_router(watch_router)
+app.include_router(metrics_router)
+app.include_router(repos_router)
+
+
+@app.on_event("shutdown")
+def close_git_resources():
+    # Reap the persistent git cat-file helpers kept alive by the pool
+    repo_pool.clear()
+    repo_watches.clear()
+    repo_scanner.clear()
+    if diff_store:
+        diff_store.close()
+
@@ -1,26 +1,121 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Optional
+import hashlib
 import os
+import threading
+import time
+
+from utils.repo_locks import RepoLockManager, get_repo_locks
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
+from utils.repo_watch import RepoWatchManager, get_repo_watches
 
 router = APIRouter()
 
+# How long a computed branch list may be served without re-checking the refs
+BRANCH_CACHE_TTL = 2.0
+BRANCH_CACHE_MAX_ENTRIES = 256
+
+_branch_cache = {}
+_branch_cache_lock = threading.Lock()
+
+
+def refs_fingerprint(common_dir):
+    """
+    Cheap change detector for local branches: packed-refs plus every directory
+    under refs/heads. Git updates loose refs by renaming a lock file into place,
+    which bumps the mtime of the directory holding the ref.
+    """
+    stamps = []
+    packed_refs = os.path.join(common_dir, "packed-refs")
+    if os.path.exists(packed_refs):
+        stamps.append(os.stat(packed_refs).st_mtime_ns)
+    for directory, _, _ in os.walk(os.path.join(common_dir, "refs", "heads")):
+        stamps.append(os.stat(directory).st_mtime_ns)
+    return hashlib.sha1(repr(stamps).encode("ascii")).hexdigest()
+
+
+def snapshot_branches(snapshot, limit, offset, prefix):
+    """A page of the watcher's branch list, which is already sorted newest first."""
+    ordered = snapshot["ordered"]
+    if prefix:
+        ordered = [branch for branch in ordered if branch["name"].startswith(prefix)]
+    return [{"name": branch["name"], "last_commit_time": branch["last_commit_time"]}
+            for branch in ordered[offset:offset + limit]]
+
+
+def list_branches(repo, limit, offset, prefix, ahead_behind):
+    pattern = "refs/heads/"
+    # for-each-ref matches whole path components, so only push down prefixes ending in /
+    if prefix and prefix.endswith("/"):
+        pattern += prefix
+    batched_ahead_behind = ahead_behind and repo.git.version_info >= (2, 41)
+    fields = ["%(refname:lstrip=2)", "%(committerdate:iso-strict)"]
+    if batched_ahead_behind:
+        fields.append(f"%(ahead-behind:{ahead_behind})")
+    args = ["--sort=-committerdate", f"--format={'%00'.join(fields)}"]
+    if not prefix or prefix.endswith("/"):
+        args.append(f"--count={offset + limit}")
+
+    branches = []
+    for line in repo.git.for_each_ref(*args, pattern).splitlines():
+        name, commit_time, *counts = line.split("\0")
+        if prefix and not name.startswith(prefix):
+            continue
+        branch = {"name": name, "last_commit_time": commit_time}
+        if counts:
+            branch["ahead"], branch["behind"] = (int(count) for count in counts[0].split())
+        branches.append(branch)
+    branches = branches[offset:offset + limit]
+
+    if ahead_behind and not batched_ahead_behind:
+        # Older git has no %(ahead-behind); count just the page we return
+        for branch in branches:
+            behind, ahead = repo.git.rev_list("--left-right", "--count", f"{ahead_behind}...{branch['name']}").split()
+            branch["ahead"], branch["behind"] = int(ahead), int(behind)
+    return branches
+
+
 @router.get("/branches")
-def get_branches(repo_path: str):
-    repo_path = os.path.expanduser(repo_path)
+def get_branches(request: Request, response: Response, repo_path: str,
+                 limit: int = Query(100, ge=1), offset: int = Query(0, ge=0),
+                 prefix: Optional[str] = None, ahead_behind: Optional[str] = None,
+                 pool: RepoPool = Depends(get_repo_pool), locks: RepoLockManager = Depends(get_repo_locks),
+                 watches: RepoWatchManager = Depends(get_repo_watches)):
+    repo_path = resolve_repo_path(repo_path)
     if not os.path.exists(repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if not ahead_behind:
+        # Served from the watched snapshot; ahead/behind counts still need git
+        try:
+            body = {"branches": snapshot_branches(watches.get(repo_path).current_snapshot(), limit, offset, prefix)}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        etag = '"' + hashlib.sha1(repr(body).encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return body
     try:
-        repo = Repo(repo_path)
-        branches = []
-        for branch in repo.heads:
-            # Get the last commit datetime in ISO format
-            commit_time = branch.commit.committed_datetime
-            branches.append({"name": branch.name, "last_commit_time": commit_time.isoformat()})
-
-        # Sort branches by last_commit_time descendingly
-        branches = sorted(branches, key=lambda x: x["last_commit_time"], reverse=True)
-        branches = branches[:100]
-        return {"branches": branches}
+        with locks.read(repo_path), pool.lease(repo_path) as repo:
+            # The comparison base may live outside refs/heads (e.g. origin/main)
+            fingerprint = refs_fingerprint(repo.common_dir) + repo.git.rev_parse(ahead_behind)
+            query = repr((repo_path, limit, offset, prefix, ahead_behind, fingerprint))
+            etag = '"' + hashlib.sha1(query.encode("utf-8")).hexdigest() + '"'
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+
+            now = time.monotonic()
+            with _branch_cache_lock:
+                cached = _branch_cache.get(etag)
+            if cached and cached[0] > now:
+                body = cached[1]
+            else:
+                body = {"branches": list_branches(repo, limit, offset, prefix, ahead_behind)}
+                with _branch_cache_lock:
+                    if len(_branch_cache) >= BRANCH_CACHE_MAX_ENTRIES:
+                        _branch_cache.clear()
+                    _branch_cache[etag] = (now + BRANCH_CACHE_TTL, body)
+        response.headers["ETag"] = etag
+        return body
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
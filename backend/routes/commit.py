@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 import os
 
+from utils.repo_locks import JobQueue, get_job_queue
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
+
 router = APIRouter()
 
 class CommitModel(BaseModel):
@@ -11,13 +13,18 @@ class CommitModel(BaseModel):
 
 @router.post("/commit")
 
-def commit_changes(data: CommitModel):
-    data.repo_path = os.path.expanduser(data.repo_path)
+def commit_changes(data: CommitModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+                   jobs: JobQueue = Depends(get_job_queue)):
+    data.repo_path = resolve_repo_path(data.repo_path)
     if not os.path.exists(data.repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+
+    def run():
+        with pool.lease(data.repo_path) as repo:
+            commit = repo.index.commit(data.message)
+            return {"message": f"Committed changes with message: {data.message}", "commit": str(commit)}
+
     try:
-        repo = Repo(data.repo_path)
-        commit = repo.index.commit(data.message)
-        return {"message": f"Committed changes with message: {data.message}", "commit": str(commit)}
+        return jobs.run(data.repo_path, "commit", run, background)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
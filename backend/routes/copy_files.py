@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
 import os
+import tempfile
+import time
+
+from utils.diff_parser import FILE_STATUSES
+from utils.repo_locks import JobQueue, get_job_queue
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
 
 router = APIRouter()
 
@@ -12,21 +17,75 @@ class CopyFilesModel(BaseModel):
     destination_branch: str
     files: List[str]
 
+
+def read_tree_changes(repo, from_ref, to_ref):
+    """Map each path changed between two trees to its status letter and, for renames, the old path."""
+    tokens = repo.git.diff_tree("-r", "-z", "-M", from_ref, to_ref).split("\0")
+    changes = {}
+    position = 0
+    while position < len(tokens) and tokens[position].startswith(":"):
+        status = tokens[position].split()[-1][0]
+        if status in "RC":
+            old_path, path = tokens[position + 1], tokens[position + 2]
+            changes[path] = (status, old_path)
+            if status == "R":
+                changes[old_path] = ("D", None)
+            position += 3
+        else:
+            changes[tokens[position + 1]] = (status, None)
+            position += 2
+    return changes
+
+
 @router.post("/copy-files")
 
-def copy_files(data: CopyFilesModel):
-    data.repo_path = os.path.expanduser(data.repo_path)
+def copy_files(data: CopyFilesModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+               jobs: JobQueue = Depends(get_job_queue)):
+    data.repo_path = resolve_repo_path(data.repo_path)
     if not os.path.exists(data.repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+
+    def run():
+        started = time.perf_counter()
+        with pool.lease(data.repo_path) as repo:
+            # Checkout destination branch first
+            repo.git.checkout(data.destination_branch)
+            changes = read_tree_changes(repo, "HEAD", data.source_branch)
+
+            outcomes = []
+            pathspecs = []
+            for file in data.files:
+                status, old_path = changes.get(file, (None, None))
+                if status is None:
+                    # Identical on both branches, or unknown to either
+                    exists = os.path.lexists(os.path.join(repo.working_dir, file))
+                    outcomes.append({"file": file, "status": "unchanged" if exists else "missing"})
+                    continue
+                outcome = {"file": file, "status": FILE_STATUSES.get(status, "modified")}
+                pathspecs.append(file)
+                if status == "R" and old_path not in data.files:
+                    # Bring the rename over whole so the old path doesn't linger
+                    outcome["old_file"] = old_path
+                    pathspecs.append(old_path)
+                outcomes.append(outcome)
+
+            if pathspecs:
+                # One restore for every path, staging blobs straight from the source tree;
+                # paths missing from the source (deletions) are removed from index and worktree
+                with tempfile.TemporaryFile() as pathspec_file:
+                    pathspec_file.write("\0".join(pathspecs).encode("utf-8"))
+                    pathspec_file.seek(0)
+                    repo.git(literal_pathspecs=True).restore(
+                        f"--source={data.source_branch}", "--staged", "--worktree",
+                        "--pathspec-from-file=-", "--pathspec-file-nul", istream=pathspec_file
+                    )
+        return {
+            "message": f"Copied and staged files from {data.source_branch} to {data.destination_branch}",
+            "files": outcomes,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
     try:
-        repo = Repo(data.repo_path)
-        # Checkout destination branch first
-        repo.git.checkout(data.destination_branch)
-        # For each file, copy it from the source branch
-        for file in data.files:
-            repo.git.checkout(data.source_branch, '--', file)
-        # Stage the files
-        repo.index.add(data.files)
-        return {"message": f"Copied and staged files from {data.source_branch} to {data.destination_branch}"}
+        return jobs.run(data.repo_path, "copy-files", run, background)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 import os
 
+from utils.repo_locks import JobQueue, get_job_queue
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
+
 router = APIRouter()
 
 class CreateBranchModel(BaseModel):
@@ -11,13 +13,18 @@ class CreateBranchModel(BaseModel):
 
 @router.post("/create-branch")
 
-def create_branch(data: CreateBranchModel):
-    data.repo_path = os.path.expanduser(data.repo_path)
+def create_branch(data: CreateBranchModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+                  jobs: JobQueue = Depends(get_job_queue)):
+    data.repo_path = resolve_repo_path(data.repo_path)
     if not os.path.exists(data.repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+
+    def run():
+        with pool.lease(data.repo_path) as repo:
+            repo.git.checkout('-b', data.new_branch)
+            return {"message": f"Created and checked out new branch {data.new_branch}"}
+
     try:
-        repo = Repo(data.repo_path)
-        repo.git.checkout('-b', data.new_branch)
-        return {"message": f"Created and checked out new branch {data.new_branch}"}
+        return jobs.run(data.repo_path, "create-branch", run, background)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
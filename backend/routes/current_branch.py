@@ -1,18 +1,24 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 import os
 
+from utils.repo_pool import resolve_repo_path
+from utils.repo_watch import RepoWatchManager, get_repo_watches
+
 router = APIRouter()
 
 @router.get("/current-branch")
 
-def get_current_branch(repo_path: str):
-    repo_path = os.path.expanduser(repo_path)
+async def get_current_branch(repo_path: str, watches: RepoWatchManager = Depends(get_repo_watches)):
+    repo_path = resolve_repo_path(repo_path)
     if not os.path.exists(repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
     try:
-        repo = Repo(repo_path)
-        current_branch = repo.active_branch.name
-        return {"current_branch": current_branch}
+        # Starting the watcher reads the refs once; after that this is a few stat calls and a snapshot read
+        snapshot = await run_in_threadpool(lambda: watches.get(repo_path).current_snapshot())
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    current_branch = snapshot["current_branch"]
+    if current_branch is None:
+        raise HTTPException(status_code=500, detail="HEAD is detached")
+    return {"current_branch": current_branch}
@@ -1,87 +1,449 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import base64
+import json
 import os
 
+from barber_config import ignore_pathspecs, load_team_config, rename_args, rename_limit_exceeded, rename_settings
+from utils.diff_cache import DiffCache, get_diff_cache
+from utils.diff_parser import (acollect_detailed_diff, aiter_file_diffs, format_detailed_diff, format_file_diff,
+                               parse_file_index)
+from utils.diff_store import DiffStore, get_diff_store
+from utils.git_executor import GitExecutor, error_status, get_git_executor
+from utils.repo_locks import RepoLockManager, get_repo_locks
+from utils.repo_pool import resolve_repo_path
+
 router = APIRouter()
 
+DIFF_FORMATS = ("full", "compact")
+# Default per-file caps for detailed diffs; 0 turns a cap off
+MAX_FILE_LINES = int(os.environ.get("GIT_BARBER_DIFF_MAX_FILE_LINES", "10000"))
+MAX_FILE_BYTES = int(os.environ.get("GIT_BARBER_DIFF_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+
+
+async def resolve_commits(git, repo_path, *refs, request=None):
+    # A single rev-parse turns branch names into the immutable SHAs we cache on
+    output = await git.run(repo_path, "rev-parse", *[f"{ref}^{{commit}}" for ref in refs], request=request)
+    return output.split()
+
+
+async def find_merge_base(git, repo_path, base_sha, target_sha, store):
+    merge_base = await run_in_threadpool(store.get_merge_base, repo_path, base_sha, target_sha) if store else None
+    if merge_base is None:
+        merge_base = (await git.run(repo_path, "merge-base", base_sha, target_sha)).strip()
+        if store:
+            await run_in_threadpool(store.put_merge_base, repo_path, base_sha, target_sha, merge_base)
+    return merge_base
+
+
+async def diff_range_start(git, repo_path, base_sha, target_sha, mode, store):
+    if mode == "pr":
+        return await find_merge_base(git, repo_path, base_sha, target_sha, store)
+    return base_sha
+
+
+def encode_file_cursor(start_sha, target_sha, paths, renames, caps):
+    # Opaque to clients: everything needed to re-diff just this file later, the way the index diffed it
+    raw = json.dumps({"range": [start_sha, target_sha], "paths": paths,
+                      "renames": [renames["similarity"], renames["copies"], renames["limit"]], "caps": list(caps)},
+                     separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_file_cursor(cursor):
+    """(start_sha, target_sha, paths, rename settings, (max_file_lines, max_file_bytes)) from a file cursor."""
+    try:
+        fields = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        start_sha, target_sha = fields["range"]
+        similarity, copies, limit = fields["renames"]
+        max_file_lines, max_file_bytes = fields["caps"]
+        paths = fields["paths"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid file cursor")
+    return (start_sha, target_sha, paths, {"similarity": similarity, "copies": copies, "limit": limit},
+            (max_file_lines, max_file_bytes))
+
+
+def diff_settings(repo_path, ignore, find_renames=None, find_copies=None, rename_limit=None):
+    """
+    The team's ignorePatterns, if `ignore`, with the `:(exclude)` pathspecs that
+    keep git from diffing them, and the rename detection settings (request
+    values over the team config's).
+    """
+    config = load_team_config(repo_path)
+    patterns = config["ignorePatterns"] if ignore else []
+    return patterns, ignore_pathspecs(patterns), rename_settings(config, find_renames, find_copies, rename_limit)
+
+
+def validate_renames(find_renames, find_copies, rename_limit):
+    for value in (find_renames, find_copies):
+        if value is not None and not 0 <= value <= 100:
+            raise HTTPException(status_code=400, detail="Rename and copy thresholds must be between 0 and 100")
+    if rename_limit is not None and rename_limit < 0:
+        raise HTTPException(status_code=400, detail="rename_limit cannot be negative")
+
+
+def diff_rename_args(renames):
+    return rename_args(renames["similarity"], renames["copies"], renames["limit"])
+
+
+def file_cursor_for(record, start_sha, target_sha, renames, caps=(0, 0)):
+    # Both sides of a rename or copy, so git can pair them up again; no caps by default
+    paths = [record["old_file"], record["file"]] if "old_file" in record else [record["file"]]
+    return encode_file_cursor(start_sha, target_sha, paths, renames, caps)
+
+
+class DiffPlan:
+    """
+    What the numstat pass decided for a detailed diff: the pathspecs for the
+    patch, and a placeholder for every file left out of it (binary, or more
+    changed lines than the cap), slotted back in at its place in git's order.
+
+    Placeholders have no hunks. Truncated ones (and files the parser cut at
+    the byte cap) carry a `cursor` for fetching the full hunks from /diff/hunks.
+    """
+
+    def __init__(self, index, excludes, start_sha, target_sha, max_file_lines, renames):
+        self.start_sha = start_sha
+        self.target_sha = target_sha
+        self.renames = renames
+        self.placeholders = []
+        self.kept = []
+        skipped_paths = []
+        for position, entry in enumerate(index):
+            if entry["binary"]:
+                reason = "binary"
+            elif max_file_lines and entry["lines_added"] + entry["lines_deleted"] > max_file_lines:
+                reason = "lines"
+            else:
+                self.kept.append(position)
+                continue
+            record = {"file": entry["file"], "lines_added": entry["lines_added"],
+                      "lines_deleted": entry["lines_deleted"], "changed_hunks": [], "status": entry["status"]}
+            if "old_file" in entry:
+                record["old_file"] = entry["old_file"]
+                record["new_file"] = entry["file"]
+                # The source of a copy is still there, with its own changes to diff
+                if entry["status"] == "renamed":
+                    skipped_paths.append(entry["old_file"])
+            if reason == "binary":
+                record["binary"] = True
+            else:
+                record["truncated"] = reason
+                record["cursor"] = file_cursor_for(entry, start_sha, target_sha, renames)
+            self.placeholders.append((position, record))
+            skipped_paths.append(entry["file"])
+        self.total = len(index)
+        self.pathspecs = excludes + [f":(exclude,literal){path}" for path in skipped_paths]
+        self._seen = 0
+        self._next = 0
+
+    @property
+    def needs_patch(self):
+        return bool(self.kept)
+
+    def place(self, record):
+        """The placeholders that come before `record` in git's order, then the record itself."""
+        position = self.kept[self._seen] if self._seen < len(self.kept) else self.total
+        self._seen += 1
+        placed = self._take(position)
+        if record.get("truncated") and "cursor" not in record:
+            record["cursor"] = file_cursor_for(record, self.start_sha, self.target_sha, self.renames)
+        placed.append(record)
+        return placed
+
+    def rest(self):
+        return self._take(self.total)
+
+    def _take(self, position):
+        taken = []
+        while self._next < len(self.placeholders) and self.placeholders[self._next][0] < position:
+            taken.append(self.placeholders[self._next][1])
+            self._next += 1
+        return taken
+
+    def merge(self, diff_output):
+        """Slot the placeholders into a parsed detailed diff, counting their lines in the totals."""
+        changed_files = [placed for record in diff_output["changed_files"] for placed in self.place(record)]
+        changed_files.extend(self.rest())
+        return {
+            "lines_added": sum(record["lines_added"] for record in changed_files),
+            "lines_deleted": sum(record["lines_deleted"] for record in changed_files),
+            "changed_files": changed_files
+        }
+
+    async def amerge(self, records):
+        async for record in records:
+            for placed in self.place(record):
+                yield placed
+        for placed in self.rest():
+            yield placed
+
+
+async def load_file_index(git, cache, store, repo_path, base_sha, target_sha, mode, patterns, excludes, renames,
+                          request=None):
+    """The /diff/files index (with a cursor per file), from the cache or one `git diff --raw --numstat`."""
+    cache_key = (repo_path, base_sha, target_sha, mode, "files", tuple(patterns), tuple(renames.values()))
+    index = cache.get(cache_key)
+    if index is None:
+        start_sha = await diff_range_start(git, repo_path, base_sha, target_sha, mode, store)
+        warnings = []
+        output = await git.run(repo_path, "diff", "--raw", "--numstat", "-z", *diff_rename_args(renames),
+                               f"{start_sha}..{target_sha}", "--", *excludes, request=request, warnings=warnings)
+        files = parse_file_index(output)
+        caps = (MAX_FILE_LINES, MAX_FILE_BYTES)
+        for entry in files:
+            entry["cursor"] = file_cursor_for(entry, start_sha, target_sha, renames, caps)
+        index = {
+            "lines_added": sum(entry["lines_added"] for entry in files),
+            "lines_deleted": sum(entry["lines_deleted"] for entry in files),
+            "files": files,
+            "renames": dict(renames, limit_exceeded=rename_limit_exceeded("".join(warnings)))
+        }
+        cache.put(cache_key, index)
+    return index
+
+
+async def stream_records(records, event_stream):
+    async for record in records:
+        payload = json.dumps(record, separators=(",", ":"))
+        if event_stream:
+            yield f"event: {record['type']}\ndata: {payload}\n\n"
+        else:
+            yield payload + "\n"
+
+
+async def iter_diff_records(changed_files, format, renames):
+    total_added = 0
+    total_deleted = 0
+    file_count = 0
+    async for file_diff in changed_files:
+        total_added += file_diff["lines_added"]
+        total_deleted += file_diff["lines_deleted"]
+        file_count += 1
+        yield {"type": "file", **format_file_diff(file_diff, format)}
+    yield {"type": "summary", "lines_added": total_added, "lines_deleted": total_deleted, "files": file_count,
+           "renames": renames}
+
+
+async def iter_cached_files(changed_files):
+    for file_diff in changed_files:
+        yield file_diff
+
+
+async def render_diff(diff_output, detailed, format):
+    # Returned in a JSONResponse: the payload is plain JSON already, so FastAPI's per-object encoding pass is skipped
+    if not detailed:
+        return diff_output
+    if format == "compact":
+        return format_detailed_diff(diff_output, format)
+    # Expanding a big diff back into per-line dicts is CPU-bound too
+    return await run_in_threadpool(format_detailed_diff, diff_output, format)
+
+
+async def iter_streamed_diff(git, repo_path, diff_range, format, plan, max_file_bytes, renames):
+    # Runs after the handler has returned; Starlette closes it (killing git) if the client goes away
+    try:
+        batches = (git.iter_line_batches(repo_path, "diff", *diff_rename_args(renames), diff_range, "--",
+                                         *plan.pathspecs)
+                   if plan.needs_patch else iter_cached_files([]))
+        async for record in iter_diff_records(plan.amerge(aiter_file_diffs(batches, max_file_bytes)), format,
+                                              renames):
+            yield record
+    except Exception as e:
+        yield {"type": "error", "detail": str(e)}
+
+
 @router.get("/diff")
 
-def diff(repo_path: str, base_branch: str, target_branch: str, detailed: bool = False, mode: str = "pr"):
-    repo_path = os.path.expanduser(repo_path)
+async def diff(request: Request, repo_path: str, base_branch: str, target_branch: str, detailed: bool = False,
+               mode: str = "pr", stream: bool = False, format: str = "full", ignore: bool = True,
+               max_file_lines: int = MAX_FILE_LINES, max_file_bytes: int = MAX_FILE_BYTES,
+               find_renames: Optional[int] = None, find_copies: Optional[int] = None,
+               rename_limit: Optional[int] = None, git: GitExecutor = Depends(get_git_executor), cache: DiffCache = Depends(get_diff_cache),
+               store: DiffStore = Depends(get_diff_store), locks: RepoLockManager = Depends(get_repo_locks)):
+    """
+    Diff two branches. With `detailed=true&stream=true` the response is NDJSON
+    (or Server-Sent Events when the client accepts text/event-stream): one
+    `file` record per changed file as soon as it is parsed, then a `summary`
+    record with the totals. Streamed diffs are served from the caches when
+    present but are not added to them, so the full diff is never held at once.
+
+    With `format=compact` each detailed hunk has its lines as one
+    newline-joined `text`, a `types` string with one character per line
+    (`+`, `-`, space, or a backslash for a verbatim line) and the line
+    numbers from its `@@` header, instead of one object per line.
+
+    Files matching the team's ignorePatterns are left out by git itself (pass
+    `ignore=false` to keep them). In detailed diffs a binary file, or one with
+    more than `max_file_lines` changed lines or `max_file_bytes` of hunks,
+    comes without hunks, marked `binary` or `truncated`; truncated files have
+    a `cursor` for /diff/hunks. A cap of 0 turns it off.
+
+    Renames are detected at `find_renames`% similarity and copies at
+    `find_copies`% (0 turns either off), comparing at most `rename_limit`
+    sources and destinations; the team config's renameThreshold,
+    copyThreshold and renameLimit are the defaults. The response's `renames`
+    has the settings used, and `limit_exceeded` when git ran out of budget
+    and only matched exact renames.
+    """
+    repo_path = resolve_repo_path(repo_path)
     if not os.path.exists(repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if mode not in ("pr", "absolute"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Use 'pr' or 'absolute'.")
+    if format not in DIFF_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'full' or 'compact'.")
+    if max_file_lines < 0 or max_file_bytes < 0:
+        raise HTTPException(status_code=400, detail="File caps cannot be negative")
+    validate_renames(find_renames, find_copies, rename_limit)
+    streaming = stream and detailed
+    event_stream = "text/event-stream" in request.headers.get("accept", "")
+    media_type = "text/event-stream" if event_stream else "application/x-ndjson"
     try:
-        repo = Repo(repo_path)
-        if mode == "pr":
-            merge_base = repo.git.merge_base(base_branch, target_branch).strip()
-            diff_range = f"{merge_base}..{target_branch}"
-        elif mode == "absolute":
-            diff_range = f"{base_branch}..{target_branch}"
-        else:
-            raise HTTPException(status_code=400, detail="Invalid mode. Use 'pr' or 'absolute'.")
-
-        if detailed:
-            diff_text = repo.git.diff(diff_range)
-            total_added = 0
-            total_deleted = 0
-            changed_files = []
-            current_file = None
-            current_hunk = None
-
-            for line in diff_text.splitlines():
-                if line.startswith("diff --git"):
-                    if current_file:
-                        if current_hunk:
-                            current_file["changed_hunks"].append(current_hunk)
-                            current_hunk = None
-                        changed_files.append(current_file)
-                    parts = line.split()
-                    filename = parts[3][2:] if len(parts) >= 4 else "unknown"
-                    current_file = {"file": filename, "lines_added": 0, "lines_deleted": 0, "changed_hunks": [], "status": "modified"}
-                    current_hunk = None
-                elif current_file is not None:
-                    if line.startswith("@@"):
-                        if current_hunk:
-                            current_file["changed_hunks"].append(current_hunk)
-                        current_hunk = {"hunk_header": line, "lines": []}
-                    elif line.startswith("new file mode"):
-                        current_file["status"] = "added"
-                    elif line.startswith("deleted file mode"):
-                        current_file["status"] = "deleted"
-                    elif line.startswith("rename from"):
-                        current_file["status"] = "renamed"
-                        current_file["old_file"] = line.replace("rename from", "").strip()
-                    elif line.startswith("rename to"):
-                        current_file["new_file"] = line.replace("rename to", "").strip()
-                    elif line.startswith('+++') or line.startswith('---') or line.startswith('index '):
-                        continue
-                    else:
-                        if current_hunk is None:
-                            current_hunk = {"hunk_header": "", "lines": []}
-                        if line.startswith('+') and not line.startswith('+++'):
-                            current_hunk["lines"].append({"text": line[1:], "line_type": "added"})
-                            current_file["lines_added"] += 1
-                            total_added += 1
-                        elif line.startswith('-') and not line.startswith('---'):
-                            current_hunk["lines"].append({"text": line[1:], "line_type": "deleted"})
-                            current_file["lines_deleted"] += 1
-                            total_deleted += 1
-                        elif line.startswith(' '):
-                            current_hunk["lines"].append({"text": line[1:], "line_type": "context"})
-                        else:
-                            current_hunk["lines"].append({"text": line, "line_type": "context"})
-            if current_file:
-                if current_hunk:
-                    current_file["changed_hunks"].append(current_hunk)
-                changed_files.append(current_file)
-
-            diff_output = {
-                "lines_added": total_added,
-                "lines_deleted": total_deleted,
-                "changed_files": changed_files
-            }
-        else:
-            diff_output = repo.git.diff("--name-status", diff_range)
-        return {"diff": diff_output}
+        async with locks.read_async(repo_path):
+            base_sha, target_sha = await resolve_commits(git, repo_path, base_branch, target_branch, request=request)
+            patterns, excludes, renames = await run_in_threadpool(diff_settings, repo_path, ignore, find_renames,
+                                                                  find_copies, rename_limit)
+            variant = [patterns, renames, max_file_lines, max_file_bytes] if detailed else [patterns, renames]
+            # Detailed diffs are kept in the compact form and expanded per request
+            cache_key = (repo_path, base_sha, target_sha, mode, "compact" if detailed else False, json.dumps(variant))
+            # Cached as {"diff", "renames"}, so a hit still reports whether the rename limit was hit
+            cached = cache.get(cache_key)
+            if cached is None:
+                store_key = DiffStore.diff_key(*cache_key[:5], variant)
+                cached = await run_in_threadpool(store.get, store_key) if store else None
+                if cached is not None:
+                    cache.put(cache_key, cached)
+            if cached is not None:
+                if streaming:
+                    records = iter_diff_records(iter_cached_files(cached["diff"]["changed_files"]), format,
+                                                cached["renames"])
+                    return StreamingResponse(stream_records(records, event_stream), media_type=media_type)
+                return JSONResponse({"diff": await render_diff(cached["diff"], detailed, format),
+                                     "renames": cached["renames"]})
+
+            start_sha = await diff_range_start(git, repo_path, base_sha, target_sha, mode, store)
+            diff_range = f"{start_sha}..{target_sha}"
+            if detailed:
+                # The numstat index is cheap next to the patch and already knows which files are binary or huge
+                index = await load_file_index(git, cache, store, repo_path, base_sha, target_sha, mode, patterns,
+                                              excludes, renames, request=request)
+                plan = DiffPlan(index["files"], excludes, start_sha, target_sha, max_file_lines, renames)
+                # The patch covers the same or fewer files, so the index already knows if the limit was hit
+                renames = index["renames"]
+            if streaming:
+                records = iter_streamed_diff(git, repo_path, diff_range, format, plan, max_file_bytes, renames)
+                return StreamingResponse(stream_records(records, event_stream), media_type=media_type)
+
+            if detailed:
+                batches = iter_cached_files([])
+                if plan.needs_patch:
+                    # Parsed (on worker threads) as git writes it, so only the records are held, never the whole patch
+                    batches = git.iter_line_batches(repo_path, "diff", *diff_rename_args(renames), diff_range, "--",
+                                                    *plan.pathspecs, timeout=git.timeout, request=request)
+                diff_output = plan.merge(await acollect_detailed_diff(batches, max_file_bytes))
+            else:
+                warnings = []
+                diff_output = (await git.run(repo_path, "diff", "--name-status", *diff_rename_args(renames),
+                                             diff_range, "--", *excludes, request=request,
+                                             warnings=warnings)).rstrip("\n")
+                renames = dict(renames, limit_exceeded=rename_limit_exceeded("".join(warnings)))
+            cached = {"diff": diff_output, "renames": renames}
+            cache.put(cache_key, cached)
+            if store:
+                await run_in_threadpool(store.put, repo_path, store_key, cached)
+        return JSONResponse({"diff": await render_diff(diff_output, detailed, format), "renames": renames})
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+@router.get("/diff/files")
+
+async def diff_files(request: Request, repo_path: str, base_branch: str, target_branch: str, mode: str = "pr",
+                     offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1), ignore: bool = True,
+                     find_renames: Optional[int] = None, find_copies: Optional[int] = None,
+                     rename_limit: Optional[int] = None, git: GitExecutor = Depends(get_git_executor),
+                     cache: DiffCache = Depends(get_diff_cache), store: DiffStore = Depends(get_diff_store),
+                     locks: RepoLockManager = Depends(get_repo_locks)):
+    """
+    Cheap per-file index of a diff, without the files matching the team's
+    ignorePatterns unless `ignore=false`; fetch hunks for individual files
+    through /diff/hunks. Renames are detected as in /diff.
+    """
+    repo_path = resolve_repo_path(repo_path)
+    if not os.path.exists(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if mode not in ("pr", "absolute"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Use 'pr' or 'absolute'.")
+    validate_renames(find_renames, find_copies, rename_limit)
+    try:
+        async with locks.read_async(repo_path):
+            base_sha, target_sha = await resolve_commits(git, repo_path, base_branch, target_branch, request=request)
+            patterns, excludes, renames = await run_in_threadpool(diff_settings, repo_path, ignore, find_renames,
+                                                                  find_copies, rename_limit)
+            index = await load_file_index(git, cache, store, repo_path, base_sha, target_sha, mode, patterns,
+                                          excludes, renames, request=request)
+        page = index["files"][offset:offset + limit if limit is not None else None]
+        return {
+            "lines_added": index["lines_added"],
+            "lines_deleted": index["lines_deleted"],
+            "total_files": len(index["files"]),
+            "offset": offset,
+            "files": page,
+            "renames": index["renames"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+@router.get("/diff/hunks")
+async def diff_hunks(request: Request, repo_path: str, cursor: List[str] = Query(...), format: str = "full",
+                     git: GitExecutor = Depends(get_git_executor), cache: DiffCache = Depends(get_diff_cache)):
+    """
+    Detailed hunks for the files named by one or more cursors from /diff/files
+    (or /diff's truncated files), in either /diff format. Each file is diffed
+    with the rename settings and per-file caps its cursor was made with: as
+    in /diff, a binary file or one over a cap comes back without hunks,
+    marked `binary` or `truncated`, and a truncated one has a cursor for its
+    full hunks.
+    """
+    repo_path = resolve_repo_path(repo_path)
+    if not os.path.exists(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if format not in DIFF_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'full' or 'compact'.")
+    # Cursors from one index share a range and settings, so this is normally one numstat and one patch
+    paths_by_diff = {}
+    for file_cursor in cursor:
+        start_sha, target_sha, paths, renames, caps = decode_file_cursor(file_cursor)
+        key = (start_sha, target_sha, tuple(renames.values()), caps)
+        paths_by_diff.setdefault(key, (renames, []))[1].extend(paths)
+    try:
+        changed_files = []
+        for (start_sha, target_sha, rename_values, caps), (renames, paths) in paths_by_diff.items():
+            max_file_lines, max_file_bytes = caps
+            cache_key = (repo_path, start_sha, target_sha, "hunks", rename_values, caps, tuple(paths))
+            page = cache.get(cache_key)
+            if page is None:
+                pathspecs = [f":(literal){path}" for path in paths]
+                # The rename settings of the index, or a renamed file comes back as a delete and an add
+                diff_args = [*diff_rename_args(renames), f"{start_sha}..{target_sha}"]
+                index = parse_file_index(await git.run(repo_path, "diff", "--raw", "--numstat", "-z", *diff_args,
+                                                       "--", *pathspecs, request=request))
+                plan = DiffPlan(index, [], start_sha, target_sha, max_file_lines, renames)
+                batches = iter_cached_files([])
+                if plan.needs_patch:
+                    batches = git.iter_line_batches(repo_path, "diff", *diff_args, "--", *pathspecs, *plan.pathspecs,
+                                                    timeout=git.timeout, request=request)
+                records = aiter_file_diffs(batches, max_file_bytes, kind="file_diffs")
+                page = [record async for record in plan.amerge(records)]
+                cache.put(cache_key, page)
+            changed_files.extend(page)
+        return JSONResponse({"changed_files": [format_file_diff(file_diff, format) for file_diff in changed_files]})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=error_status(e), detail=str(e))
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from utils.diff_store import DiffStore, get_diff_store
+from utils.repo_pool import resolve_repo_path
+
+router = APIRouter()
+
+@router.get("/diff-store")
+
+def inspect_diff_store(store: DiffStore = Depends(get_diff_store)):
+    if store is None:
+        return {"enabled": False}
+    return {"enabled": True, **store.stats()}
+
+@router.delete("/diff-store")
+
+def purge_diff_store(repo_path: Optional[str] = None, store: DiffStore = Depends(get_diff_store)):
+    if store is None:
+        raise HTTPException(status_code=404, detail="The persistent diff store is disabled")
+    repo_path = resolve_repo_path(repo_path) if repo_path else None
+    return {"purged": store.purge(repo_path)}
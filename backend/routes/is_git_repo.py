@@ -1,20 +1,18 @@
 from fastapi import APIRouter, HTTPException
-from git import Repo
+from starlette.concurrency import run_in_threadpool
 import os
 
+from utils.repo_pool import resolve_repo_path
+from utils.repo_scan import git_dir_at
+
 router = APIRouter()
 
 @router.get("/is-git-repo")
 
-def is_git_repo(repo_path: str):
-    repo_path = os.path.expanduser(repo_path)
+async def is_git_repo(repo_path: str):
+    # A few stat calls for a .git marker (or a bare repo) at the path itself, instead of starting git.
+    # Parents are not searched: the other routes open exactly this path, so a subdirectory would fail there
+    repo_path = resolve_repo_path(repo_path)
     if not os.path.exists(repo_path):
         raise HTTPException(status_code=404, detail="Path does not exist")
-    try:
-        repo = Repo(repo_path)
-        if repo.git_dir:
-            return {"is_git_repo": True}
-        else:
-            return {"is_git_repo": False}
-    except Exception:
-        return {"is_git_repo": False} 
\ No newline at end of file
+    return {"is_git_repo": await run_in_threadpool(git_dir_at, repo_path) is not None}
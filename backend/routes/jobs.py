@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+
+from routes.watch import KEEPALIVE_SECONDS, sse_event
+from utils.repo_locks import JobQueue, get_job_queue
+
+router = APIRouter()
+
+@router.get("/jobs")
+
+def list_jobs(repo_path: Optional[str] = None, jobs: JobQueue = Depends(get_job_queue)):
+    return {"jobs": jobs.list_jobs(repo_path)}
+
+@router.get("/jobs/{job_id}")
+
+def get_job(job_id: str, jobs: JobQueue = Depends(get_job_queue)):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+
+async def job_events(request: Request, job_id: str, jobs: JobQueue = Depends(get_job_queue)):
+    """
+    Server-sent events for a job: a `progress` event per line the job has
+    reported (the ones kept so far first), then a `job` event with the
+    finished job, after which the stream ends.
+    """
+    subscriber, job = jobs.subscribe(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        _, queue = subscriber
+        try:
+            for line in job.get("progress", []):
+                yield sse_event({"type": "progress", "line": line})
+            if job["finished_at"] is not None:
+                yield sse_event({"type": "job", **job})
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event)
+                if event["type"] == "job":
+                    return
+        finally:
+            jobs.unsubscribe(job_id, subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import Metrics, get_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+
+def get_prometheus_metrics(metrics: Metrics = Depends(get_metrics)):
+    """Request, git and diff-parse latencies in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/slow")
+
+def get_slow_calls(metrics: Metrics = Depends(get_metrics)):
+    """The most recent requests, git calls and parses slower than GIT_BARBER_SLOW_MS, oldest first."""
+    return {"threshold_ms": metrics.slow_ms, "calls": metrics.slow_calls()}
@@ -1,23 +1,127 @@
-from fastapi import APIRouter, HTTPException
-from git import Repo
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
+from typing import List, Optional
 import os
+import re
+import subprocess
+import tempfile
+import time
+
+from git.exc import GitCommandError
+
+from utils.git_executor import GitExecutor, error_status, get_git_executor
+from utils.metrics import metrics
+from utils.repo_locks import JobQueue, RepoLockManager, get_job_queue, get_repo_locks
+from utils.repo_pool import resolve_repo_path
 
 router = APIRouter()
 
+# git's progress meters redraw with a carriage return
+PROGRESS_SPLIT_RE = re.compile(rb"[\r\n]")
+PUSH_FLAGS = {
+    " ": "fast-forward",
+    "+": "forced",
+    "-": "deleted",
+    "*": "new",
+    "!": "rejected",
+    "=": "up-to-date",
+}
+
 class PushModel(BaseModel):
     repo_path: str
-    branch: str
+    branch: Optional[str] = None
+    # Pushed together with `branch`, in one atomic git push
+    branches: List[str] = []
+    remote: str = "origin"
+
+
+def parse_push_porcelain(output):
+    """Per-ref results from `git push --porcelain`: [{ref, status, summary}]."""
+    refs = []
+    for line in output.splitlines():
+        flag, tab, rest = line[:1], line[1:2], line[2:]
+        if tab != "\t" or flag not in PUSH_FLAGS:
+            continue
+        refspec, _, summary = rest.partition("\t")
+        refs.append({"ref": refspec.rpartition(":")[2], "status": PUSH_FLAGS[flag], "summary": summary})
+    return refs
+
+
+def push_command(remote, branches, progress):
+    # --atomic: the remote takes every ref or none of them
+    return ["push", "--atomic", "--porcelain", *(["--progress"] if progress else []), remote, *branches]
+
+
+def run_push(repo_path, remote, branches, report):
+    """
+    Push `branches` in one `git push --atomic`, handing every line of git's
+    --progress output to `report` as it arrives. Runs in a job worker thread.
+    """
+    args = push_command(remote, branches, progress=True)
+    started = time.perf_counter()
+    # stdout (the porcelain summary) goes to a file, so only stderr has to be drained while git runs
+    with tempfile.TemporaryFile() as stdout:
+        process = subprocess.Popen(["git", *args], cwd=repo_path, stdin=subprocess.DEVNULL, stdout=stdout,
+                                   stderr=subprocess.PIPE, env=dict(os.environ, GIT_TERMINAL_PROMPT="0"))
+        pending, messages = b"", []
+        while True:
+            chunk = process.stderr.read1(65536)
+            lines = PROGRESS_SPLIT_RE.split(pending + chunk) if chunk else [pending, b""]
+            pending = lines.pop()
+            for line in lines:
+                line = line.decode("utf-8", "replace").rstrip()
+                if line:
+                    messages.append(line)
+                    report(line)
+            if not chunk:
+                break
+        returncode = process.wait()
+        stdout.seek(0)
+        output = stdout.read().decode("utf-8", "replace")
+    metrics.observe_git(args, time.perf_counter() - started, len(output), returncode, repo_path)
+    refs = parse_push_porcelain(output)
+    if returncode != 0:
+        raise GitCommandError(["git", *args], returncode, "\n".join(messages[-20:]), output)
+    return {"message": push_message(remote, branches), "result": output.strip(), "refs": refs}
+
+
+def push_message(remote, branches):
+    if len(branches) == 1:
+        return f"Pushed branch {branches[0]} to {remote}"
+    return f"Pushed branches {', '.join(branches)} to {remote}"
+
 
 @router.post("/push")
 
-def push_branch(data: PushModel):
-    data.repo_path = os.path.expanduser(data.repo_path)
+async def push_branch(request: Request, data: PushModel, background: bool = False,
+                      jobs: JobQueue = Depends(get_job_queue), locks: RepoLockManager = Depends(get_repo_locks),
+                      git: GitExecutor = Depends(get_git_executor)):
+    """
+    Push `branch` and/or `branches` to `remote` in a single atomic git push.
+    With `background=true` the push is queued as a job and its id returned at
+    once; follow git's progress on /jobs/{id}/events.
+    """
+    data.repo_path = resolve_repo_path(data.repo_path)
     if not os.path.exists(data.repo_path):
         raise HTTPException(status_code=404, detail="Repository path does not exist")
+    branches = list(dict.fromkeys(([data.branch] if data.branch else []) + data.branches))
+    if not branches:
+        raise HTTPException(status_code=400, detail="No branches to push")
+    if any(name.startswith("-") for name in branches + [data.remote]):
+        raise HTTPException(status_code=400, detail="Branch and remote names cannot start with '-'")
+
+    if background:
+        def run(report):
+            return run_push(data.repo_path, data.remote, branches, report)
+
+        return {"job": jobs.submit(data.repo_path, "push", run, progress=True)}
+
     try:
-        repo = Repo(data.repo_path)
-        push_result = repo.git.push('origin', data.branch)
-        return {"message": f"Pushed branch {data.branch} to origin", "result": push_result}
+        # Waits for the write lock and for git on the event loop, so a slow push holds no worker thread
+        async with locks.write_async(data.repo_path):
+            push_result = await git.run(data.repo_path, *push_command(data.remote, branches, progress=False),
+                                        request=request)
+        return {"message": push_message(data.remote, branches), "result": push_result.strip(),
+                "refs": parse_push_porcelain(push_result)}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=error_status(e), detail=str(e))
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import os
+
+from utils.repo_pool import resolve_repo_path
+from utils.repo_scan import RepoScanner, get_repo_scanner
+
+router = APIRouter()
+
+@router.get("/repos/scan")
+
+async def scan_repos(root: str, max_depth: Optional[int] = None, dirty: bool = True, refresh: bool = False,
+                     scanner: RepoScanner = Depends(get_repo_scanner)):
+    """
+    Every git repository under `root`, as {path, branch, detached, dirty}
+    (`dirty` counts tracked files only; pass `dirty=false` to skip the git
+    call per repository). Repositories are not searched for nested ones.
+
+    Results are cached for a short while (`cached: true`); `refresh=true`
+    rescans now, re-listing only the directories that changed since the last
+    scan.
+    """
+    root = resolve_repo_path(root)
+    if not os.path.isdir(root):
+        raise HTTPException(status_code=404, detail="Directory does not exist")
+    if max_depth is not None and max_depth < 0:
+        raise HTTPException(status_code=400, detail="max_depth cannot be negative")
+    try:
+        return await run_in_threadpool(scanner.scan, root, max_depth, dirty, refresh)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+import os
+import time
+
+from barber_config import ignore_matcher, load_team_config
+from split_engine import BranchExistsError, SplitEngine
+from split_planner import plan_split
+from utils.repo_locks import JobQueue, RepoLockManager, get_job_queue, get_repo_locks
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
+
+router = APIRouter()
+
+class SplitModel(BaseModel):
+    repo_path: str
+    base_branch: str
+    big_branch: str
+    sub_base_branch: str
+    sub_feature_branch: str
+    # Everything else changed on big_branch goes to sub_feature_branch
+    sub_base_files: List[str]
+    sub_base_message: Optional[str] = None
+    sub_feature_message: Optional[str] = None
+    push: bool = False
+
+class StackLayerModel(BaseModel):
+    branch: str
+    files: List[str]
+    message: Optional[str] = None
+
+class SplitStackModel(BaseModel):
+    repo_path: str
+    base_branch: str
+    big_branch: str
+    # Bottom of the stack first; each branch is created on top of the previous one
+    layers: List[StackLayerModel]
+    # Put files no layer claimed into the last layer, so the top of the stack matches big_branch
+    rest_to_last: bool = True
+    push: bool = False
+
+
+def run_split(pool, repo_path, base_branch, big_branch, layers, push):
+    """
+    Build a stack of branches from `layers` [(branch, files, message, takes_rest)];
+    a layer with takes_rest also gets every changed file no layer listed. Either
+    every step succeeds or the branches created so far are deleted again.
+    """
+    started = time.perf_counter()
+    with pool.lease(repo_path) as repo, SplitEngine(repo, base_branch, big_branch) as engine:
+        claimed = {engine.change_path(path) for _, files, _, _ in layers for path in files}
+        rest = [path for path in engine.changes if path not in claimed]
+        plan = [
+            (branch, files + rest if takes_rest else files, message)
+            for branch, files, message, takes_rest in layers
+        ]
+        created = engine.split(plan)
+        if push:
+            try:
+                with engine.timed("push"):
+                    repo.git.push("--atomic", "origin", *[name for name, _ in created])
+            except Exception:
+                # --atomic leaves the remote untouched, so undo the local half too
+                engine.delete_branches(created)
+                raise
+        timings = [{"step": step, "ms": ms} for step, ms in engine.timings]
+    return {
+        "branches": [
+            {"name": name, "commit": commit, "files": len(files)}
+            for (name, commit), (_, files, _) in zip(created, plan)
+        ],
+        "pushed": push,
+        "rename_limit_exceeded": engine.rename_limit_exceeded,
+        "timings": timings,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def run_split_job(jobs, repo_path, operation, run, background):
+    try:
+        return jobs.run(repo_path, operation, run, background)
+    except BranchExistsError as e:
+        raise HTTPException(status_code=409, detail=f"{e}. Pick other names or delete the existing branches.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/split")
+
+def split(data: SplitModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+          jobs: JobQueue = Depends(get_job_queue)):
+    """
+    Run a whole two-way split server-side: build the sub-base and sub-feature
+    branches from the big branch and optionally push them.
+    """
+    data.repo_path = resolve_repo_path(data.repo_path)
+    if not os.path.exists(data.repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    layers = [
+        (data.sub_base_branch, data.sub_base_files,
+         data.sub_base_message or f"copied base files from {data.big_branch}", False),
+        (data.sub_feature_branch, [],
+         data.sub_feature_message or f"copied rest of files from {data.big_branch}", True),
+    ]
+
+    def run():
+        return run_split(pool, data.repo_path, data.base_branch, data.big_branch, layers, data.push)
+
+    return run_split_job(jobs, data.repo_path, "split", run, background)
+
+
+@router.post("/split-stack")
+
+def split_stack(data: SplitStackModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+                jobs: JobQueue = Depends(get_job_queue)):
+    """
+    N-way split: partition the big branch into a stacked chain of branches from
+    a single diff, each layer's tree derived from the one below it.
+    """
+    data.repo_path = resolve_repo_path(data.repo_path)
+    if not os.path.exists(data.repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if not data.layers:
+        raise HTTPException(status_code=400, detail="At least one layer is required")
+    layers = [
+        (layer.branch, layer.files, layer.message or f"copied {layer.branch} files from {data.big_branch}",
+         data.rest_to_last and position == len(data.layers) - 1)
+        for position, layer in enumerate(data.layers)
+    ]
+
+    def run():
+        return run_split(pool, data.repo_path, data.base_branch, data.big_branch, layers, data.push)
+
+    return run_split_job(jobs, data.repo_path, "split-stack", run, background)
+
+
+@router.get("/split-plan")
+
+def split_plan(repo_path: str, base_branch: str, big_branch: str, threshold: Optional[int] = None,
+               history: bool = True, imports: bool = False, pool: RepoPool = Depends(get_repo_pool),
+               locks: RepoLockManager = Depends(get_repo_locks)):
+    """
+    Propose an ordered stack of chunks, each under the team's largeDiffThreshold,
+    that can be passed as layers to /split-stack.
+    """
+    repo_path = resolve_repo_path(repo_path)
+    if not os.path.exists(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if threshold is not None and threshold < 1:
+        raise HTTPException(status_code=400, detail="threshold must be at least 1")
+    try:
+        started = time.perf_counter()
+        with locks.read(repo_path), pool.lease(repo_path) as repo, \
+                SplitEngine(repo, base_branch, big_branch) as engine:
+            config = load_team_config(repo.working_dir)
+            plan = plan_split(
+                engine, threshold or int(config["largeDiffThreshold"]),
+                ignore_matcher(config["ignorePatterns"]), history=history, imports=imports
+            )
+            plan["rename_limit_exceeded"] = engine.rename_limit_exceeded
+            plan["timings"] = [{"step": step, "ms": ms} for step, ms in engine.timings]
+        plan["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return plan
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,233 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+from barber_config import ignore_matcher, load_branch_config, load_team_config
+from sync_engine import StackSyncEngine
+from utils.diff_cache import DiffCache, get_diff_cache
+from utils.diff_store import DiffStore, get_diff_store
+from utils.git_executor import GitExecutor, error_status, get_git_executor
+from utils.repo_locks import JobQueue, RepoLockManager, get_job_queue, get_repo_locks
+from utils.repo_pool import RepoPool, get_repo_pool, resolve_repo_path
+from routes.diff import diff_range_start
+
+router = APIRouter()
+
+# Parallel merges per /stack-sync; /stack-diff-summary is bounded by the git executor's limits instead
+STACK_WORKERS = int(os.environ.get("GIT_BARBER_STACK_WORKERS", "8"))
+
+class StackDiffSummaryModel(BaseModel):
+    repo_path: str
+    # parent -> children; read from the .git-barber config when omitted
+    branch_tree: Optional[Dict[str, List[str]]] = None
+    # Roots to walk from; defaults to the config's baseBranches, or every parent that is nobody's child
+    base_branches: Optional[List[str]] = None
+    mode: str = "absolute"
+
+class StackSyncModel(BaseModel):
+    repo_path: str
+    # Branch to merge down from: a branch in the tree, or a base branch's ancestor (e.g. main)
+    start_branch: str
+    branch_tree: Optional[Dict[str, List[str]]] = None
+    # Fetch origin first and fast-forward branches that are behind it
+    pull: bool = False
+    # Stream one NDJSON record per branch as it is synced
+    stream: bool = False
+
+
+def stack_edges(branch_tree, base_branches):
+    """(parent, child) pairs in the order the CLI prints the tree, each branch visited once."""
+    edges = []
+    seen = set()
+
+    def walk(parent):
+        for child in branch_tree.get(parent, []):
+            if child in seen:
+                continue
+            seen.add(child)
+            edges.append((parent, child))
+            walk(child)
+
+    for base in base_branches:
+        seen.add(base)
+        walk(base)
+    return edges
+
+
+async def resolve_refs(git, repo_path, refs):
+    """Map each ref to its commit SHA, or None if it doesn't exist, with a single cat-file call."""
+    batch = "".join(f"{ref}^{{commit}}\n" for ref in refs).encode("utf-8")
+    output = await git.run(repo_path, "cat-file", "--batch-check=%(objectname)", input=batch)
+    return {
+        ref: None if line.endswith(" missing") or line.endswith(" ambiguous") else line
+        for ref, line in zip(refs, output.splitlines())
+    }
+
+
+async def edge_line_counts(git, cache, store, repo_path, parent_sha, child_sha, mode):
+    """Per-file [path, lines_added, lines_deleted] for one edge, and whether it came from a cache."""
+    cache_key = (repo_path, parent_sha, child_sha, mode, "numstat")
+    counts = cache.get(cache_key)
+    if counts is not None:
+        return counts, True
+    store_key = DiffStore.diff_key(*cache_key)
+    counts = await run_in_threadpool(store.get, store_key) if store else None
+    if counts is None:
+        start_sha = await diff_range_start(git, repo_path, parent_sha, child_sha, mode, store)
+        output = await git.run(repo_path, "diff", "--numstat", "-z", "--no-renames", f"{start_sha}..{child_sha}")
+        counts = []
+        for record in output.split("\0"):
+            if record:
+                added, deleted, path = record.split("\t", 2)
+                # Binary files have no line counts
+                counts.append([path, 0 if added == "-" else int(added), 0 if deleted == "-" else int(deleted)])
+        if store:
+            await run_in_threadpool(store.put, repo_path, store_key, counts)
+        cached = False
+    else:
+        cached = True
+    cache.put(cache_key, counts)
+    return counts, cached
+
+
+@router.post("/stack-diff-summary")
+
+async def stack_diff_summary(data: StackDiffSummaryModel, git: GitExecutor = Depends(get_git_executor),
+                             cache: DiffCache = Depends(get_diff_cache), store: DiffStore = Depends(get_diff_store),
+                             locks: RepoLockManager = Depends(get_repo_locks)):
+    """
+    Line counts for every parent/child edge of a branch stack, computed
+    concurrently within the git executor's limits; the server-side
+    counterpart of the CLI's calculateDiffMapping(). Files matching the
+    team's ignorePatterns are left out of the totals.
+    """
+    repo_path = resolve_repo_path(data.repo_path)
+    if not os.path.exists(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    if data.mode not in ("pr", "absolute"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Use 'pr' or 'absolute'.")
+    try:
+        started = time.perf_counter()
+        async with locks.read_async(repo_path):
+            team_config = load_team_config(repo_path)
+            branch_tree = data.branch_tree
+            base_branches = data.base_branches
+            if branch_tree is None:
+                branch_config = load_branch_config(repo_path)
+                branch_tree = branch_config["branchTree"]
+                if base_branches is None:
+                    base_branches = list(branch_config["baseBranches"])
+            if base_branches is None:
+                children = {child for kids in branch_tree.values() for child in kids}
+                base_branches = [parent for parent in branch_tree if parent not in children]
+            edges = stack_edges(branch_tree, base_branches)
+            branches = list(dict.fromkeys(branch for edge in edges for branch in edge))
+            shas = await resolve_refs(git, repo_path, branches) if branches else {}
+
+            should_ignore = ignore_matcher(team_config["ignorePatterns"])
+            known = [(parent, child) for parent, child in edges if shas[parent] and shas[child]]
+            results = await asyncio.gather(
+                *[edge_line_counts(git, cache, store, repo_path, shas[parent], shas[child], data.mode)
+                  for parent, child in known],
+                return_exceptions=True,
+            )
+            outcomes = dict(zip(known, results))
+            threshold = int(team_config["largeDiffThreshold"])
+            summaries = []
+            for parent, child in edges:
+                summary = {"parent": parent, "child": child}
+                outcome = outcomes.get((parent, child))
+                if outcome is None:
+                    missing = [branch for branch in (parent, child) if not shas[branch]]
+                    summary["error"] = f"Unknown branch: {', '.join(missing)}"
+                elif isinstance(outcome, Exception):
+                    summary["error"] = str(outcome)
+                else:
+                    counts, cached = outcome
+                    counted = [entry for entry in counts if not should_ignore(entry[0])]
+                    summary.update(
+                        parent_sha=shas[parent],
+                        child_sha=shas[child],
+                        lines_added=sum(entry[1] for entry in counted),
+                        lines_deleted=sum(entry[2] for entry in counted),
+                        files=len(counted),
+                        ignored_files=len(counts) - len(counted),
+                        cached=cached,
+                    )
+                    summary["large"] = summary["lines_added"] > threshold
+                summaries.append(summary)
+        return {
+            "base_branches": base_branches,
+            "threshold": threshold,
+            "edges": summaries,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+def sync_branch_tree(repo, branch_tree):
+    """The tree to sync: the given one, or the .git-barber one with each base branch hung under its ancestor."""
+    if branch_tree is not None:
+        return branch_tree
+    branch_config = load_branch_config(repo.working_dir)
+    tree = {parent: list(children) for parent, children in branch_config["branchTree"].items()}
+    for base in branch_config["baseBranches"]:
+        ancestor = branch_config["ancestors"].get(base)
+        if ancestor and base not in tree.get(ancestor, []):
+            tree.setdefault(ancestor, []).append(base)
+    return tree
+
+
+@router.post("/stack-sync")
+
+def stack_sync(data: StackSyncModel, background: bool = False, pool: RepoPool = Depends(get_repo_pool),
+               locks: RepoLockManager = Depends(get_repo_locks), jobs: JobQueue = Depends(get_job_queue)):
+    """
+    Merge `start_branch` down through the branch tree, the server-side
+    counterpart of `git-barber sync`. Independent subtrees are synced in
+    parallel and a conflict only stops the subtree below it. With
+    `stream=true` the response is NDJSON: `pull` and `branch` records as
+    they happen, then a `summary` record.
+    """
+    data.repo_path = resolve_repo_path(data.repo_path)
+    if not os.path.exists(data.repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+
+    def run(on_event=None):
+        with pool.lease(data.repo_path) as repo:
+            engine = StackSyncEngine(repo, sync_branch_tree(repo, data.branch_tree), STACK_WORKERS, on_event)
+            return engine.sync(data.start_branch, pull=data.pull)
+
+    if data.stream:
+        events = queue.Queue()
+
+        def run_streamed():
+            # Keeps going (and holding the write lock) even if the client goes away
+            try:
+                with locks.write(data.repo_path):
+                    run(events.put)
+            except Exception as e:
+                events.put({"type": "error", "detail": str(e)})
+            finally:
+                events.put(None)
+
+        def records():
+            for event in iter(events.get, None):
+                yield json.dumps(event, separators=(",", ":")) + "\n"
+
+        threading.Thread(target=run_streamed, name="git-barber-stack-sync", daemon=True).start()
+        return StreamingResponse(records(), media_type="application/x-ndjson")
+
+    try:
+        return jobs.run(data.repo_path, "stack-sync", run, background)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+
+from utils.diff_cache import DiffCache, get_diff_cache
+from utils.git_executor import GitExecutor, get_git_executor
+from utils.repo_locks import JobQueue, RepoLockManager, get_job_queue, get_repo_locks
+from utils.repo_pool import RepoPool, get_repo_pool
+from utils.repo_scan import RepoScanner, get_repo_scanner
+from utils.repo_watch import RepoWatchManager, get_repo_watches
+
+router = APIRouter()
+
+@router.get("/stats")
+
+def get_stats(pool: RepoPool = Depends(get_repo_pool), cache: DiffCache = Depends(get_diff_cache),
+              locks: RepoLockManager = Depends(get_repo_locks), jobs: JobQueue = Depends(get_job_queue),
+              git: GitExecutor = Depends(get_git_executor), watches: RepoWatchManager = Depends(get_repo_watches),
+              scanner: RepoScanner = Depends(get_repo_scanner)):
+    return {"repo_pool": pool.stats(), "diff_cache": cache.stats(), "repo_locks": locks.stats(), "job_queue": jobs.stats(),
+            "git_executor": git.stats(), "repo_watches": watches.stats(), "repo_scanner": scanner.stats()}
@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
+import json
+import os
+
+from utils.repo_pool import resolve_repo_path
+from utils.repo_watch import RepoWatchManager, get_repo_watches
+
+router = APIRouter()
+
+# Comment lines keep proxies from closing an idle stream
+KEEPALIVE_SECONDS = 15.0
+
+
+def sse_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def prefixed_branches_event(event, prefix):
+    """A `branches` delta with only the branches under `prefix`, or None when none of them changed."""
+    added = [branch for branch in event["added"] if branch["name"].startswith(prefix)]
+    updated = [branch for branch in event["updated"] if branch["name"].startswith(prefix)]
+    removed = [name for name in event["removed"] if name.startswith(prefix)]
+    if not (added or updated or removed):
+        return None
+    return dict(event, added=added, updated=updated, removed=removed)
+
+
+@router.get("/watch")
+
+async def watch_repo(request: Request, repo_path: str, limit: Optional[int] = Query(None, ge=1),
+                     prefix: Optional[str] = None, watches: RepoWatchManager = Depends(get_repo_watches)):
+    """
+    Server-sent events for a repository's HEAD and branches, so clients can
+    stop polling /current-branch and /branches. The first event is a
+    `snapshot`; after that come `branches` (added/updated/removed), `head`
+    and `index` deltas, each with the snapshot version it produces. A
+    `resync` event means deltas were dropped and the client should reconnect.
+
+    As with /branches, `prefix` keeps only the branches under it (in the
+    snapshot and the deltas) and `limit` cuts the snapshot to the newest
+    `limit` branches; `total_branches` counts them all.
+    """
+    repo_path = resolve_repo_path(repo_path)
+    if not os.path.exists(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path does not exist")
+    try:
+        watcher = await run_in_threadpool(watches.get, repo_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    subscriber = watcher.subscribe()
+    snapshot = await run_in_threadpool(watcher.current_snapshot)
+
+    ordered = snapshot["ordered"]
+    if prefix:
+        ordered = [branch for branch in ordered if branch["name"].startswith(prefix)]
+
+    async def events():
+        _, queue = subscriber
+        try:
+            yield sse_event({
+                "type": "snapshot",
+                "version": snapshot["version"],
+                "current_branch": snapshot["current_branch"],
+                "head": snapshot["head"],
+                "branches": [{key: branch[key] for key in ("name", "commit", "last_commit_time", "timestamp")}
+                             for branch in ordered[:limit]],
+                "total_branches": len(ordered),
+            })
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # Subscribed before the snapshot was read, so skip deltas it already includes
+                if event["version"] <= snapshot["version"]:
+                    continue
+                if prefix and event["type"] == "branches":
+                    event = prefixed_branches_event(event, prefix)
+                if event is not None:
+                    yield sse_event(event)
+        finally:
+            watcher.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -3,11 +3,12 @@ from setuptools import setup
 setup(
     name='git-barber',
     version='0.1.0',
-    py_modules=['splitty'],
+    py_modules=['splitty', 'split_engine', 'split_planner', 'barber_config', 'file_picker'],
     install_requires=[
         'click',
         'GitPython',
         'inquirer',
+        'blessed',
     ],
     entry_points='''
         [console_scripts]
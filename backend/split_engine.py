@@ -0,0 +1,213 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+from git.exc import GitCommandError
+
+from barber_config import load_team_config, rename_args, rename_limit_exceeded, rename_settings
+
+# Called as listener(args, seconds, output_bytes, returncode, repo_path) after every git call;
+# the server records these in its metrics, the CLI registers none
+git_call_listeners = []
+
+
+class BranchExistsError(Exception):
+    """A branch the split would create already exists; nothing was created."""
+
+    def __init__(self, names):
+        self.names = names
+        super().__init__(f"Branch already exists: {', '.join(names)}")
+
+
+class SplitEngine:
+    """
+    Builds split branches with git plumbing in a private, temporary index.
+
+    The changed files between `base_branch` and `source_branch` are read once
+    with diff-tree. Each layer is then staged into the temporary index with a
+    single `update-index --index-info` batch, written with write-tree and
+    committed with commit-tree; the branches are finally created together in
+    one `update-ref --stdin` transaction. The working tree, the real index and
+    HEAD are never touched, and the number of git invocations does not grow
+    with the number of files.
+
+    A renamed file is one change, keyed by its new path and also answering to
+    its old one: whichever layer takes it gets both the delete and the add.
+    `renames` is the similarity threshold (0 treats renames as a delete plus
+    an add) and `rename_limit` git's budget for inexact matching, both from
+    the team config unless given; when the budget runs out git falls back to
+    exact renames only and `rename_limit_exceeded` is set.
+    """
+
+    def __init__(self, repo, base_branch, source_branch, renames=None, rename_limit=None):
+        self.repo = repo
+        self._index_dir = None
+        # (step, milliseconds) for every plumbing stage, in order
+        self.timings = []
+        self.base_branch = base_branch
+        self.source_branch = source_branch
+        settings = rename_settings(load_team_config(repo.working_dir), renames, 0, rename_limit)
+        self.rename_args = rename_args(settings["similarity"], 0, settings["limit"])
+        self.rename_limit_exceeded = False
+        # Old path of every rename -> its key in `changes`
+        self.renamed_from = {}
+        with self.timed("read changes"):
+            self.base_commit, self.source_commit = self._git(
+                "rev-parse", f"{base_branch}^{{commit}}", f"{source_branch}^{{commit}}"
+            ).split()
+            self.zero_sha = "0" * len(self.base_commit)
+            self.changes = self._read_changes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._index_dir:
+            shutil.rmtree(self._index_dir, ignore_errors=True)
+            self._index_dir = None
+
+    def changed_files(self):
+        """Changed paths with git status letters, in diff-tree order; renames are listed once, by new path."""
+        return [(path, change["status"]) for path, change in self.changes.items()]
+
+    def change_path(self, path):
+        """The key in `changes` for `path`, which may be the old path of a rename."""
+        return path if path in self.changes else self.renamed_from.get(path, path)
+
+    def split(self, layers):
+        """
+        Build a stack of branches on top of the base branch.
+
+        `layers` is an ordered list of (branch_name, paths, message); every
+        layer's commit has the previous one as parent and its tree is derived
+        from the previous layer's index rather than rebuilt. Returns the list
+        of (branch_name, commit_sha). No branch is created unless all are.
+        """
+        # Naming both sides of a rename in one layer is the same as naming it once
+        layers = [(branch_name, list(dict.fromkeys(self.change_path(path) for path in paths)), message)
+                  for branch_name, paths, message in layers]
+        all_paths = [path for _, paths, _ in layers for path in paths]
+        unknown = [path for path in all_paths if path not in self.changes]
+        if unknown:
+            raise ValueError(f"Not changed between {self.base_branch} and {self.source_branch}: {', '.join(unknown)}")
+        if len(set(all_paths)) != len(all_paths):
+            seen = set()
+            duplicates = sorted({path for path in all_paths if path in seen or seen.add(path)})
+            raise ValueError(f"Files assigned to more than one branch: {', '.join(duplicates)}")
+        branch_names = [branch_name for branch_name, _, _ in layers]
+        if len(set(branch_names)) != len(branch_names):
+            raise ValueError(f"Branch names must be different: {', '.join(branch_names)}")
+        # Checked up front so a taken name fails before any commit is written
+        existing = self.existing_branches(branch_names)
+        if existing:
+            raise BranchExistsError(existing)
+
+        with self.timed("read base tree"):
+            self._reset_index(self.base_commit)
+        parent = self.base_commit
+        created = []
+        for branch_name, paths, message in layers:
+            with self.timed(f"commit {branch_name}"):
+                parent = self._commit_layer(parent, paths, message)
+            created.append((branch_name, parent))
+        with self.timed("create branches"):
+            self.create_branches(created)
+        return created
+
+    def existing_branches(self, names):
+        output = self._git("for-each-ref", "--format=%(refname:lstrip=2)", *[f"refs/heads/{name}" for name in names])
+        existing = set(output.splitlines())
+        return [name for name in names if name in existing]
+
+    def create_branches(self, branches):
+        # `create` refuses to overwrite existing branches, and the transaction is all-or-nothing
+        commands = "".join(f"create refs/heads/{name} {commit}\n" for name, commit in branches)
+        try:
+            self._git("update-ref", "--stdin", input=f"start\n{commands}prepare\ncommit\n")
+        except GitCommandError as e:
+            # Someone created one of the branches after existing_branches() looked
+            existing = self.existing_branches([name for name, _ in branches])
+            if existing:
+                raise BranchExistsError(existing) from e
+            raise
+
+    def delete_branches(self, branches):
+        # Only deletes refs still pointing at the commits we created
+        commands = "".join(f"delete refs/heads/{name} {commit}\n" for name, commit in branches)
+        self._git("update-ref", "--stdin", input=f"start\n{commands}prepare\ncommit\n")
+
+    @contextmanager
+    def timed(self, step):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((step, round((time.perf_counter() - started) * 1000, 1)))
+
+    def _commit_layer(self, parent, paths, message):
+        entries = []
+        for path in paths:
+            change = self.changes[path]
+            if change["status"] == "D":
+                # Mode 0 removes the path from the index
+                entries.append(f"0 {self.zero_sha}\t{path}\0")
+            else:
+                if change["status"] == "R":
+                    entries.append(f"0 {self.zero_sha}\t{change['old_path']}\0")
+                entries.append(f"{change['mode']} {change['sha']}\t{path}\0")
+        if entries:
+            self._git("update-index", "-z", "--index-info", input="".join(entries))
+        tree = self._git("write-tree").strip()
+        return self._git("commit-tree", tree, "-p", parent, "-m", message).strip()
+
+    def _reset_index(self, commit):
+        if self._index_dir is None:
+            self._index_dir = tempfile.mkdtemp(prefix="git-barber-index-")
+        self._git("read-tree", commit)
+
+    def _read_changes(self):
+        warnings = []
+        output = self._git("diff-tree", "-r", "-z", *self.rename_args, self.base_commit, self.source_commit,
+                           warnings=warnings)
+        self.rename_limit_exceeded = rename_limit_exceeded("".join(warnings))
+        tokens = output.split("\0")
+        changes = {}
+        position = 0
+        while position < len(tokens) and tokens[position].startswith(":"):
+            _, new_mode, _, new_sha, status = tokens[position].lstrip(":").split()
+            # Renames come as R<score> with both paths
+            status = status[0]
+            path = tokens[position + 1]
+            position += 2
+            change = {"status": status, "mode": new_mode, "sha": new_sha}
+            if status == "R":
+                old_path, path = path, tokens[position]
+                position += 1
+                change["old_path"] = old_path
+                self.renamed_from[old_path] = path
+            changes[path] = change
+        return changes
+
+    def _git(self, *args, input=None, warnings=None):
+        env = dict(os.environ)
+        if self._index_dir is not None:
+            env["GIT_INDEX_FILE"] = os.path.join(self._index_dir, "index")
+        command = ["git", *args]
+        started = time.perf_counter()
+        result = subprocess.run(
+            command, cwd=self.repo.working_dir, env=env, input=input,
+            capture_output=True, text=True, encoding="utf-8",
+        )
+        for listener in git_call_listeners:
+            listener(args, time.perf_counter() - started, len(result.stdout), result.returncode, self.repo.working_dir)
+        if result.returncode != 0:
+            raise GitCommandError(command, result.returncode, result.stderr)
+        if warnings is not None and result.stderr:
+            warnings.append(result.stderr)
+        return result.stdout
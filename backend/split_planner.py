@@ -0,0 +1,246 @@
+import heapq
+import posixpath
+import re
+from collections import defaultdict
+
+# Edge kinds, strongest first: files joined by a stronger edge are kept together in preference
+IMPORT_EDGE, CO_CHANGE_EDGE, DIRECTORY_EDGE = 0, 1, 2
+
+# A commit touching more files than this says little about which of them belong together
+MAX_CO_CHANGE_FILES = 30
+# Don't scan huge (usually generated) sources for imports
+MAX_IMPORT_SCAN_BYTES = 512 * 1024
+
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+JS_IMPORT_RE = re.compile(
+    r"""(?:\bfrom\s*|\bimport\s*\(?\s*|\brequire\s*\(\s*)['"](\.{1,2}/[^'"]+)['"]"""
+)
+PY_IMPORT_RE = re.compile(r"^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+(\([^)]*\)|[^\n#;]+)|import[ \t]+([^\n#;]+))", re.M)
+
+
+class _Groups:
+    """Union-find over file indexes that refuses unions heavier than `capacity` lines."""
+
+    def __init__(self, weights, capacity):
+        self.parent = list(range(len(weights)))
+        self.weight = list(weights)
+        self.capacity = capacity
+
+    def find(self, node):
+        while self.parent[node] != node:
+            self.parent[node] = self.parent[self.parent[node]]
+            node = self.parent[node]
+        return node
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second or self.weight[first] + self.weight[second] > self.capacity:
+            return
+        if self.weight[first] < self.weight[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.weight[first] += self.weight[second]
+
+
+def read_line_counts(engine):
+    """Map each changed path to (lines_added, lines_deleted, binary) with one numstat diff."""
+    # Same rename detection as the engine, so a moved file weighs what was edited in it
+    output = engine._git("diff", "--numstat", "-z", *engine.rename_args, engine.base_commit, engine.source_commit)
+    tokens = output.split("\0")
+    counts = {}
+    position = 0
+    while position < len(tokens) and tokens[position]:
+        added, deleted, path = tokens[position].split("\t", 2)
+        position += 1
+        if not path:
+            # A rename: the old and new paths follow as tokens of their own
+            path = tokens[position + 1]
+            position += 2
+        binary = added == "-"
+        counts[path] = (0 if binary else int(added), 0 if binary else int(deleted), binary)
+    return counts
+
+
+def co_change_pairs(engine, paths):
+    """Count, for every pair of changed paths, the source-branch commits that touched both."""
+    output = engine._git(
+        "-c", "core.quotePath=false", "log", "--no-merges", "--format=%x00", "--name-only",
+        f"{engine.base_commit}..{engine.source_commit}",
+    )
+    wanted = set(paths)
+    pairs = defaultdict(int)
+    for commit in output.split("\0"):
+        touched = sorted({line for line in commit.splitlines() if line in wanted})
+        if len(touched) < 2 or len(touched) > MAX_CO_CHANGE_FILES:
+            continue
+        for position, first in enumerate(touched):
+            for second in touched[position + 1:]:
+                pairs[first, second] += 1
+    return pairs
+
+
+def _python_modules(paths):
+    # Every dotted suffix of at least two parts, so `src/app/models.py` answers to `app.models` too
+    modules = {}
+    for path in paths:
+        if not path.endswith(".py"):
+            continue
+        parts = path[:-3].split("/")
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        for start in range(len(parts)):
+            if len(parts) - start >= 2 or start == 0:
+                modules.setdefault(".".join(parts[start:]), path)
+    return modules
+
+
+def _python_imports(path, source, modules):
+    package = path.split("/")[:-1]
+    for from_module, names, plain in PY_IMPORT_RE.findall(source):
+        if plain:
+            candidates = [name.split(" as ")[0].strip() for name in plain.split(",")]
+        else:
+            level = len(from_module) - len(from_module.lstrip("."))
+            module = from_module.lstrip(".")
+            if level:
+                anchor = package[:len(package) - (level - 1)] if level > 1 else package
+                module = ".".join(anchor + ([module] if module else []))
+            names = [name.split(" as ")[0].strip("() \n") for name in names.split(",")]
+            candidates = [f"{module}.{name}" for name in names if name] + [module]
+        for candidate in candidates:
+            if candidate in modules:
+                yield modules[candidate]
+
+
+def _js_imports(path, source, paths):
+    directory = posixpath.dirname(path)
+    for specifier in JS_IMPORT_RE.findall(source):
+        target = posixpath.normpath(posixpath.join(directory, specifier))
+        for candidate in (target, *(target + ext for ext in JS_EXTENSIONS),
+                          *(f"{target}/index{ext}" for ext in JS_EXTENSIONS)):
+            if candidate in paths:
+                yield candidate
+                break
+
+
+def import_edges(engine, paths):
+    """(importer, imported) pairs among the changed Python and JS/TS files, read from the source branch."""
+    paths = set(paths)
+    modules = _python_modules(paths)
+    odb = engine.repo.odb
+    edges = set()
+    for path in sorted(paths):
+        change = engine.changes[path]
+        if change["status"] == "D" or not (path.endswith(".py") or path.endswith(JS_EXTENSIONS)):
+            continue
+        binsha = bytes.fromhex(change["sha"])
+        if odb.info(binsha).size > MAX_IMPORT_SCAN_BYTES:
+            continue
+        source = odb.stream(binsha).read().decode("utf-8", errors="replace")
+        if path.endswith(".py"):
+            targets = _python_imports(path, source, modules)
+        else:
+            targets = _js_imports(path, source, paths)
+        edges.update((path, target) for target in targets if target != path)
+    return edges
+
+
+def plan_split(engine, threshold, should_ignore=None, history=True, imports=False):
+    """
+    Partition the changes of a SplitEngine into an ordered list of chunks of
+    at most `threshold` changed lines, ready to be stacked bottom-up.
+
+    Files are first merged into groups along the strongest relations that
+    keep a group under the threshold (imports, then files committed
+    together, then files sharing a directory). Groups are then laid out so
+    that imported code comes before the code importing it, and packed
+    first-fit into the earliest chunk that has room and follows all of its
+    dependencies. Ignored and binary files count as zero lines. A single
+    file larger than the threshold gets a chunk of its own, flagged
+    `oversized`.
+    """
+    with engine.timed("plan: line counts"):
+        counts = read_line_counts(engine)
+    paths = sorted(engine.changes)
+    index = {path: position for position, path in enumerate(paths)}
+    ignored = [path for path in paths if should_ignore and should_ignore(path)]
+    ignored_set = set(ignored)
+    weights = [0 if path in ignored_set else sum(counts.get(path, (0, 0, False))[:2]) for path in paths]
+
+    edges = []
+    dependencies = set()
+    if imports:
+        with engine.timed("plan: imports"):
+            dependencies = import_edges(engine, paths)
+        edges.extend((IMPORT_EDGE, 0, index[importer], index[imported]) for importer, imported in dependencies)
+    if history:
+        with engine.timed("plan: history"):
+            pairs = co_change_pairs(engine, paths)
+        edges.extend((CO_CHANGE_EDGE, -count, index[first], index[second]) for (first, second), count in pairs.items())
+    # Chaining each directory's files in path order links the whole directory with linear edges
+    siblings = defaultdict(list)
+    for position, path in enumerate(paths):
+        siblings[posixpath.dirname(path)].append(position)
+    for positions in siblings.values():
+        edges.extend((DIRECTORY_EDGE, 0, first, second) for first, second in zip(positions, positions[1:]))
+
+    with engine.timed("plan: group"):
+        groups = _Groups(weights, threshold)
+        for _, _, first, second in sorted(edges):
+            groups.union(first, second)
+        members = defaultdict(list)
+        for position in range(len(paths)):
+            members[groups.find(position)].append(position)
+
+        # Group-level dependency graph; cycles are broken by path order
+        depends_on = defaultdict(set)
+        dependents = defaultdict(set)
+        for importer, imported in dependencies:
+            first, second = groups.find(index[importer]), groups.find(index[imported])
+            if first != second:
+                depends_on[first].add(second)
+                dependents[second].add(first)
+
+    with engine.timed("plan: pack"):
+        chunks = []
+        chunk_of = {}
+        pending = {root: len(depends_on[root]) for root in members}
+        ready = [(members[root][0], root) for root, count in pending.items() if count == 0]
+        heapq.heapify(ready)
+        while pending:
+            if not ready:
+                root = min(pending, key=lambda candidate: members[candidate][0])
+                ready.append((members[root][0], root))
+            _, root = heapq.heappop(ready)
+            if root not in pending:
+                continue
+            del pending[root]
+            weight = groups.weight[root]
+            earliest = max((chunk_of[dependency] for dependency in depends_on[root] if dependency in chunk_of), default=0)
+            target = next(
+                (position for position in range(earliest, len(chunks))
+                 if chunks[position]["lines"] + weight <= threshold),
+                None,
+            )
+            if target is None:
+                target = len(chunks)
+                chunks.append({"files": [], "lines": 0})
+            chunks[target]["files"].extend(paths[position] for position in members[root])
+            chunks[target]["lines"] += weight
+            chunk_of[root] = target
+            for dependent in dependents[root]:
+                if dependent in pending:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        heapq.heappush(ready, (members[dependent][0], dependent))
+
+    for chunk in chunks:
+        chunk["files"].sort()
+        chunk["oversized"] = chunk["lines"] > threshold
+    return {
+        "threshold": threshold,
+        "total_lines": sum(weights),
+        "chunks": chunks,
+        "ignored": ignored,
+        "binary": [path for path in paths if counts.get(path, (0, 0, False))[2]],
+    }
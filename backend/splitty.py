@@ -2,10 +2,12 @@
 
 import os
 import click
-from git import Repo
-import inquirer
+
+# GitPython, inquirer and the split modules are imported where they are used, so `git-barber --help`
+# and the first prompt don't wait for them
 
 def select_branch(repo, prompt, sort=None):
+    import inquirer
     branches = [head.name for head in repo.heads]
     if sort:
         branches = sort(branches)
@@ -17,31 +19,127 @@ def select_branch(repo, prompt, sort=None):
     answer = inquirer.prompt(question)
     return answer['branch']
 
+def status_marker(status):
+    # Map git status to our (N) or (M) tags
+    if status == "A":
+        return "(N)"
+    elif status == "M":
+        return "(M)"
+    return f"({status})"  # For any other statuses, just show the raw letter
+
 def get_changed_files(repo, base_branch, big_branch):
-    # Get diff with status letters (e.g., A for added, M for modified)
-    diff_output = repo.git.diff("--name-status", f'{base_branch}..{big_branch}')
+    # Get diff with status letters (e.g., A for added, M for modified); -z keeps paths with spaces whole
+    tokens = iter(repo.git.diff("--name-status", "-z", f'{base_branch}..{big_branch}').split("\0"))
     files = []
-    for line in diff_output.splitlines():
-        parts = line.split(maxsplit=1)
-        if len(parts) < 2:
+    for status in tokens:
+        if not status:
             continue
-        status, filename = parts
-        # Map git status to our (N) or (M) tags
-        if status == "A":
-            marker = "(N)"
-        elif status == "M":
-            marker = "(M)"
-        else:
-            marker = f"({status})"  # For any other statuses, just show the raw letter
-        files.append((filename, marker))
+        filename = next(tokens)
+        # Renames and copies (R100, C075) list the old path, then the new one
+        if status[0] in "RC":
+            filename = next(tokens)
+        files.append((filename, status_marker(status[0])))
     return files
 
+def change_marker(engine, filename, status):
+    marker = status_marker(status)
+    old_path = engine.changes[filename].get('old_path')
+    return f'{marker[:-1]} from {old_path})' if old_path else marker
+
+def warn_rename_limit(engine):
+    if engine.rename_limit_exceeded:
+        click.echo('⚠️  Too many files for full rename detection (renameLimit); '
+                   'only exact renames are kept together')
+
+def manual_split(repo, base_branch, big_branch, layers):
+    from file_picker import pick_files
+    from split_engine import SplitEngine
+
+    # Ask for new_sub_base_branch name
+    new_sub_base_branch = click.prompt('Enter a name for the new "sub-base" branch')
+
+    # Branches are built in a temporary index, so the working tree and HEAD stay as they are
+    with SplitEngine(repo, base_branch, big_branch) as engine:
+        # Get changed files with status markers
+        changed_files_info = [(filename, change_marker(engine, filename, status))
+                              for filename, status in engine.changed_files()]
+        warn_rename_limit(engine)
+        remaining_files_info = changed_files_info
+        plan = []
+
+        # Every layer but the last picks its files from what the layers below left over
+        for layer in range(1, layers):
+            if layer == 1:
+                branch_name = new_sub_base_branch
+                commit_message = f'copied base files from {big_branch}'
+            else:
+                branch_name = click.prompt(f'Enter a name for stacked branch #{layer}')
+                commit_message = f'copied {branch_name} files from {big_branch}'
+
+            # Pick files from a directory tree that only draws what fits on screen
+            selected_files = pick_files(remaining_files_info, f'Select files to copy to {branch_name}')
+            plan.append((branch_name, selected_files, commit_message))
+
+            selected = set(selected_files)
+            remaining_files_info = [(filename, marker) for filename, marker in remaining_files_info
+                                    if filename not in selected]
+
+            click.echo("--------------------------------")
+
+        # Ask for new_sub_feature_branch name
+        new_sub_feature_branch = click.prompt('Enter a name for the new sub-feature branch')
+
+        # Remaining files go to new_sub_feature_branch, at the top of the stack
+        remaining_files = [filename for filename, _ in remaining_files_info]
+        plan.append((new_sub_feature_branch, remaining_files, f'copied rest of files from {big_branch}'))
+
+        engine.split(plan)
+    return plan
+
+def auto_split(repo, base_branch, big_branch, imports):
+    from barber_config import ignore_matcher, load_team_config
+    from split_engine import SplitEngine
+    from split_planner import plan_split
+
+    config = load_team_config(repo.working_dir)
+    threshold = int(config['largeDiffThreshold'])
+    with SplitEngine(repo, base_branch, big_branch) as engine:
+        proposal = plan_split(engine, threshold, ignore_matcher(config['ignorePatterns']), imports=imports)
+        warn_rename_limit(engine)
+        chunks = proposal['chunks']
+        click.echo(f'📐 {proposal["total_lines"]} changed lines, at most {threshold} per branch '
+                   f'-> {len(chunks)} branches')
+        for number, chunk in enumerate(chunks, start=1):
+            warning = ' ⚠️  larger than the threshold' if chunk['oversized'] else ''
+            click.echo(f'  #{number}: {len(chunk["files"])} files, {chunk["lines"]} lines{warning}')
+            for filename in chunk['files']:
+                click.echo(f'      {filename}')
+        if not chunks or not click.confirm('Create these branches?', default=True):
+            click.echo('👌 No branches were created')
+            return None
+
+        prefix = click.prompt('Enter a name prefix for the new branches', default=f'{big_branch}-part')
+        plan = [
+            (f'{prefix}-{number}', chunk['files'], f'copied part {number}/{len(chunks)} of {big_branch}')
+            for number, chunk in enumerate(chunks, start=1)
+        ]
+        engine.split(plan)
+    return plan
+
 @click.command()
 @click.option('--repo-path', default=os.getcwd(), help='Path to the Git repository')
-def main(repo_path):
+@click.option('--layers', default=2, type=click.IntRange(min=2),
+              help='Number of stacked branches to split into (2 = sub-base + sub-feature)')
+@click.option('--auto', is_flag=True,
+              help='Plan the stack automatically, keeping each branch under largeDiffThreshold')
+@click.option('--imports', is_flag=True, help='With --auto, keep Python/JS files with the files they import')
+def main(repo_path, layers, auto, imports):
     """
     CLI tool to manage Git branches and files.
     """
+    import inquirer
+    from git import Repo
+
     try:
         repo = Repo(repo_path)
         if repo.bare:
@@ -67,68 +165,24 @@ def main(repo_path):
         big_branch = select_branch(repo, '💇‍♂️ Select the branch you want to split', sort=sort_big_branches)
         click.echo(f'Selected big branch: {big_branch}')
 
-        # Ask for new_sub_base_branch name
-        new_sub_base_branch = click.prompt('Enter a name for the new "sub-base" branch')
-
-        # Checkout base_branch and create new_sub_base_branch
-        repo.git.checkout(base_branch)
-        repo.git.checkout('-b', new_sub_base_branch)
-        click.echo(f'✅ Created and checked out new branch: {new_sub_base_branch}')
-
-        # Get changed files with status markers
-        changed_files_info = get_changed_files(repo, base_branch, big_branch)
-
-        # Build choices for inquirer: show file and marker; value is the file path
-        file_choices = [(f"{filename} {marker}", filename) for filename, marker in changed_files_info]
-
-        # Prompt user to select files to copy using inquirer
-        file_question = [
-            inquirer.Checkbox('selected_files',
-                             message=f'Select files to copy to {new_sub_base_branch}. (Press SPACE to select, ENTER to submit)',
-                             choices=file_choices)
-        ]
-        selected_files = inquirer.prompt(file_question)['selected_files']
-
-        # Checkout selected files from big_branch
-        for file in selected_files:
-            repo.git.checkout(big_branch, '--', file)
-
-        # Stage and commit selected files
-        repo.index.add(selected_files)
-        commit_message = f'copied base files from {big_branch}'
-        repo.index.commit(commit_message)
-        click.echo(f'✅ Committed selected files to new sub-base branch: {commit_message}')
-
-        click.echo("--------------------------------")
-
-        # Ask for new_sub_feature_branch name
-        new_sub_feature_branch = click.prompt('Enter a name for the new sub-feature branch')
-
-        # Create new_sub_feature_branch from new_sub_base_branch
-        repo.git.checkout(new_sub_base_branch)
-        repo.git.checkout('-b', new_sub_feature_branch)
-        click.echo(f'✅ Created and checked out new branch: {new_sub_feature_branch}')
-
-        # Copy remaining files to new_sub_feature_branch
-        all_files = {filename for filename, _ in changed_files_info}
-        remaining_files = all_files - set(selected_files)
-        for file in remaining_files:
-            repo.git.checkout(big_branch, '--', file)
-
-        # Stage and commit remaining files
-        repo.index.add(list(remaining_files))
-        commit_message = f'copied rest of files from {big_branch}'
-        repo.index.commit(commit_message)
-        click.echo(f'✅ Committed remaining files to new sub-feature branch: {commit_message}')
+        if auto:
+            plan = auto_split(repo, base_branch, big_branch, imports)
+            if plan is None:
+                return
+            layers = len(plan)
+        else:
+            plan = manual_split(repo, base_branch, big_branch, layers)
+        for branch_name, files, _ in plan:
+            click.echo(f'✅ Created branch {branch_name} with {len(files)} files')
 
         # Show a summary of the branches created
         click.echo('\nBranch Summary:')
         click.echo(f'- {base_branch}')
-        click.echo(f'  - {new_sub_base_branch} (NEW)')
-        click.echo(f'    - {new_sub_feature_branch} (NEW)')
+        for depth, (branch_name, _, _) in enumerate(plan, start=1):
+            click.echo(f'{"  " * depth}- {branch_name} (NEW)')
 
         # Ask the user if they want to push the branches
-        push_choice_text = 'Push both branches to origin/<name>'
+        push_choice_text = 'Push both branches to origin/<name>' if layers == 2 else 'Push all new branches to origin/<name>'
         push_question = [
             inquirer.List('push_choice',
                           message='Would you like to push the new branches to the remote?',
@@ -140,9 +194,9 @@ def main(repo_path):
         push_choice = inquirer.prompt(push_question)['push_choice']
 
         if push_choice == push_choice_text:
-            repo.git.push('origin', new_sub_base_branch)
-            repo.git.push('origin', new_sub_feature_branch)
-            click.echo('✅ Pushed both branches to origin')
+            # One atomic push: the remote gets every new branch or none of them
+            repo.git.push('--atomic', 'origin', *[branch_name for branch_name, _, _ in plan])
+            click.echo('✅ Pushed all new branches to origin')
         else:
             click.echo('👌 No branches were pushed')
 
@@ -5,55 +5,37 @@ import requests
 
 API_BASE = "http://localhost:17380"
 
+# One pooled keep-alive connection for every call instead of a new one per request
+session = requests.Session()
+
 def get_repo_branches(repo_path):
-    response = requests.get(f"{API_BASE}/branches", params={"repo_path": repo_path})
+    response = session.get(f"{API_BASE}/branches", params={"repo_path": repo_path})
     if response.status_code != 200:
         raise Exception(f"Error fetching branches: {response.json().get('detail', 'Unknown error')}")
     return response.json().get("branches", [])
 
-def get_diff(repo_path, base_branch, target_branch, detailed=False):
-    params = {"repo_path": repo_path, "base_branch": base_branch, "target_branch": target_branch, "detailed": detailed}
-    response = requests.get(f"{API_BASE}/diff", params=params)
+def get_diff(repo_path, base_branch, target_branch, detailed=False, ignore=True):
+    # ignore=False keeps the files matching the team's ignorePatterns, which /diff leaves out by default
+    params = {"repo_path": repo_path, "base_branch": base_branch, "target_branch": target_branch, "detailed": detailed,
+              "ignore": "true" if ignore else "false"}
+    response = session.get(f"{API_BASE}/diff", params=params)
     if response.status_code != 200:
         raise Exception(f"Error fetching diff: {response.json().get('detail', 'Unknown error')}")
     return response.json().get("diff", "")
 
-def checkout_branch(repo_path, branch):
-    response = requests.post(f"{API_BASE}/checkout", json={"repo_path": repo_path, "branch": branch})
-    if response.status_code != 200:
-        raise Exception(f"Error checking out branch {branch}: {response.json().get('detail', 'Unknown error')}")
-    return response.json()
-
-def create_branch(repo_path, new_branch):
-    response = requests.post(f"{API_BASE}/create-branch", json={"repo_path": repo_path, "new_branch": new_branch})
-    if response.status_code != 200:
-        raise Exception(f"Error creating branch {new_branch}: {response.json().get('detail', 'Unknown error')}")
-    return response.json()
-
-def copy_files(repo_path, source_branch, destination_branch, files):
+def split_branches(repo_path, base_branch, big_branch, sub_base_branch, sub_feature_branch, sub_base_files, push):
     payload = {
         "repo_path": repo_path,
-        "source_branch": source_branch,
-        "destination_branch": destination_branch,
-        "files": files
+        "base_branch": base_branch,
+        "big_branch": big_branch,
+        "sub_base_branch": sub_base_branch,
+        "sub_feature_branch": sub_feature_branch,
+        "sub_base_files": sub_base_files,
+        "push": push
     }
-    response = requests.post(f"{API_BASE}/copy-files", json=payload)
-    if response.status_code != 200:
-        raise Exception(f"Error copying files: {response.json().get('detail', 'Unknown error')}")
-    return response.json()
-
-def commit_changes(repo_path, message):
-    payload = {"repo_path": repo_path, "message": message}
-    response = requests.post(f"{API_BASE}/commit", json=payload)
-    if response.status_code != 200:
-        raise Exception(f"Error committing changes: {response.json().get('detail', 'Unknown error')}")
-    return response.json()
-
-def push_branch(repo_path, branch):
-    payload = {"repo_path": repo_path, "branch": branch}
-    response = requests.post(f"{API_BASE}/push", json=payload)
+    response = session.post(f"{API_BASE}/split", json=payload)
     if response.status_code != 200:
-        raise Exception(f"Error pushing branch {branch}: {response.json().get('detail', 'Unknown error')}")
+        raise Exception(f"Error splitting {big_branch}: {response.json().get('detail', 'Unknown error')}")
     return response.json()
 
 @click.command()
@@ -65,7 +47,7 @@ def main(repo_path):
     """
     try:
         # Get list of branches from the API
-        branches = get_repo_branches(repo_path)
+        branches = [branch["name"] for branch in get_repo_branches(repo_path)]
         if not branches:
             click.echo('No branches found in the repository.')
             return
@@ -99,19 +81,15 @@ def main(repo_path):
         # Ask for new sub-base branch name
         new_sub_base_branch = click.prompt('Enter a name for the new "sub-base" branch')
 
-        # Checkout the base branch and create the new sub-base branch using API endpoints
-        checkout_branch(repo_path, base_branch)
-        create_branch(repo_path, new_sub_base_branch)
-        click.echo(f'✅ Created and checked out new branch: {new_sub_base_branch}')
-
         # Get changed files (diff) between base_branch and big_branch
-        diff_output = get_diff(repo_path, base_branch, big_branch, detailed=False)
+        diff_output = get_diff(repo_path, base_branch, big_branch, detailed=False, ignore=False)
         changed_files_info = []
         for line in diff_output.splitlines():
-            parts = line.split(maxsplit=1)
+            # Renames and copies list "R100<TAB>old<TAB>new"; the new path is what gets split
+            parts = line.split("\t")
             if len(parts) < 2:
                 continue
-            status, filename = parts
+            status, filename = parts[0][:1], parts[-1]
             if status == "A":
                 marker = "(N)"
             elif status == "M":
@@ -129,42 +107,12 @@ def main(repo_path):
         file_answer = inquirer.prompt(file_question)
         selected_files = file_answer.get('selected_files', [])
 
-        # Use API to copy selected files from big_branch to new_sub_base_branch and commit them
-        if selected_files:
-            copy_files(repo_path, big_branch, new_sub_base_branch, selected_files)
-            commit_msg = f"copied base files from {big_branch}"
-            commit_changes(repo_path, commit_msg)
-            click.echo(f"✅ Committed selected files to new sub-base branch: {commit_msg}")
-        else:
-            click.echo('No files selected for sub-base branch copy.')
-
         click.echo('--------------------------------')
 
         # Ask for new sub-feature branch name
         new_sub_feature_branch = click.prompt('Enter a name for the new sub-feature branch')
 
-        # Create new sub-feature branch from new_sub_base_branch via API
-        create_branch(repo_path, new_sub_feature_branch)
-        click.echo(f'✅ Created and checked out new branch: {new_sub_feature_branch}')
-
-        # Determine remaining files (those not selected for sub-base branch)
-        all_files = {filename for filename, _ in changed_files_info}
-        remaining_files = list(all_files - set(selected_files))
-        if remaining_files:
-            copy_files(repo_path, big_branch, new_sub_feature_branch, remaining_files)
-            commit_msg = f"copied rest of files from {big_branch}"
-            commit_changes(repo_path, commit_msg)
-            click.echo(f"✅ Committed remaining files to new sub-feature branch: {commit_msg}")
-        else:
-            click.echo('No remaining files to copy for sub-feature branch.')
-
-        # Display branch summary
-        click.echo('\nBranch Summary:')
-        click.echo(f"- {base_branch}")
-        click.echo(f"  - {new_sub_base_branch} (NEW)")
-        click.echo(f"    - {new_sub_feature_branch} (NEW)")
-
-        # Ask user if they want to push the branches
+        # Ask up front whether to push, since the server runs the whole split as one unit
         push_choice_text = f"Push both branches to origin/{new_sub_feature_branch}"
         push_question = [
             inquirer.List('push_choice',
@@ -172,12 +120,25 @@ def main(repo_path):
                            choices=[push_choice_text, "Don't push anything please"])
         ]
         push_answer = inquirer.prompt(push_question)
-        if push_answer.get('push_choice') == push_choice_text:
-            push_branch(repo_path, new_sub_base_branch)
-            push_branch(repo_path, new_sub_feature_branch)
+        push = push_answer.get('push_choice') == push_choice_text
+
+        # One round trip builds both branches (and pushes them); nothing is left behind on failure
+        result = split_branches(repo_path, base_branch, big_branch, new_sub_base_branch, new_sub_feature_branch,
+                                selected_files, push)
+        for branch in result["branches"]:
+            click.echo(f"✅ Created branch {branch['name']} with {branch['files']} files")
+
+        # Display branch summary
+        click.echo('\nBranch Summary:')
+        click.echo(f"- {base_branch}")
+        click.echo(f"  - {new_sub_base_branch} (NEW)")
+        click.echo(f"    - {new_sub_feature_branch} (NEW)")
+
+        if push:
             click.echo('✅ Pushed both branches to origin')
         else:
             click.echo('👌 No branches were pushed')
+        click.echo(f"⏱️  Split took {result['elapsed_ms']} ms")
 
     except Exception as e:
         click.echo(f'Error: {e}')
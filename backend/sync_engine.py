@@ -0,0 +1,207 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from git.exc import GitCommandError
+
+from utils.metrics import metrics
+
+
+class StackSyncEngine:
+    """
+    Cascades merges down a branch tree without touching the user's working tree.
+
+    Every parent is merged into each of its children (`Merged <parent> into
+    <child>`, like `git-barber sync`), parents before children. Sibling
+    subtrees are independent, so each child is handed to a worker as soon as
+    its parent is done. Merges are computed with `git merge-tree --write-tree`
+    and committed with commit-tree; on git older than 2.38 they run in a
+    disposable `git worktree` instead. A conflict stops only the subtree below
+    it: the conflicted branch is left as it was and its descendants are
+    reported as skipped.
+
+    Branch refs are moved with a compare-and-swap update-ref, except for
+    branches checked out in some worktree, which are fast-forwarded there so
+    the checkout follows along.
+    """
+
+    def __init__(self, repo, branch_tree, max_workers=4, on_event=None):
+        self.repo = repo
+        self.branch_tree = branch_tree
+        self.max_workers = max_workers
+        self.on_event = on_event or (lambda event: None)
+        self.use_merge_tree = repo.git.version_info >= (2, 38)
+        self._lock = threading.Lock()
+        self.results = {}
+
+    def sync(self, start_branch, pull=False):
+        """Merge `start_branch` down through every branch below it; returns the per-branch results."""
+        started = time.perf_counter()
+        subtree = self._subtree(start_branch)
+        if pull:
+            self._pull([start_branch, *[child for _, child in subtree]])
+        checked_out = self._checked_out_branches()
+        pending = {}
+        finished = threading.Event()
+
+        def done(branch):
+            with self._lock:
+                pending.pop(branch, None)
+                if not pending:
+                    finished.set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="git-barber-sync") as executor:
+            def schedule(parent):
+                children = [child for edge_parent, child in subtree if edge_parent == parent]
+                with self._lock:
+                    for child in children:
+                        pending[child] = True
+                for child in children:
+                    executor.submit(merge_child, parent, child)
+
+            def merge_child(parent, child):
+                try:
+                    result = self._merge(parent, child, checked_out.get(child))
+                except Exception as e:
+                    result = {"status": "failed", "detail": str(getattr(e, "stderr", "") or e).strip()}
+                self._report(child, parent, result)
+                if result["status"] in ("merged", "up-to-date"):
+                    schedule(child)
+                else:
+                    self._skip_below(child)
+                done(child)
+
+            schedule(start_branch)
+            with self._lock:
+                if not pending:
+                    finished.set()
+            finished.wait()
+
+        summary = {"type": "summary", "start_branch": start_branch,
+                   "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+        for status in ("merged", "up-to-date", "conflict", "skipped", "failed"):
+            summary[status] = [branch for branch, result in self.results.items() if result["status"] == status]
+        self.on_event(summary)
+        return summary
+
+    def _subtree(self, start_branch):
+        # (parent, child) edges reachable from start_branch, each branch once
+        edges, seen, stack = [], {start_branch}, [start_branch]
+        while stack:
+            parent = stack.pop()
+            for child in self.branch_tree.get(parent, []):
+                if child not in seen:
+                    seen.add(child)
+                    edges.append((parent, child))
+                    stack.append(child)
+        return edges
+
+    def _skip_below(self, branch):
+        for parent, child in self._subtree(branch):
+            self._report(child, parent, {"status": "skipped", "detail": f"{branch} was not synced"})
+
+    def _report(self, branch, parent, result):
+        event = {"type": "branch", "branch": branch, "parent": parent, **result}
+        with self._lock:
+            self.results[branch] = event
+        self.on_event(event)
+
+    def _pull(self, branches):
+        # One fetch for the whole stack, then fast-forward the branches that are strictly behind origin
+        returncode, _, stderr = self._git("fetch", "origin")
+        if returncode != 0:
+            self.on_event({"type": "pull", "status": "failed", "detail": stderr.strip()})
+            return
+        checked_out = self._checked_out_branches()
+        for branch in branches:
+            local, remote = self._rev_parse(f"refs/heads/{branch}"), self._rev_parse(f"refs/remotes/origin/{branch}")
+            if not remote or local == remote:
+                status = "up-to-date"
+            elif self._git("merge-base", "--is-ancestor", local, remote)[0] == 0:
+                self._move_branch(branch, local, remote, checked_out.get(branch))
+                status = "fast-forwarded"
+            else:
+                status = "diverged"
+            self.on_event({"type": "pull", "branch": branch, "status": status})
+
+    def _merge(self, parent, child, worktree):
+        parent_sha, child_sha = self._rev_parse(f"refs/heads/{parent}"), self._rev_parse(f"refs/heads/{child}")
+        if not parent_sha or not child_sha:
+            return {"status": "failed", "detail": f"Unknown branch: {parent if not parent_sha else child}"}
+        if self._git("merge-base", "--is-ancestor", parent_sha, child_sha)[0] == 0:
+            return {"status": "up-to-date", "commit": child_sha}
+        message = f"Merged {parent} into {child}"
+        if self.use_merge_tree:
+            commit, conflicts = self._merge_with_merge_tree(parent_sha, child_sha, message)
+        else:
+            commit, conflicts = self._merge_in_worktree(parent_sha, child_sha, message)
+        if conflicts is not None:
+            return {"status": "conflict", "conflicts": conflicts}
+        self._move_branch(child, child_sha, commit, worktree)
+        return {"status": "merged", "commit": commit}
+
+    def _merge_with_merge_tree(self, parent_sha, child_sha, message):
+        returncode, stdout, stderr = self._git("merge-tree", "--write-tree", "-z", "--name-only", child_sha, parent_sha)
+        if returncode not in (0, 1):
+            raise GitCommandError(["git", "merge-tree"], returncode, stderr)
+        tree, *rest = stdout.split("\0")
+        if returncode == 1:
+            # Conflicted paths come next, terminated by an empty entry
+            conflicts = rest[:rest.index("")] if "" in rest else rest
+            return None, sorted(set(conflicts))
+        commit = self._check("commit-tree", tree, "-p", child_sha, "-p", parent_sha, "-m", message).strip()
+        return commit, None
+
+    def _merge_in_worktree(self, parent_sha, child_sha, message):
+        worktree = tempfile.mkdtemp(prefix="git-barber-sync-")
+        try:
+            self._check("worktree", "add", "--detach", worktree, child_sha)
+            returncode, _, _ = self._git("merge", "--no-ff", "-m", message, parent_sha, cwd=worktree)
+            if returncode != 0:
+                conflicts = self._check("diff", "--name-only", "--diff-filter=U", cwd=worktree).split()
+                self._git("merge", "--abort", cwd=worktree)
+                return None, conflicts
+            return self._check("rev-parse", "HEAD", cwd=worktree).strip(), None
+        finally:
+            self._git("worktree", "remove", "--force", worktree)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    def _move_branch(self, branch, old_sha, new_sha, worktree):
+        if worktree:
+            # Refuses, rather than clobbering, if local changes would be overwritten
+            self._check("merge", "--ff-only", new_sha, cwd=worktree)
+        else:
+            self._check("update-ref", f"refs/heads/{branch}", new_sha, old_sha)
+
+    def _checked_out_branches(self):
+        branches, path = {}, None
+        for line in self._check("worktree", "list", "--porcelain").splitlines():
+            if line.startswith("worktree "):
+                path = line[len("worktree "):]
+            elif line.startswith("branch refs/heads/"):
+                branches[line[len("branch refs/heads/"):]] = path
+        return branches
+
+    def _rev_parse(self, ref):
+        returncode, stdout, _ = self._git("rev-parse", "--verify", "-q", f"{ref}^{{commit}}")
+        return stdout.strip() if returncode == 0 else None
+
+    def _check(self, *args, cwd=None):
+        returncode, stdout, stderr = self._git(*args, cwd=cwd)
+        if returncode != 0:
+            raise GitCommandError(["git", *args], returncode, stderr)
+        return stdout
+
+    def _git(self, *args, cwd=None):
+        started = time.perf_counter()
+        result = subprocess.run(
+            ["git", *args], cwd=cwd or self.repo.working_dir, env=dict(os.environ, GIT_TERMINAL_PROMPT="0"),
+            capture_output=True, text=True, encoding="utf-8",
+        )
+        metrics.observe_git(args, time.perf_counter() - started, len(result.stdout), result.returncode,
+                            cwd or self.repo.working_dir)
+        return result.returncode, result.stdout, result.stderr
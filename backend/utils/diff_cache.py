@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value) -> int:
+    """Rough in-memory footprint of a parsed diff, good enough for budgeting."""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(item) for item in value)
+    return 28
+
+
+class DiffCache:
+    """
+    Memory-bounded LRU of diff results keyed by resolved commit SHAs.
+
+    Keys only ever name immutable commits, so entries never go stale and there
+    is no invalidation; the byte budget is the only thing that removes them.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (value, size), most recently used last
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int = None):
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+diff_cache = DiffCache(max_bytes=int(os.environ.get("GIT_BARBER_DIFF_CACHE_BYTES", str(128 * 1024 * 1024))))
+
+
+def get_diff_cache() -> DiffCache:
+    """FastAPI dependency returning the shared diff cache."""
+    return diff_cache
@@ -0,0 +1,360 @@
+import asyncio
+import re
+import time
+
+from utils.metrics import metrics
+
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+LINE_TYPES = {"+": "added", "-": "deleted", " ": "context"}
+# Lines without a diff prefix (e.g. "\ No newline at end of file") are kept whole under this type
+RAW_LINE = "\\"
+
+
+class _Hunk:
+    __slots__ = ("header", "types", "texts")
+
+    def __init__(self, header):
+        self.header = header
+        self.types = []
+        self.texts = []
+
+    def to_compact(self):
+        match = HUNK_HEADER_RE.match(self.header)
+        old_start, old_count, new_start, new_count = match.groups() if match else (0, 0, 0, 0)
+        return {
+            "hunk_header": self.header,
+            "old_start": int(old_start),
+            "old_count": 1 if old_count is None else int(old_count),
+            "new_start": int(new_start),
+            "new_count": 1 if new_count is None else int(new_count),
+            "types": "".join(self.types),
+            # Lines never contain a newline, so joining on one keeps them apart
+            "text": "\n".join(self.texts),
+        }
+
+
+# Lines between `diff --git` and the first hunk that carry no hunk content
+EXTENDED_HEADERS = ("new file mode", "deleted file mode", "old mode", "new mode", "similarity index",
+                    "dissimilarity index", "rename from ", "rename to ", "copy from ", "copy to ", "index ",
+                    "--- ", "+++ ")
+
+
+C_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, '"': 34, "\\": 92}
+
+
+def unquote_path(path):
+    """A path as git prints it in patch headers: C-quoted when it has special characters (core.quotePath)."""
+    if not path.startswith('"') or not path.endswith('"') or len(path) < 2:
+        return path
+    raw = bytearray()
+    text = path[1:-1]
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char != "\\" or i + 1 == len(text):
+            raw += char.encode("utf-8")
+            i += 1
+        elif text[i + 1] in C_ESCAPES:
+            raw.append(C_ESCAPES[text[i + 1]])
+            i += 2
+        else:
+            # Octal escape of one byte of a UTF-8 sequence, e.g. \303\251
+            raw.append(int(text[i + 1:i + 4], 8) & 0xFF)
+            i += 4
+    return raw.decode("utf-8", errors="replace")
+
+
+def header_path(line):
+    """
+    The new path from a `diff --git a/<old> b/<new>` header. Unquoted paths
+    may contain spaces, so when the two sides are the same file the header
+    is split down the middle; a renamed file's path is fixed up from its
+    `rename to` line.
+    """
+    rest = line[len("diff --git "):]
+    if rest.endswith('"'):
+        # Inside a quoted path a double quote is always escaped, so ' "' starts the second one
+        return unquote_path(rest[rest.rfind(' "') + 1:])[2:]
+    half = len(rest) // 2
+    if len(rest) % 2 and rest[half] == " " and rest[2:half] == rest[half + 3:]:
+        return rest[half + 3:]
+    separator = rest.rfind(" b/")
+    return rest[separator + 3:] if separator >= 0 else "unknown"
+
+
+def patch_path(path):
+    """The path of a `---`/`+++` line; git ends it with a tab when it contains a space."""
+    return unquote_path(path.rstrip("\t"))
+
+
+class _FileDiff:
+    __slots__ = ("file", "status", "lines_added", "lines_deleted", "old_file", "new_file", "hunks", "size",
+                 "truncated")
+
+    def __init__(self, file):
+        self.file = file
+        self.status = "modified"
+        self.lines_added = 0
+        self.lines_deleted = 0
+        self.old_file = None
+        self.new_file = None
+        self.hunks = []
+        # Bytes of hunk lines seen so far, for the parser's max_file_bytes
+        self.size = 0
+        self.truncated = None
+
+    def to_compact(self):
+        record = {"file": self.file, "lines_added": self.lines_added, "lines_deleted": self.lines_deleted,
+                  "changed_hunks": [hunk.to_compact() for hunk in self.hunks], "status": self.status}
+        if self.old_file is not None:
+            record["old_file"] = self.old_file
+        if self.new_file is not None:
+            record["new_file"] = self.new_file
+        if self.truncated is not None:
+            record["truncated"] = self.truncated
+        return record
+
+
+class FileDiffParser:
+    """
+    Push parser for unified diff output: `feed()` one line at a time and get
+    back each file record as soon as the next `diff --git` header shows it is
+    complete; `finish()` returns the last one. Only one file is held at a time.
+
+    Records come out in the compact form: each hunk keeps its lines as one
+    newline-joined `text` plus a `types` string with one character per line
+    (`+`, `-`, space, or a backslash for a line kept verbatim), and the line
+    numbers from its `@@` header. expand_file_diff() turns one into the
+    original per-line dicts.
+
+    A file whose hunk lines add up to more than `max_file_bytes` (if set)
+    keeps its line counts but loses its hunks, and is marked
+    `"truncated": "bytes"`.
+    """
+
+    def __init__(self, max_file_bytes=0):
+        self.max_file_bytes = max_file_bytes
+        self.current_file = None
+        self.current_hunk = None
+
+    def feed(self, line):
+        current_file = self.current_file
+        if line.startswith("diff --git"):
+            completed = self.finish()
+            self.current_file = _FileDiff(header_path(line))
+            return completed
+        if current_file is None:
+            return None
+        if current_file.truncated is not None:
+            # Past the byte cap lines are only counted
+            prefix = line[:1]
+            if prefix == "+":
+                current_file.lines_added += 1
+            elif prefix == "-":
+                current_file.lines_deleted += 1
+            return None
+        if line.startswith("@@"):
+            self.current_hunk = _Hunk(line)
+            current_file.hunks.append(self.current_hunk)
+        elif self.current_hunk is None and line.startswith(EXTENDED_HEADERS):
+            # Only before the first hunk, where a "---" or "+++" can't be a removed or added line
+            if line.startswith("new file mode"):
+                current_file.status = "added"
+            elif line.startswith("deleted file mode"):
+                current_file.status = "deleted"
+            elif line.startswith(("rename from ", "copy from ")):
+                current_file.status = "renamed" if line.startswith("rename") else "copied"
+                current_file.old_file = unquote_path(line.split(" ", 2)[2])
+            elif line.startswith(("rename to ", "copy to ")):
+                current_file.new_file = current_file.file = unquote_path(line.split(" ", 2)[2])
+            elif line.startswith("+++ "):
+                path = patch_path(line[4:])
+                if path != "/dev/null":
+                    current_file.file = path[2:]
+        else:
+            if self.max_file_bytes:
+                current_file.size += len(line) + 1
+                if current_file.size > self.max_file_bytes:
+                    current_file.truncated = "bytes"
+                    current_file.hunks = []
+                    self.current_hunk = None
+                    return self.feed(line)
+            hunk = self.current_hunk
+            if hunk is None:
+                hunk = self.current_hunk = _Hunk("")
+                current_file.hunks.append(hunk)
+            prefix = line[:1]
+            if prefix in LINE_TYPES:
+                hunk.types.append(prefix)
+                hunk.texts.append(line[1:])
+                if prefix == "+":
+                    current_file.lines_added += 1
+                elif prefix == "-":
+                    current_file.lines_deleted += 1
+            else:
+                hunk.types.append(RAW_LINE)
+                hunk.texts.append(line)
+        return None
+
+    def feed_lines(self, lines):
+        """feed() every line of a batch, returning the records completed along the way."""
+        completed = []
+        for line in lines:
+            record = self.feed(line)
+            if record:
+                completed.append(record)
+        return completed
+
+    def finish(self):
+        completed = self.current_file
+        self.current_file = None
+        self.current_hunk = None
+        return completed.to_compact() if completed else None
+
+
+def expand_file_diff(record):
+    """The per-line form of a compact file record: `lines` of {"text", "line_type"} dicts in each hunk."""
+    hunks = []
+    for hunk in record["changed_hunks"]:
+        texts = hunk["text"].split("\n") if hunk["types"] else []
+        hunks.append({
+            "hunk_header": hunk["hunk_header"],
+            "lines": [{"text": text, "line_type": LINE_TYPES.get(line_type, "context")}
+                      for line_type, text in zip(hunk["types"], texts)],
+        })
+    return {**record, "changed_hunks": hunks}
+
+
+def format_file_diff(record, format):
+    return record if format == "compact" else expand_file_diff(record)
+
+
+def format_detailed_diff(diff_output, format):
+    if format == "compact":
+        return dict(diff_output, format="compact")
+    return dict(diff_output, changed_files=[expand_file_diff(record) for record in diff_output["changed_files"]])
+
+
+def iter_file_diffs(lines, max_file_bytes=0):
+    """Parse unified diff lines into one record per changed file, yielding each as soon as it is complete."""
+    parser = FileDiffParser(max_file_bytes)
+    for line in lines:
+        completed = parser.feed(line)
+        if completed:
+            yield completed
+    completed = parser.finish()
+    if completed:
+        yield completed
+
+
+async def aiter_file_diffs(batches, max_file_bytes=0, kind="stream"):
+    """
+    Async counterpart of iter_file_diffs() for batches of lines from an async
+    iterator such as GitExecutor.iter_line_batches(). Each batch is parsed on
+    a worker thread, so a big diff never holds up the event loop; `kind`
+    labels the parse metrics.
+    """
+    parser = FileDiffParser(max_file_bytes)
+    # Parse time only, not the time spent waiting on git for the next batch
+    parse_seconds = 0.0
+    input_bytes = 0
+
+    def parse(batch):
+        started = time.perf_counter()
+        completed = parser.feed_lines(batch)
+        return completed, time.perf_counter() - started, sum(len(line) + 1 for line in batch)
+
+    try:
+        async for batch in batches:
+            completed, seconds, size = await asyncio.to_thread(parse, batch)
+            parse_seconds += seconds
+            input_bytes += size
+            for record in completed:
+                yield record
+        completed = parser.finish()
+        if completed:
+            yield completed
+    finally:
+        metrics.observe_parse(kind, parse_seconds, input_bytes)
+
+
+def parse_file_diffs(lines):
+    """Every per-file record of a diff, as a list."""
+    with metrics.parse_timer("file_diffs", sum(len(line) + 1 for line in lines)):
+        return list(iter_file_diffs(lines))
+
+
+def parse_detailed_diff(lines, max_file_bytes=0):
+    total_added = 0
+    total_deleted = 0
+    changed_files = []
+    with metrics.parse_timer("detailed", sum(len(line) + 1 for line in lines)):
+        for file_diff in iter_file_diffs(lines, max_file_bytes):
+            total_added += file_diff["lines_added"]
+            total_deleted += file_diff["lines_deleted"]
+            changed_files.append(file_diff)
+    return {
+        "lines_added": total_added,
+        "lines_deleted": total_deleted,
+        "changed_files": changed_files
+    }
+
+
+async def acollect_detailed_diff(batches, max_file_bytes=0):
+    """
+    parse_detailed_diff() for batches of lines from an async iterator such as
+    GitExecutor.iter_line_batches(): only the parsed records are kept, never
+    the whole patch text, and the parsing happens on worker threads.
+    """
+    total_added = 0
+    total_deleted = 0
+    changed_files = []
+    async for file_diff in aiter_file_diffs(batches, max_file_bytes, kind="detailed"):
+        total_added += file_diff["lines_added"]
+        total_deleted += file_diff["lines_deleted"]
+        changed_files.append(file_diff)
+    return {
+        "lines_added": total_added,
+        "lines_deleted": total_deleted,
+        "changed_files": changed_files
+    }
+
+
+FILE_STATUSES = {"A": "added", "D": "deleted", "M": "modified", "R": "renamed", "C": "copied", "T": "modified"}
+
+
+def parse_file_index(output):
+    """
+    Parse `git diff --raw --numstat -z` output into one entry per changed file.
+
+    The raw section supplies the status letter (and both paths for renames and
+    copies); the numstat section that follows lists the same files in the same
+    order with their added/deleted line counts, or `-` for binary files.
+    """
+    with metrics.parse_timer("file_index", len(output)):
+        return _parse_file_index(output)
+
+
+def _parse_file_index(output):
+    tokens = output.split("\0")
+    files = []
+    position = 0
+    while position < len(tokens) and tokens[position].startswith(":"):
+        status_letter = tokens[position].split()[-1][0]
+        entry = {"file": tokens[position + 1], "status": FILE_STATUSES.get(status_letter, "modified")}
+        position += 2
+        if status_letter in "RC":
+            entry["old_file"] = entry["file"]
+            entry["file"] = tokens[position]
+            position += 1
+        files.append(entry)
+
+    for entry in files:
+        added, deleted, path = tokens[position].split("\t", 2)
+        # Renames and copies leave the path empty and list both names as separate tokens
+        position += 1 if path else 3
+        entry["binary"] = added == "-"
+        entry["lines_added"] = 0 if entry["binary"] else int(added)
+        entry["lines_deleted"] = 0 if entry["binary"] else int(deleted)
+    return files
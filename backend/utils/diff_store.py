@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+DEFAULT_STORE_PATH = os.path.join("~", ".git-barber", "diff-store.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS merge_bases (
+    repo TEXT NOT NULL,
+    base_sha TEXT NOT NULL,
+    target_sha TEXT NOT NULL,
+    merge_base TEXT NOT NULL,
+    PRIMARY KEY (repo, base_sha, target_sha)
+);
+CREATE TABLE IF NOT EXISTS diffs (
+    key TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS diffs_last_access ON diffs (last_access);
+CREATE INDEX IF NOT EXISTS diffs_repo ON diffs (repo);
+"""
+
+
+def encode_payload(value) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_payload(payload: bytes):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+class DiffStore:
+    """
+    SQLite-backed cache of merge-bases and diff results that survives restarts.
+
+    Like the in-memory DiffCache, every key names immutable commits, so rows
+    are only ever removed by the size budget (least recently read first) or an
+    explicit purge.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def diff_key(repo_path, base_sha, target_sha, mode, detailed, variant=None) -> str:
+        # `detailed` may also name the kind of result ("compact", "numstat"), which must not share a key
+        kind = detailed if isinstance(detailed, str) else "1" if detailed else "0"
+        parts = [repo_path, base_sha, target_sha, mode, kind]
+        if variant is not None:
+            parts.append(json.dumps(variant, separators=(",", ":")))
+        return "\0".join(parts)
+
+    def get_merge_base(self, repo_path, base_sha, target_sha):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT merge_base FROM merge_bases WHERE repo = ? AND base_sha = ? AND target_sha = ?",
+                (repo_path, base_sha, target_sha),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_merge_base(self, repo_path, base_sha, target_sha, merge_base):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO merge_bases (repo, base_sha, target_sha, merge_base) VALUES (?, ?, ?, ?)",
+                (repo_path, base_sha, target_sha, merge_base),
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM diffs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE diffs SET last_access = ? WHERE key = ?", (time.time(), key))
+        return decode_payload(row[0])
+
+    def put(self, repo_path, key, value):
+        payload = encode_payload(value)
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO diffs (key, repo, payload, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, repo_path, payload, len(payload), time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM diffs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM diffs ORDER BY last_access").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM diffs WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM diffs").fetchone()
+            merge_bases = self._conn.execute("SELECT COUNT(*) FROM merge_bases").fetchone()[0]
+            repos = self._conn.execute("SELECT repo, COUNT(*), SUM(size) FROM diffs GROUP BY repo").fetchall()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "merge_bases": merge_bases,
+            "repos": [{"repo_path": repo, "entries": count, "bytes": size} for repo, count, size in repos],
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def purge(self, repo_path: str = None) -> dict:
+        with self._lock:
+            if repo_path is None:
+                diffs = self._conn.execute("DELETE FROM diffs").rowcount
+                merge_bases = self._conn.execute("DELETE FROM merge_bases").rowcount
+            else:
+                diffs = self._conn.execute("DELETE FROM diffs WHERE repo = ?", (repo_path,)).rowcount
+                merge_bases = self._conn.execute("DELETE FROM merge_bases WHERE repo = ?", (repo_path,)).rowcount
+            self._conn.execute("VACUUM")
+        return {"diffs": diffs, "merge_bases": merge_bases}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_default_store():
+    # Opt-in: GIT_BARBER_DIFF_STORE=on uses DEFAULT_STORE_PATH, any other value is the database path
+    path = os.environ.get("GIT_BARBER_DIFF_STORE", "")
+    if path.lower() in ("", "0", "off", "false", "none"):
+        return None
+    if path.lower() in ("1", "on", "true", "yes"):
+        path = DEFAULT_STORE_PATH
+    max_bytes = int(os.environ.get("GIT_BARBER_DIFF_STORE_BYTES", str(512 * 1024 * 1024)))
+    try:
+        return DiffStore(path, max_bytes=max_bytes)
+    except (OSError, sqlite3.Error):
+        # An unwritable home directory shouldn't stop the API from starting
+        return None
+
+
+diff_store = open_default_store()
+
+
+def get_diff_store():
+    """FastAPI dependency returning the persistent diff store, or None when disabled."""
+    return diff_store
+
+
+if __name__ == "__main__":
+    # python -m utils.diff_store [stats|purge] [repo_path]
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if diff_store is None:
+        sys.exit("The persistent diff store is off; set GIT_BARBER_DIFF_STORE=on or to a database path")
+    if command == "stats":
+        print(json.dumps(diff_store.stats(), indent=2))
+    elif command == "purge":
+        repo = os.path.realpath(os.path.expanduser(sys.argv[2])) if len(sys.argv) > 2 else None
+        print(json.dumps(diff_store.purge(repo), indent=2))
+    else:
+        sys.exit(f"Unknown command {command!r}. Use 'stats' or 'purge'.")
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from git.exc import GitCommandError
+
+from utils.metrics import metrics
+from utils.repo_pool import resolve_repo_path
+
+# How often a running command checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.25
+# Longest single line iter_line_batches() accepts (asyncio's default is 64 KiB)
+MAX_LINE_BYTES = 64 * 1024 * 1024
+READ_CHUNK_BYTES = 256 * 1024
+
+
+class GitTimeoutError(GitCommandError):
+    """The git command ran longer than its timeout and was killed."""
+
+
+class GitCancelledError(GitCommandError):
+    """The client disconnected, so the git command was killed."""
+
+
+class GitExecutor:
+    """
+    Runs git as asyncio subprocesses so waiting on git never holds a worker thread.
+
+    At most `max_concurrency` commands run at once across all repositories and
+    at most `per_repo` per repository; the rest wait their turn without
+    blocking the event loop. Commands are killed when they exceed their
+    timeout or, if given the request, when its client disconnects.
+    """
+
+    def __init__(self, max_concurrency: int = 32, per_repo: int = 8, timeout: float = 120.0):
+        self.max_concurrency = max_concurrency
+        self.per_repo = per_repo
+        self.timeout = timeout
+        # Semaphores belong to an event loop, so keep one set per loop
+        self._limits = weakref.WeakKeyDictionary()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.total_ms = 0.0
+        self._reaping = set()
+
+    async def run(self, repo_path: str, *args, input: bytes = None, timeout: float = None, request=None,
+                  warnings: list = None) -> str:
+        """
+        Run `git <args>` in the repository and return its stdout; raises
+        GitCommandError on a non-zero exit. A successful command's stderr is
+        appended to `warnings`, if given.
+        """
+        command = ["git", *args]
+        timeout = self.timeout if timeout is None else timeout
+        async with self._slot(repo_path):
+            started = time.perf_counter()
+            process = await self._spawn(repo_path, command, stdin=asyncio.subprocess.PIPE if input is not None else None)
+            communicate = asyncio.ensure_future(process.communicate(input))
+            watcher = asyncio.ensure_future(self._wait_for_disconnect(request)) if request is not None else None
+            # Killed commands are recorded with exit status -1
+            exit_status, output_bytes = -1, 0
+            try:
+                done, _ = await asyncio.wait(
+                    [task for task in (communicate, watcher) if task is not None],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if communicate not in done:
+                    self._kill(process)
+                    await communicate
+                    if watcher is not None and watcher in done:
+                        self.cancelled += 1
+                        raise GitCancelledError(command, -1, "client disconnected")
+                    self.timeouts += 1
+                    raise GitTimeoutError(command, -1, f"timed out after {timeout}s")
+                stdout, stderr = communicate.result()
+                exit_status, output_bytes = process.returncode, len(stdout)
+            except asyncio.CancelledError:
+                communicate.cancel()
+                self._kill(process)
+                self.cancelled += 1
+                raise
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+                elapsed = time.perf_counter() - started
+                self.total_ms += elapsed * 1000
+                metrics.observe_git(args, elapsed, output_bytes, exit_status, repo_path)
+            if process.returncode != 0:
+                self.failed += 1
+                raise GitCommandError(command, process.returncode, stderr.decode("utf-8", "replace"))
+            self.completed += 1
+            if warnings is not None and stderr:
+                warnings.append(stderr.decode("utf-8", "replace"))
+            return stdout.decode("utf-8", "replace")
+
+    async def iter_line_batches(self, repo_path: str, *args, timeout: float = None, request=None):
+        """
+        Yield the stdout of `git <args>` as it is produced, as lists of whole
+        lines: one list per block read from the pipe, so a consumer can hand
+        each to a worker thread instead of handling lines one at a time on
+        the event loop. Closing the generator early (e.g. a streaming response
+        whose client went away) kills the process; a non-zero exit raises once
+        the output is drained. Like run(), git is also killed after `timeout`
+        seconds or once `request`'s client disconnects, if given.
+        """
+        command = ["git", *args]
+        async with self._slot(repo_path):
+            started = time.perf_counter()
+            process = await self._spawn(repo_path, command)
+            stderr = asyncio.ensure_future(process.stderr.read())
+            watcher = (asyncio.ensure_future(self._kill_when(process, request, timeout))
+                       if request is not None or timeout else None)
+            finished = False
+            output_bytes = 0
+            try:
+                # Read in blocks and decode whole runs of lines at once; a readline() per line costs more than parsing it
+                pending = b""
+                while True:
+                    chunk = await process.stdout.read(READ_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    output_bytes += len(chunk)
+                    pending += chunk
+                    cut = pending.rfind(b"\n")
+                    if cut < 0:
+                        if len(pending) > MAX_LINE_BYTES:
+                            raise ValueError(f"git output line longer than {MAX_LINE_BYTES} bytes")
+                        continue
+                    complete, pending = pending[:cut], pending[cut + 1:]
+                    yield [line.rstrip("\r") for line in complete.decode("utf-8", "replace").split("\n")]
+                if pending:
+                    yield [pending.decode("utf-8", "replace").rstrip("\r")]
+                await process.wait()
+                finished = True
+            finally:
+                if watcher is not None and not watcher.done():
+                    watcher.cancel()
+                if not finished:
+                    self._kill(process)
+                    stderr.cancel()
+                    self.cancelled += 1
+                elapsed = time.perf_counter() - started
+                self.total_ms += elapsed * 1000
+                metrics.observe_git(args, elapsed, output_bytes, process.returncode if finished else -1, repo_path)
+            if watcher is not None and watcher.done() and not watcher.cancelled():
+                if watcher.result() == "disconnected":
+                    self.cancelled += 1
+                    raise GitCancelledError(command, -1, "client disconnected")
+                self.timeouts += 1
+                raise GitTimeoutError(command, -1, f"timed out after {timeout}s")
+            if process.returncode != 0:
+                self.failed += 1
+                raise GitCommandError(command, process.returncode, (await stderr).decode("utf-8", "replace"))
+            self.completed += 1
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_repo": self.per_repo,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "avg_ms": self.total_ms / finished if finished else 0.0,
+        }
+
+    @asynccontextmanager
+    async def _slot(self, repo_path):
+        loop = asyncio.get_running_loop()
+        limits = self._limits.get(loop)
+        if limits is None:
+            limits = self._limits[loop] = (asyncio.Semaphore(self.max_concurrency), {})
+        overall, by_repo = limits
+        key = resolve_repo_path(repo_path)
+        repo_limit = by_repo.get(key)
+        if repo_limit is None:
+            repo_limit = by_repo[key] = asyncio.Semaphore(self.per_repo)
+        self.waiting += 1
+        try:
+            # Per-repository first, so a busy repository doesn't hold global slots while it queues
+            await repo_limit.acquire()
+            try:
+                await overall.acquire()
+            except BaseException:
+                repo_limit.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            overall.release()
+            repo_limit.release()
+
+    @staticmethod
+    async def _spawn(repo_path, command, stdin=None, limit=None):
+        kwargs = {"limit": limit} if limit else {}
+        return await asyncio.create_subprocess_exec(
+            *command, cwd=repo_path, stdin=stdin or asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            env=dict(os.environ, GIT_TERMINAL_PROMPT="0"), **kwargs
+        )
+
+    async def _kill_when(self, process, request, timeout):
+        """Kill `process` once the client disconnects or `timeout` passes, returning which one it was."""
+        waiting = self._wait_for_disconnect(request) if request is not None else asyncio.Event().wait()
+        try:
+            await asyncio.wait_for(waiting, timeout)
+            reason = "disconnected"
+        except asyncio.TimeoutError:
+            reason = "timeout"
+        self._kill(process)
+        return reason
+
+    @staticmethod
+    async def _wait_for_disconnect(request):
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+    def _kill(self, process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            # Reap in the background so the transport closes without making the caller wait
+            reaper = asyncio.ensure_future(process.wait())
+            self._reaping.add(reaper)
+            reaper.add_done_callback(self._reaping.discard)
+
+
+git_executor = GitExecutor(
+    max_concurrency=int(os.environ.get("GIT_BARBER_GIT_CONCURRENCY", "32")),
+    per_repo=int(os.environ.get("GIT_BARBER_GIT_REPO_CONCURRENCY", "8")),
+    timeout=float(os.environ.get("GIT_BARBER_GIT_TIMEOUT", "120")),
+)
+
+
+def get_git_executor() -> GitExecutor:
+    """FastAPI dependency returning the shared async git executor."""
+    return git_executor
+
+
+def error_status(error: Exception) -> int:
+    """HTTP status for a failed git call: 504 on timeout, 499 (client closed request) on disconnect, else 500."""
+    if isinstance(error, GitTimeoutError):
+        return 504
+    if isinstance(error, GitCancelledError):
+        return 499
+    return 500
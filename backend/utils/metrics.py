@@ -0,0 +1,273 @@
+import bisect
+import cProfile
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from git import Repo
+from git.cmd import Git
+from git.exc import GitCommandError
+
+logger = logging.getLogger("git_barber.slow")
+
+# Seconds; spans a cache hit up to a cold diff of a huge branch
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SLOW_LOG_SIZE = 200
+PROFILE_HEADER = "x-git-barber-profile"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus sense; callers hold the registry lock."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+def git_command_name(args):
+    """The git subcommand in an argument list, skipping global options such as `-c key=value`."""
+    args = list(args)
+    position = 0
+    while position < len(args):
+        arg = str(args[position])
+        if arg in ("-c", "-C", "--git-dir", "--work-tree", "--namespace"):
+            position += 2
+        elif arg.startswith("-"):
+            position += 1
+        else:
+            return arg
+    return "git"
+
+
+class Metrics:
+    """
+    Process-wide request, git and parse timings, rendered for /metrics.
+
+    Requests are labelled by route template (not the raw path) and status,
+    git calls by subcommand, with their output bytes and exit statuses.
+    Anything slower than `slow_ms` also goes to a bounded slow-call log and
+    the `git_barber.slow` logger.
+    """
+
+    def __init__(self, slow_ms: float = 1000.0):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._requests = defaultdict(Histogram)
+        self._git = defaultdict(Histogram)
+        self._git_bytes = defaultdict(int)
+        self._git_exits = defaultdict(int)
+        self._parse = defaultdict(Histogram)
+        self._parse_bytes = defaultdict(int)
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def observe_request(self, method, route, status, seconds):
+        with self._lock:
+            self._requests[method, route, str(status)].observe(seconds)
+        self._check_slow("request", f"{method} {route}", seconds, status=status)
+
+    def observe_git(self, args, seconds, output_bytes, exit_status, repo_path=None):
+        command = git_command_name(args)
+        with self._lock:
+            self._git[command].observe(seconds)
+            self._git_bytes[command] += output_bytes
+            self._git_exits[command, str(exit_status)] += 1
+        self._check_slow("git", command, seconds, args=" ".join(str(arg) for arg in args)[:500],
+                         repo_path=repo_path, exit_status=exit_status, bytes=output_bytes)
+
+    def observe_parse(self, kind, seconds, input_bytes=0):
+        with self._lock:
+            self._parse[kind].observe(seconds)
+            self._parse_bytes[kind] += input_bytes
+        self._check_slow("parse", kind, seconds, bytes=input_bytes)
+
+    @contextmanager
+    def parse_timer(self, kind, input_bytes=0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_parse(kind, time.perf_counter() - started, input_bytes)
+
+    def slow_calls(self) -> list:
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            for table in (self._requests, self._git, self._git_bytes, self._git_exits, self._parse, self._parse_bytes):
+                table.clear()
+            self._slow.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, "git_barber_request_duration_seconds", "HTTP request latency by route",
+                                    ("method", "route", "status"), self._requests)
+            self._render_histograms(lines, "git_barber_git_duration_seconds", "git subprocess latency by subcommand",
+                                    ("command",), self._git)
+            self._render_counters(lines, "git_barber_git_output_bytes_total", "git stdout bytes by subcommand",
+                                  ("command",), self._git_bytes)
+            self._render_counters(lines, "git_barber_git_calls_total", "git calls by subcommand and exit status",
+                                  ("command", "exit_status"), self._git_exits)
+            self._render_histograms(lines, "git_barber_parse_duration_seconds", "diff parse time, excluding git",
+                                    ("kind",), self._parse)
+            self._render_counters(lines, "git_barber_parse_input_bytes_total", "diff bytes parsed",
+                                  ("kind",), self._parse_bytes)
+        return "\n".join(lines) + "\n"
+
+    def _check_slow(self, kind, name, seconds, **detail):
+        milliseconds = seconds * 1000
+        if milliseconds < self.slow_ms:
+            return
+        entry = {"kind": kind, "name": name, "ms": round(milliseconds, 1), "at": time.time(), **detail}
+        with self._lock:
+            self._slow.append(entry)
+        logger.warning("slow %s %s: %.0f ms %s", kind, name, milliseconds, detail)
+
+    @staticmethod
+    def _labels(names, values, extra=""):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _render_histograms(self, lines, metric, help_text, label_names, histograms):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for key, histogram in sorted(histograms.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), histogram.counts):
+                cumulative += count
+                bucket = 'le="' + str(bound) + '"'
+                lines.append(f"{metric}_bucket{self._labels(label_names, key, bucket)} {cumulative}")
+            lines.append(f"{metric}_sum{self._labels(label_names, key)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{self._labels(label_names, key)} {histogram.count}")
+
+    def _render_counters(self, lines, metric, help_text, label_names, counters):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for key, value in sorted(counters.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{metric}{self._labels(label_names, key)} {value}")
+
+
+def _escape(value):
+    return re.sub(r'(["\\])', r"\\\1", str(value)).replace("\n", "\\n")
+
+
+class InstrumentedGit(Git):
+    """GitPython's command wrapper, recording every `repo.git.<command>()` call in the metrics."""
+
+    def execute(self, command, *args, **kwargs):
+        if kwargs.get("as_process"):
+            # Long-lived helpers such as cat-file --batch; there is no single call to time
+            return super().execute(command, *args, **kwargs)
+        started = time.perf_counter()
+        exit_status = 0
+        output = None
+        try:
+            output = super().execute(command, *args, **kwargs)
+            return output
+        except GitCommandError as e:
+            exit_status = e.status
+            raise
+        finally:
+            args = command[1:] if isinstance(command, (list, tuple)) else [command]
+            metrics.observe_git(args, time.perf_counter() - started, _output_size(output), exit_status,
+                                self._working_dir)
+
+
+class InstrumentedRepo(Repo):
+    GitCommandWrapperType = InstrumentedGit
+
+
+def _output_size(output):
+    if isinstance(output, tuple):
+        # with_extended_output=True returns (status, stdout, stderr)
+        output = output[1]
+    return len(output) if isinstance(output, (str, bytes)) else 0
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request, streaming bodies included, under its route
+    template. When profiling is enabled (GIT_BARBER_PROFILE=1), a request
+    carrying the `X-Git-Barber-Profile` header is run under cProfile and the
+    stats are written to GIT_BARBER_PROFILE_DIR; the response names the file
+    in the same header. cProfile only sees the event loop thread (including
+    other requests interleaved on it), so sync handlers show up as the
+    threadpool call that runs them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.profile_dir = None
+        if os.environ.get("GIT_BARBER_PROFILE") == "1":
+            self.profile_dir = os.environ.get(
+                "GIT_BARBER_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "git-barber-profiles")
+            )
+        self._profiling = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        profiler = profile_path = None
+        if self.profile_dir and _header(scope, PROFILE_HEADER) and self._profiling.acquire(blocking=False):
+            # One profile at a time: two cProfile instances can't share a thread
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = re.sub(r"[^\w.-]+", "_", scope["path"]).strip("_") or "root"
+            profile_path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.prof")
+            profiler = cProfile.Profile()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_path:
+                    message = dict(message, headers=[*message.get("headers", []),
+                                                     (PROFILE_HEADER.encode("latin-1"), profile_path.encode("utf-8"))])
+            await send(message)
+
+        if profiler:
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+                self._profiling.release()
+            route = scope.get("route")
+            metrics.observe_request(scope["method"], getattr(route, "path", "unmatched"), status,
+                                    time.perf_counter() - started)
+
+
+def _header(scope, name):
+    name = name.encode("latin-1")
+    return next((value for key, value in scope.get("headers", []) if key.lower() == name), None)
+
+
+metrics = Metrics(slow_ms=float(os.environ.get("GIT_BARBER_SLOW_MS", "1000")))
+
+
+def get_metrics() -> Metrics:
+    """FastAPI dependency returning the shared metrics registry."""
+    return metrics
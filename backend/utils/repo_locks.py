@@ -0,0 +1,376 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from utils.repo_pool import resolve_repo_path
+
+
+class _FutureGrant:
+    """Stands in for a threading.Event in the wait queue, waking an asyncio waiter instead."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def set(self):
+        # Called with the lock's mutex held, possibly from another thread
+        self.granted = True
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class FairReadWriteLock:
+    """
+    FIFO read/write lock: any number of readers, or a single writer.
+
+    Waiters are granted strictly in arrival order, so a steady stream of
+    readers can't starve a writer queued behind them (and vice versa).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self.readers = 0
+        self.writer = False
+
+    @property
+    def waiting(self):
+        return len(self._queue)
+
+    def acquire(self, write: bool):
+        granted = threading.Event()
+        with self._lock:
+            self._queue.append((write, granted))
+            self._grant()
+        granted.wait()
+
+    async def acquire_async(self, write: bool):
+        """Like acquire(), but waits on the event loop instead of blocking a thread."""
+        grant = _FutureGrant()
+        entry = (write, grant)
+        with self._lock:
+            self._queue.append(entry)
+            self._grant()
+        try:
+            await grant.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = grant.granted
+                if not granted:
+                    self._queue.remove(entry)
+                    self._grant()
+            if granted:
+                self.release(write)
+            raise
+
+    def release(self, write: bool):
+        with self._lock:
+            if write:
+                self.writer = False
+            else:
+                self.readers -= 1
+            self._grant()
+
+    def _grant(self):
+        # Caller holds self._lock
+        while self._queue and not self.writer:
+            write, granted = self._queue[0]
+            if write:
+                if self.readers:
+                    return
+                self.writer = True
+            else:
+                self.readers += 1
+            self._queue.popleft()
+            granted.set()
+            if write:
+                return
+
+
+class RepoLockManager:
+    """Per-repository read/write locks with queue-depth and wait-time metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._metrics = {}
+        self._write_listeners = []
+
+    def add_write_listener(self, listener):
+        """Call `listener(repo_path)` at the end of every write, while the write lock is still held."""
+        self._write_listeners.append(listener)
+
+    @contextmanager
+    def read(self, repo_path: str):
+        with self._hold(repo_path, write=False):
+            yield
+
+    @contextmanager
+    def write(self, repo_path: str):
+        with self._hold(repo_path, write=True):
+            yield
+
+    @asynccontextmanager
+    async def read_async(self, repo_path: str):
+        lock = self._lock_for(repo_path)
+        started = time.perf_counter()
+        await lock.acquire_async(write=False)
+        self._record_wait(repo_path, started)
+        try:
+            yield
+        finally:
+            lock.release(write=False)
+
+    @asynccontextmanager
+    async def write_async(self, repo_path: str):
+        lock = self._lock_for(repo_path)
+        started = time.perf_counter()
+        await lock.acquire_async(write=True)
+        self._record_wait(repo_path, started)
+        try:
+            yield
+        finally:
+            try:
+                await asyncio.to_thread(self._notify_write, repo_path)
+            finally:
+                lock.release(write=True)
+
+    @contextmanager
+    def _hold(self, repo_path, write):
+        lock = self._lock_for(repo_path)
+        started = time.perf_counter()
+        lock.acquire(write)
+        self._record_wait(repo_path, started)
+        try:
+            yield
+        finally:
+            if write:
+                self._notify_write(repo_path)
+            lock.release(write)
+
+    def _notify_write(self, repo_path):
+        for listener in self._write_listeners:
+            try:
+                listener(resolve_repo_path(repo_path))
+            except Exception:
+                pass
+
+    def _lock_for(self, repo_path):
+        key = resolve_repo_path(repo_path)
+        with self._lock:
+            self._metrics.setdefault(key, {"acquisitions": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0})
+            return self._locks.setdefault(key, FairReadWriteLock())
+
+    def _record_wait(self, repo_path, started):
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            metrics = self._metrics[resolve_repo_path(repo_path)]
+            metrics["acquisitions"] += 1
+            metrics["total_wait_ms"] += waited_ms
+            metrics["max_wait_ms"] = max(metrics["max_wait_ms"], waited_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            repos = {}
+            for key, lock in self._locks.items():
+                metrics = self._metrics[key]
+                repos[key] = {
+                    "waiting": lock.waiting,
+                    "readers": lock.readers,
+                    "writer": lock.writer,
+                    "acquisitions": metrics["acquisitions"],
+                    "avg_wait_ms": metrics["total_wait_ms"] / metrics["acquisitions"] if metrics["acquisitions"] else 0.0,
+                    "max_wait_ms": metrics["max_wait_ms"],
+                }
+        return {"repos": repos}
+
+
+class JobQueue:
+    """
+    FIFO queue of mutating operations, one worker thread per repository.
+
+    Jobs for the same repository run one after another under its write lock,
+    while jobs for different repositories run in parallel. Workers exit as soon
+    as their repository's queue drains. Finished jobs are kept for polling up
+    to `max_finished` entries.
+
+    A job submitted with `progress=True` gets a `report(line)` callback; the
+    last `progress_lines` lines are kept on the job and every line is pushed
+    to subscribers as it arrives, followed by the finished job.
+    """
+
+    def __init__(self, locks: RepoLockManager, max_finished: int = 500, progress_lines: int = 100):
+        self.locks = locks
+        self.max_finished = max_finished
+        self.progress_lines = progress_lines
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pending = {}
+        self._subscribers = {}
+
+    def run(self, repo_path: str, operation: str, fn, background: bool = False):
+        """Run `fn` under the repository's write lock, inline or as a background job."""
+        if background:
+            return {"job": self.submit(repo_path, operation, fn)}
+        with self.locks.write(repo_path):
+            return fn()
+
+    def submit(self, repo_path: str, operation: str, fn, progress: bool = False) -> dict:
+        key = resolve_repo_path(repo_path)
+        job = {
+            "id": uuid.uuid4().hex,
+            "repo_path": key,
+            "operation": operation,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "wait_ms": None,
+            "result": None,
+            "error": None,
+        }
+        if progress:
+            job["progress"] = []
+            job_fn = fn
+
+            def fn():
+                return job_fn(lambda line: self._report(job, line))
+        with self._lock:
+            self._jobs[job["id"]] = job
+            queue = self._pending.get(key)
+            start_worker = queue is None
+            if start_worker:
+                queue = self._pending[key] = deque()
+            queue.append((job, fn))
+        if start_worker:
+            threading.Thread(target=self._work, args=(key,), name=f"git-barber-jobs-{os.path.basename(key)}",
+                             daemon=True).start()
+        return dict(job)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._copy(job) if job else None
+
+    def subscribe(self, job_id: str):
+        """
+        (subscriber, job) for a job's progress; call from the event loop. The
+        subscriber's queue gets every line reported after the returned job was
+        copied, as {"type": "progress", "line": ...}, then {"type": "job", ...}
+        once it finishes. Returns (None, None) for an unknown job.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, None
+            subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+            if job["finished_at"] is None:
+                self._subscribers.setdefault(job_id, set()).add(subscriber)
+            return subscriber, self._copy(job)
+
+    def unsubscribe(self, job_id: str, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def list_jobs(self, repo_path: str = None):
+        key = resolve_repo_path(repo_path) if repo_path else None
+        with self._lock:
+            return [self._copy(job) for job in self._jobs.values() if key is None or job["repo_path"] == key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status = {}
+            for job in self._jobs.values():
+                by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+            return {"queued_by_repo": {key: len(queue) for key, queue in self._pending.items()}, "jobs": by_status}
+
+    def _work(self, key):
+        job = None
+        try:
+            while True:
+                with self._lock:
+                    queue = self._pending[key]
+                    if not queue:
+                        del self._pending[key]
+                        return
+                    job, fn = queue.popleft()
+                with self.locks.write(key):
+                    with self._lock:
+                        job["status"] = "running"
+                        job["started_at"] = time.time()
+                        job["wait_ms"] = round((job["started_at"] - job["submitted_at"]) * 1000, 1)
+                    try:
+                        result, error, status = fn(), None, "succeeded"
+                    except Exception as e:
+                        result, error, status = None, str(getattr(e, "detail", e)), "failed"
+                with self._lock:
+                    self._finish(job, status, result, error)
+                    self._forget_finished()
+                job = None
+        except BaseException as e:
+            # KeyboardInterrupt, SystemExit and the like end this worker; without the cleanup
+            # its queue entry would stay and every later job for the repository would wait forever
+            with self._lock:
+                queue = self._pending.pop(key, None) or ()
+                error = f"Job worker stopped: {type(e).__name__}"
+                for stranded in ([job] if job is not None else []) + [queued for queued, _ in queue]:
+                    self._finish(stranded, "failed", None, error)
+                self._forget_finished()
+            raise
+
+    def _finish(self, job, status, result, error):
+        # Caller holds self._lock
+        job.update(status=status, result=result, error=error, finished_at=time.time())
+        self._publish(job["id"], {"type": "job", **self._copy(job)})
+        self._subscribers.pop(job["id"], None)
+
+    def _report(self, job, line):
+        with self._lock:
+            job["progress"].append(line)
+            del job["progress"][:-self.progress_lines]
+            self._publish(job["id"], {"type": "progress", "line": line})
+
+    def _publish(self, job_id, event):
+        # Caller holds self._lock
+        for loop, queue in self._subscribers.get(job_id, ()):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    @staticmethod
+    def _copy(job):
+        # Caller holds self._lock; the progress list keeps changing while the job runs
+        copy = dict(job)
+        if "progress" in copy:
+            copy["progress"] = list(copy["progress"])
+        return copy
+
+    def _forget_finished(self):
+        # Caller holds self._lock
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+
+repo_locks = RepoLockManager()
+job_queue = JobQueue(repo_locks)
+
+
+def get_repo_locks() -> RepoLockManager:
+    """FastAPI dependency returning the shared per-repository lock manager."""
+    return repo_locks
+
+
+def get_job_queue() -> JobQueue:
+    """FastAPI dependency returning the shared mutating-operation job queue."""
+    return job_queue
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.metrics import InstrumentedRepo
+
+
+def resolve_repo_path(repo_path: str) -> str:
+    """Expand ~ and resolve symlinks so every spelling of a path maps to one pool key."""
+    return os.path.realpath(os.path.expanduser(repo_path))
+
+
+class RepoPool:
+    """
+    Bounded, process-wide pool of GitPython Repo handles keyed by resolved path.
+
+    A leased handle is used by one request at a time, since the persistent
+    `git cat-file --batch` helpers behind a Repo are not safe to share across
+    threads. Released handles stay idle (with their helpers alive) until they
+    are reused, fall off the LRU end, or sit unused longer than `idle_timeout`.
+    """
+
+    def __init__(self, max_size: int = 16, idle_timeout: float = 600.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # repo path -> list of (repo, released_at), most recently used path last
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._leased = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def lease(self, repo_path: str):
+        key = resolve_repo_path(repo_path)
+        repo = self._take_idle(key)
+        if repo is None:
+            repo = InstrumentedRepo(key)
+        with self._lock:
+            self._leased += 1
+        try:
+            yield repo
+        except OSError:
+            # Broken pipes to the cat-file helpers; don't hand this handle out again
+            self._discard(repo)
+            raise
+        except BaseException:
+            # Failed git commands and HTTP errors leave the handle itself usable
+            self._release(key, repo)
+            raise
+        else:
+            self._release(key, repo)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "max_size": self.max_size,
+                "idle": self._idle_count,
+                "leased": self._leased,
+                "repos": len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            handles = [repo for entries in self._idle.values() for repo, _ in entries]
+            self._idle.clear()
+            self._idle_count = 0
+        for repo in handles:
+            repo.close()
+
+    def _take_idle(self, key):
+        with self._lock:
+            expired = self._expire_idle()
+            entries = self._idle.get(key)
+            if entries:
+                repo, _ = entries.pop()
+                self._idle_count -= 1
+                if not entries:
+                    del self._idle[key]
+                self.hits += 1
+            else:
+                repo = None
+                self.misses += 1
+        for stale in expired:
+            stale.close()
+        return repo
+
+    def _release(self, key, repo):
+        with self._lock:
+            self._leased -= 1
+            self._idle.setdefault(key, []).append((repo, time.monotonic()))
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            evicted = []
+            while self._idle_count > self.max_size:
+                oldest_key, entries = next(iter(self._idle.items()))
+                evicted.append(entries.pop(0)[0])
+                self._idle_count -= 1
+                self.evictions += 1
+                if not entries:
+                    del self._idle[oldest_key]
+        for stale in evicted:
+            stale.close()
+
+    def _discard(self, repo):
+        with self._lock:
+            self._leased -= 1
+        repo.close()
+
+    def _expire_idle(self):
+        # Caller holds the lock; returns handles to close once it is released
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        for key in list(self._idle):
+            entries = self._idle[key]
+            fresh = [(repo, released_at) for repo, released_at in entries if released_at >= deadline]
+            expired.extend(repo for repo, released_at in entries if released_at < deadline)
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+        self._idle_count -= len(expired)
+        self.evictions += len(expired)
+        return expired
+
+
+repo_pool = RepoPool(
+    max_size=int(os.environ.get("GIT_BARBER_REPO_POOL_SIZE", "16")),
+    idle_timeout=float(os.environ.get("GIT_BARBER_REPO_IDLE_TIMEOUT", "600")),
+)
+
+
+def get_repo_pool() -> RepoPool:
+    """FastAPI dependency returning the shared repository handle pool."""
+    return repo_pool
@@ -0,0 +1,243 @@
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.metrics import metrics
+from utils.repo_pool import resolve_repo_path
+
+# Directories that hold dependencies or build output, never checkouts worth listing
+SKIP_DIRS = frozenset({
+    "node_modules", "bower_components", "vendor", "venv", "__pycache__", "site-packages",
+    "dist", "build", "target", "out",
+})
+HEAD_REF_PREFIX = "ref: refs/heads/"
+
+
+def git_dir_at(path):
+    """The git dir if `path` is the top of a work tree (`.git` dir or `gitdir:` file) or a bare repo, else None."""
+    marker = os.path.join(path, ".git")
+    if os.path.isfile(os.path.join(marker, "HEAD")):
+        return marker
+    if os.path.isfile(marker):
+        # Worktrees and submodules: ".git" is a file pointing at the real git dir
+        try:
+            with open(marker, encoding="utf-8") as marker_file:
+                line = marker_file.readline().strip()
+        except OSError:
+            return None
+        if line.startswith("gitdir:"):
+            git_dir = os.path.join(path, line[len("gitdir:"):].strip())
+            return os.path.normpath(git_dir) if os.path.isfile(os.path.join(git_dir, "HEAD")) else None
+        return None
+    if all(os.path.exists(os.path.join(path, name)) for name in ("HEAD", "objects", "refs")):
+        return path
+    return None
+
+
+def read_head(git_dir):
+    """(current branch or None when detached, HEAD as read) straight from the HEAD file."""
+    try:
+        with open(os.path.join(git_dir, "HEAD"), encoding="utf-8") as head_file:
+            head = head_file.readline().strip()
+    except OSError:
+        return None, None
+    if head.startswith(HEAD_REF_PREFIX):
+        return head[len(HEAD_REF_PREFIX):], head
+    return None, head
+
+
+class _Listing:
+    __slots__ = ("mtime_ns", "git_dir", "subdirs", "entries")
+
+    def __init__(self, mtime_ns, git_dir, subdirs, entries):
+        self.mtime_ns = mtime_ns
+        self.git_dir = git_dir
+        self.subdirs = subdirs
+        self.entries = entries
+
+
+class RepoScanner:
+    """
+    Finds the git repositories under a workspace directory.
+
+    Directories are listed with os.scandir on a thread pool, breadth first
+    and in parallel. A directory with a `.git` marker is a repository and is
+    not descended into; dependency/build directories (SKIP_DIRS), hidden
+    directories and any directory with more than `max_dir_entries` entries
+    are skipped. Each repository's branch comes from its HEAD file and its
+    dirty flag from one `git status` per repository, run in parallel.
+
+    Results are cached per root for `ttl` seconds. Past that (or on request)
+    a scan is refreshed incrementally: a directory whose mtime hasn't changed
+    has the same entries, so its last listing is reused and only directories
+    that gained or lost entries are listed again. HEAD and the dirty flag are
+    always re-read.
+    """
+
+    def __init__(self, workers: int = 16, ttl: float = 30.0, max_depth: int = 6, max_dir_entries: int = 10000,
+                 max_roots: int = 8):
+        self.workers = workers
+        self.ttl = ttl
+        self.max_depth = max_depth
+        self.max_dir_entries = max_dir_entries
+        self.max_roots = max_roots
+        self._lock = threading.Lock()
+        # root -> {"listings", "result", "scanned_at", "lock"}, most recently used last
+        self._roots = OrderedDict()
+        self._executor = None
+        self.scans = 0
+        self.cache_hits = 0
+        self.listed = 0
+        self.reused = 0
+
+    def scan(self, root: str, max_depth: int = None, dirty: bool = True, refresh: bool = False) -> dict:
+        root = resolve_repo_path(root)
+        max_depth = self.max_depth if max_depth is None else max_depth
+        entry = self._root_entry(root)
+        # One scan of a root at a time; a concurrent request gets the result of the one in flight
+        with entry["lock"]:
+            result = entry["result"]
+            fresh = result is not None and time.monotonic() - entry["scanned_at"] < self.ttl
+            if fresh and not refresh and result["max_depth"] == max_depth and (result["dirty"] or not dirty):
+                with self._lock:
+                    self.cache_hits += 1
+                return dict(result, cached=True)
+            started = time.perf_counter()
+            listings, repos, skipped, listed = self._walk(root, max_depth, entry["listings"])
+            repos = self._describe(repos, dirty)
+            result = {
+                "root": root,
+                "max_depth": max_depth,
+                "dirty": dirty,
+                "repos": repos,
+                "skipped": skipped,
+                "scanned_dirs": len(listings),
+                "listed_dirs": listed,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+            entry.update(listings=listings, result=result, scanned_at=time.monotonic())
+            with self._lock:
+                self.scans += 1
+                self.listed += listed
+                self.reused += len(listings) - listed
+        return dict(result, cached=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "roots": len(self._roots),
+                "scans": self.scans,
+                "cache_hits": self.cache_hits,
+                "listed_dirs": self.listed,
+                "reused_dirs": self.reused,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._roots.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _root_entry(self, root):
+        with self._lock:
+            entry = self._roots.get(root)
+            if entry is None:
+                entry = self._roots[root] = {"listings": {}, "result": None, "scanned_at": 0.0,
+                                             "lock": threading.Lock()}
+                while len(self._roots) > self.max_roots:
+                    self._roots.popitem(last=False)
+            self._roots.move_to_end(root)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="git-barber-scan")
+            return entry
+
+    def _walk(self, root, max_depth, previous):
+        """Every repository under `root` as (path, git_dir), with the listings to reuse next time."""
+        listings, repos, skipped = {}, [], []
+        listed = 0
+        pending = {self._executor.submit(self._list, root, previous.get(root)): (root, 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth = pending.pop(future)
+                listing, was_listed = future.result()
+                if listing is None:
+                    continue
+                listings[path] = listing
+                listed += was_listed
+                if listing.git_dir is not None:
+                    repos.append((path, listing.git_dir))
+                elif listing.entries > self.max_dir_entries:
+                    skipped.append({"path": path, "entries": listing.entries})
+                elif depth < max_depth:
+                    for subdir in listing.subdirs:
+                        pending[self._executor.submit(self._list, subdir, previous.get(subdir))] = (subdir, depth + 1)
+        repos.sort()
+        skipped.sort(key=lambda directory: directory["path"])
+        return listings, repos, skipped, listed
+
+    def _list(self, path, cached):
+        """(listing, whether the directory had to be read) for one directory; (None, 0) if it is gone."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, 0
+        # Adding or removing an entry (a new checkout, a deleted one) bumps the directory's mtime
+        if cached is not None and cached.mtime_ns == mtime_ns:
+            return cached, 0
+        subdirs, entries, has_marker = [], 0, False
+        try:
+            with os.scandir(path) as scanner:
+                for dir_entry in scanner:
+                    entries += 1
+                    name = dir_entry.name
+                    if name == ".git" or name == "HEAD":
+                        has_marker = True
+                    elif (not name.startswith(".") and name not in SKIP_DIRS
+                          and dir_entry.is_dir(follow_symlinks=False)):
+                        subdirs.append(dir_entry.path)
+        except OSError:
+            return None, 0
+        git_dir = git_dir_at(path) if has_marker else None
+        return _Listing(mtime_ns, git_dir, [] if git_dir else subdirs, entries), 1
+
+    def _describe(self, repos, dirty):
+        def describe(repo):
+            path, git_dir = repo
+            branch, head = read_head(git_dir)
+            described = {"path": path, "branch": branch, "detached": branch is None and head is not None}
+            if dirty:
+                described["dirty"] = self._is_dirty(path) if git_dir != path else False
+            return described
+
+        return list(self._executor.map(describe, repos))
+
+    @staticmethod
+    def _is_dirty(repo_path):
+        # Tracked files only: listing untracked files means walking the whole work tree.
+        # --no-optional-locks keeps status from rewriting the index under a running git command
+        args = ("--no-optional-locks", "status", "--porcelain", "--untracked-files=no", "--ignore-submodules=dirty")
+        started = time.perf_counter()
+        result = subprocess.run(["git", *args], cwd=repo_path, capture_output=True, text=True, encoding="utf-8",
+                                errors="replace", env=dict(os.environ, GIT_TERMINAL_PROMPT="0"))
+        metrics.observe_git(args, time.perf_counter() - started, len(result.stdout), result.returncode, repo_path)
+        if result.returncode != 0:
+            return None
+        return bool(result.stdout)
+
+
+repo_scanner = RepoScanner(
+    workers=int(os.environ.get("GIT_BARBER_SCAN_WORKERS", "16")),
+    ttl=float(os.environ.get("GIT_BARBER_SCAN_TTL", "30")),
+    max_depth=int(os.environ.get("GIT_BARBER_SCAN_MAX_DEPTH", "6")),
+    max_dir_entries=int(os.environ.get("GIT_BARBER_SCAN_MAX_DIR_ENTRIES", "10000")),
+)
+
+
+def get_repo_scanner() -> RepoScanner:
+    """FastAPI dependency returning the shared workspace scanner."""
+    return repo_scanner
@@ -0,0 +1,461 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from utils.metrics import metrics
+from utils.repo_locks import repo_locks
+from utils.repo_pool import resolve_repo_path
+
+# Coalesce the burst of file events a single git command produces
+DEBOUNCE_SECONDS = 0.05
+POLL_INTERVAL_SECONDS = 1.0
+# A subscriber this far behind is told to resync instead of being sent every delta
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ONLYDIR = 0x01000000
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not (hasattr(libc, "inotify_init1") and hasattr(libc, "inotify_add_watch")):
+        return None
+    return libc
+
+
+_libc = _load_inotify()
+
+
+def _git(cwd, *args, input=None):
+    started = time.perf_counter()
+    result = subprocess.run(["git", *args], cwd=cwd, input=input, capture_output=True, text=True, encoding="utf-8")
+    metrics.observe_git(args, time.perf_counter() - started, len(result.stdout), result.returncode, cwd)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+class RepoWatcher:
+    """
+    In-memory snapshot of a repository's HEAD and local branches, kept current
+    by watching the files git changes instead of asking git on every request.
+
+    HEAD and the index are watched in the git dir, packed-refs and every
+    directory under refs/heads in the common dir (inotify on Linux, mtime
+    polling elsewhere). On a change the ref files are re-read directly and
+    only branches whose commit moved are looked up with git, in one call.
+    Each change is pushed to subscribers as a delta.
+    """
+
+    def __init__(self, repo_path: str, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.repo_path = repo_path
+        self.poll_interval = poll_interval
+        git_dir, common_dir = _git(repo_path, "rev-parse", "--absolute-git-dir", "--git-common-dir").splitlines()
+        self.git_dir = git_dir
+        self.common_dir = os.path.normpath(os.path.join(repo_path, common_dir))
+        self.heads_dir = os.path.join(self.common_dir, "refs", "heads")
+        self._lock = threading.Lock()
+        # The watch thread and write-lock releases both refresh; one at a time
+        self._refresh_lock = threading.Lock()
+        self._subscribers = set()
+        self._stopped = threading.Event()
+        self.version = 0
+        # Taken before the files are read, so a change made while reading still looks new
+        self._seen_stamps = self._stamps()
+        self.snapshot = self._initial_snapshot()
+        self.mode = "inotify" if _libc else "polling"
+        self._inotify_fd = None
+        if _libc:
+            try:
+                self._inotify_fd = self._start_inotify()
+            except OSError:
+                self.mode = "polling"
+        self._thread = threading.Thread(
+            target=self._watch_inotify if self._inotify_fd is not None else self._watch_polling,
+            name=f"git-barber-watch-{os.path.basename(repo_path)}", daemon=True,
+        )
+        self._thread.start()
+
+    # Snapshot
+
+    def _initial_snapshot(self):
+        output = _git(self.repo_path, "for-each-ref", "--format=%(refname:lstrip=2)%00%(objectname)%00"
+                      "%(committerdate:iso-strict)%00%(committerdate:unix)", "refs/heads/")
+        branches = {}
+        for line in output.splitlines():
+            name, commit, commit_time, timestamp = line.split("\0")
+            branches[name] = {"name": name, "commit": commit, "last_commit_time": commit_time, "timestamp": int(timestamp)}
+        current_branch, head = self._read_head(branches)
+        return self._make_snapshot(current_branch, head, branches, self._index_mtime())
+
+    def _make_snapshot(self, current_branch, head, branches, index_mtime):
+        # Newest first, like `for-each-ref --sort=-committerdate`; built once per change, not per request
+        ordered = sorted(branches.values(), key=lambda branch: branch["timestamp"], reverse=True)
+        return {
+            "version": self.version,
+            "current_branch": current_branch,
+            "head": head,
+            "branches": branches,
+            "ordered": ordered,
+            "index_mtime": index_mtime,
+        }
+
+    def _read_head(self, branches):
+        try:
+            with open(os.path.join(self.git_dir, "HEAD"), encoding="utf-8") as head_file:
+                content = head_file.read().strip()
+        except OSError:
+            return None, None
+        if content.startswith("ref: refs/heads/"):
+            name = content[len("ref: refs/heads/"):]
+            branch = branches.get(name)
+            return name, branch["commit"] if branch else None
+        return None, content
+
+    def _read_ref_commits(self):
+        # packed-refs first, then loose refs, which take precedence
+        commits = {}
+        try:
+            with open(os.path.join(self.common_dir, "packed-refs"), encoding="utf-8") as packed:
+                for line in packed:
+                    if line.startswith(("#", "^")):
+                        continue
+                    commit, _, refname = line.rstrip("\n").partition(" ")
+                    if refname.startswith("refs/heads/"):
+                        commits[refname[len("refs/heads/"):]] = commit
+        except OSError:
+            pass
+        for directory, _, files in os.walk(self.heads_dir):
+            for file_name in files:
+                if file_name.endswith(".lock"):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    with open(path, encoding="utf-8") as ref_file:
+                        commit = ref_file.read().strip()
+                except OSError:
+                    continue
+                if commit and not commit.startswith("ref:"):
+                    commits[os.path.relpath(path, self.heads_dir).replace(os.sep, "/")] = commit
+        return commits
+
+    def _index_mtime(self):
+        try:
+            return os.stat(os.path.join(self.git_dir, "index")).st_mtime
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Re-read HEAD, the refs and the index, publishing whatever changed."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def current_snapshot(self):
+        """
+        The snapshot, refreshed first if HEAD, the index or the refs changed
+        since it was taken. Costs a few stat calls, and closes the debounce
+        window in which a terminal `git checkout` would not be seen yet.
+        """
+        if self._stamps() != self._seen_stamps:
+            self.refresh()
+        return self.snapshot
+
+    def resync(self):
+        """Rebuild the snapshot from scratch and tell subscribers to start over with it."""
+        with self._refresh_lock:
+            self._seen_stamps = self._stamps()
+            snapshot = self._initial_snapshot()
+            with self._lock:
+                self.version += 1
+                self.snapshot = dict(snapshot, version=self.version)
+                self._publish({"type": "resync", "version": self.version})
+
+    def _refresh(self):
+        stamps = self._stamps()
+        previous = self.snapshot
+        commits = self._read_ref_commits()
+        branches = dict(previous["branches"])
+        removed = [name for name in branches if name not in commits]
+        for name in removed:
+            del branches[name]
+        moved = {name: commit for name, commit in commits.items()
+                 if name not in branches or branches[name]["commit"] != commit}
+        added, updated = [], []
+        if moved:
+            commit_times = self._commit_times(set(moved.values()))
+            for name, commit in moved.items():
+                commit_time, timestamp = commit_times.get(commit, ("", 0))
+                branch = {"name": name, "commit": commit, "last_commit_time": commit_time, "timestamp": timestamp}
+                (updated if name in branches else added).append(branch)
+                branches[name] = branch
+        current_branch, head = self._read_head(branches)
+        index_mtime = self._index_mtime()
+
+        events = []
+        if added or updated or removed:
+            events.append({"type": "branches", "added": added, "updated": updated, "removed": removed})
+        if (current_branch, head) != (previous["current_branch"], previous["head"]):
+            events.append({"type": "head", "current_branch": current_branch, "head": head})
+        if index_mtime != previous["index_mtime"]:
+            events.append({"type": "index", "index_mtime": index_mtime})
+        self._seen_stamps = stamps
+        if not events:
+            return
+        with self._lock:
+            self.version += 1
+            if added or updated or removed:
+                self.snapshot = self._make_snapshot(current_branch, head, branches, index_mtime)
+            else:
+                self.snapshot = dict(previous, version=self.version, current_branch=current_branch, head=head,
+                                     index_mtime=index_mtime)
+            for event in events:
+                event["version"] = self.version
+                self._publish(event)
+
+    def _commit_times(self, commits):
+        output = _git(self.repo_path, "log", "--no-walk=unsorted", "--stdin", "--format=%H%x00%cI%x00%ct",
+                      input="".join(f"{commit}\n" for commit in commits))
+        times = {}
+        for line in output.splitlines():
+            if line:
+                commit, commit_time, timestamp = line.split("\0")
+                times[commit] = (commit_time, int(timestamp))
+        return times
+
+    # Subscribers
+
+    def subscribe(self):
+        """An asyncio.Queue receiving every delta from now on; call from the event loop."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _publish(self, event):
+        # Caller holds self._lock
+        for loop, queue in self._subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            event = {"type": "resync", "version": event["version"]}
+        queue.put_nowait(event)
+
+    # Watching
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _start_inotify(self):
+        fd = _libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = {}
+        try:
+            for directory in {self.git_dir, self.common_dir}:
+                self._add_watch(fd, directory)
+            for directory, _, _ in os.walk(self.heads_dir):
+                self._add_watch(fd, directory)
+        except OSError:
+            os.close(fd)
+            raise
+        return fd
+
+    def _add_watch(self, fd, directory):
+        wd = _libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._watched[wd] = directory
+
+    def _relevant(self, directory, name, mask):
+        if name.endswith(".lock"):
+            return False
+        if directory.startswith(self.heads_dir):
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New namespace such as refs/heads/feature/; watch it and anything already inside
+                for subdirectory, _, _ in os.walk(os.path.join(directory, name)):
+                    self._add_watch(self._inotify_fd, subdirectory)
+            return True
+        return name in ("HEAD", "index", "packed-refs")
+
+    def _watch_inotify(self):
+        pending_since = None
+        while not self._stopped.is_set():
+            timeout = DEBOUNCE_SECONDS if pending_since is not None else 0.5
+            readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self._inotify_fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                overflowed = False
+                while offset < len(data):
+                    wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                    offset += EVENT_HEADER.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        overflowed = True
+                        continue
+                    directory = self._watched.get(wd)
+                    if directory and self._relevant(directory, os.fsdecode(name), mask):
+                        pending_since = pending_since or time.monotonic()
+                if overflowed:
+                    # The kernel dropped events (a rebase or fetch touching many refs), so no delta can be trusted
+                    pending_since = None
+                    self._safe_resync()
+            elif pending_since is not None:
+                pending_since = None
+                self._safe_refresh()
+
+    def _watch_polling(self):
+        stamps = self._stamps()
+        while not self._stopped.wait(self.poll_interval):
+            current = self._stamps()
+            if current != stamps:
+                stamps = current
+                self._safe_refresh()
+
+    def _stamps(self):
+        stamps = []
+        for path in (os.path.join(self.git_dir, "HEAD"), os.path.join(self.git_dir, "index"),
+                     os.path.join(self.common_dir, "packed-refs")):
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        # A loose ref update renames a lock file into place, bumping its directory's mtime
+        for directory, _, _ in os.walk(self.heads_dir):
+            try:
+                stamps.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                # Removed while walking (a branch namespace emptied by git)
+                stamps.append(None)
+        return stamps
+
+    def _safe_resync(self):
+        try:
+            # Namespaces created during the burst may have no watch yet
+            for directory, _, _ in os.walk(self.heads_dir):
+                self._add_watch(self._inotify_fd, directory)
+            self.resync()
+        except Exception:
+            pass
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            # A half-written ref or a concurrent gc; the next change triggers another refresh
+            pass
+
+
+class RepoWatchManager:
+    """
+    Lazily started watchers, one per repository. At most `max_repos` are kept;
+    the least recently used watcher without subscribers is stopped first.
+    """
+
+    def __init__(self, max_repos: int = 32):
+        self.max_repos = max_repos
+        self._lock = threading.Lock()
+        self._watchers = OrderedDict()
+
+    def get(self, repo_path: str) -> RepoWatcher:
+        key = resolve_repo_path(repo_path)
+        with self._lock:
+            watcher = self._watchers.get(key)
+            if watcher is not None:
+                self._watchers.move_to_end(key)
+                return watcher
+        # Built outside the lock: the initial snapshot runs git
+        watcher = RepoWatcher(key)
+        with self._lock:
+            existing = self._watchers.get(key)
+            if existing is not None:
+                doomed = [watcher]
+                watcher = existing
+            else:
+                self._watchers[key] = watcher
+                doomed = self._evict()
+        for stale in doomed:
+            stale.stop()
+        return watcher
+
+    def refresh(self, repo_path: str):
+        """Bring a watched repository's snapshot up to date now, without waiting for the watch thread."""
+        with self._lock:
+            watcher = self._watchers.get(resolve_repo_path(repo_path))
+        if watcher is not None:
+            watcher._safe_refresh()
+
+    def _evict(self):
+        # Caller holds self._lock
+        doomed = []
+        for key in list(self._watchers):
+            if len(self._watchers) <= self.max_repos:
+                break
+            if self._watchers[key].subscriber_count == 0:
+                doomed.append(self._watchers.pop(key))
+        return doomed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                key: {"mode": watcher.mode, "version": watcher.version, "subscribers": watcher.subscriber_count,
+                      "branches": len(watcher.snapshot["branches"])}
+                for key, watcher in self._watchers.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+        for watcher in watchers:
+            watcher.stop()
+
+
+repo_watches = RepoWatchManager(max_repos=int(os.environ.get("GIT_BARBER_WATCHED_REPOS", "32")))
+# Reads after the server's own writes see them, without waiting for the debounce or poll interval
+repo_locks.add_write_listener(repo_watches.refresh)
+
+
+def get_repo_watches() -> RepoWatchManager:
+    """FastAPI dependency returning the shared repository watchers."""
+    return repo_watches
@@ -2,6 +2,11 @@ import { useEffect, useState } from 'react';
 
 import { IoGitBranchOutline } from 'react-icons/io5';
 
+import { watchRepo } from '@/services/local-git-api.service';
+
+// The newest branches only, as /branches pages them; the filter box narrows this page
+const BRANCH_PAGE_SIZE = 100;
+
 interface BranchesListProps {
   repoPath: string;
   onSelect: (branchName: string) => void;
@@ -17,6 +22,8 @@ function BranchesList({ repoPath, onSelect, customFilter, customSort }: Branches
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
+    // The watch snapshot is at least as new as a /branches response still in flight
+    let haveSnapshot = false;
     const fetchBranches = async () => {
       setLoading(true);
       try {
@@ -24,6 +31,7 @@ function BranchesList({ repoPath, onSelect, customFilter, customSort }: Branches
         if (repoPath) {
           url.searchParams.append('repo_path', repoPath);
         }
+        url.searchParams.append('limit', String(BRANCH_PAGE_SIZE));
         const res = await fetch(url.toString());
         if (!res.ok) {
           throw new Error(`Error fetching branches: ${res.statusText}`);
@@ -32,7 +40,9 @@ function BranchesList({ repoPath, onSelect, customFilter, customSort }: Branches
           branches: { name: string; last_commit_time: string }[];
         };
         if (data.branches) {
-          setBranches(data.branches);
+          if (!haveSnapshot) {
+            setBranches(data.branches);
+          }
         } else {
           throw new Error('No branches found');
         }
@@ -47,6 +57,30 @@ function BranchesList({ repoPath, onSelect, customFilter, customSort }: Branches
       }
     };
     fetchBranches();
+
+    // Keep the list current as branches are created, moved or deleted
+    type Branch = { name: string; last_commit_time: string };
+    const byNewest = (b1: Branch, b2: Branch) =>
+      Date.parse(b2.last_commit_time) - Date.parse(b1.last_commit_time);
+    return watchRepo(
+      repoPath,
+      (event) => {
+        if (event.type === 'snapshot') {
+          haveSnapshot = true;
+          // Already newest first and cut to one page
+          setBranches(event.branches);
+          setError(null);
+        } else if (event.type === 'branches') {
+          setBranches((current) => {
+            const moved = [...event.added, ...event.updated];
+            const changed = new Set([...event.removed, ...moved.map((branch) => branch.name)]);
+            const kept = current.filter((branch) => !changed.has(branch.name));
+            return [...kept, ...moved].sort(byNewest).slice(0, BRANCH_PAGE_SIZE);
+          });
+        }
+      },
+      { limit: BRANCH_PAGE_SIZE }
+    );
   }, [repoPath]);
 
   function formatCommitTime(isoDate: string): string {
@@ -11,15 +11,51 @@ export async function isGitRepo(repoPath: string): Promise<boolean> {
   return response.data.is_git_repo;
 }
 
+export type ScannedRepo = {
+  path: string;
+  // null when HEAD is detached
+  branch: string | null;
+  detached: boolean;
+  // Tracked files only; absent when scanned with dirty=false, null if git status failed
+  dirty?: boolean | null;
+};
+
+export type RepoScan = {
+  root: string;
+  repos: ScannedRepo[];
+  // Directories left out for having too many entries
+  skipped: { path: string; entries: number }[];
+  scanned_dirs: number;
+  cached: boolean;
+  elapsed_ms: number;
+};
+
+// Every repository under a workspace directory, from one request instead of an isGitRepo() per path
+export async function scanRepos(root: string, refresh = false): Promise<RepoScan> {
+  const response = await axiosInstance.get('/repos/scan', { params: { root, refresh } });
+  return response.data;
+}
+
 export type GitDiffData = {
   changed_files: {
     file: string;
     status: string;
+    // Renamed and copied files also name the path they came from
+    old_file?: string;
+    new_file?: string;
+    // Sent without hunks: binary files, and files over the server's line/byte caps
+    binary?: boolean;
+    truncated?: 'lines' | 'bytes';
+    // For a truncated file, fetches its full hunks through getDiffHunks()
+    cursor?: string;
     changed_hunks: {
       hunk_header: string;
       lines: {
         line_type: string;
         text: string;
+        // Present on diffs decoded from the compact format
+        old_line?: number;
+        new_line?: number;
       }[];
     }[];
   }[];
@@ -37,8 +73,327 @@ export async function getDetailedDiff(
       repo_path: repoPath,
       base_branch: baseBranch,
       target_branch: mergedBranch,
-      detailed: true
+      detailed: true,
+      format: 'compact'
+    }
+  });
+  const diff: Omit<GitDiffData, 'changed_files'> & { changed_files: GitDiffCompactFile[] } =
+    response.data.diff;
+  return { ...diff, changed_files: diff.changed_files.map(decodeCompactFile) };
+}
+
+export type GitDiffFile = GitDiffData['changed_files'][number];
+
+// `format=compact`: a hunk's lines as one newline-joined text plus one type character per line
+export type GitDiffCompactHunk = {
+  hunk_header: string;
+  old_start: number;
+  old_count: number;
+  new_start: number;
+  new_count: number;
+  types: string;
+  text: string;
+};
+
+export type GitDiffCompactFile = Omit<GitDiffFile, 'changed_hunks'> & {
+  changed_hunks: GitDiffCompactHunk[];
+};
+
+const COMPACT_LINE_TYPES: Record<string, string> = { '+': 'added', '-': 'deleted', ' ': 'context' };
+
+// Expands a compact file record, numbering every line from its hunk's `@@` header
+export function decodeCompactFile(file: GitDiffCompactFile): GitDiffFile {
+  return {
+    ...file,
+    changed_hunks: file.changed_hunks.map((hunk) => {
+      const texts = hunk.types ? hunk.text.split('\n') : [];
+      let oldLine = hunk.old_start;
+      let newLine = hunk.new_start;
+      const lines = texts.map((text, position) => {
+        const type = hunk.types[position];
+        const line: GitDiffFile['changed_hunks'][number]['lines'][number] = {
+          text,
+          // A backslash marks a line kept verbatim, such as "\ No newline at end of file"
+          line_type: COMPACT_LINE_TYPES[type] ?? 'context'
+        };
+        if (type === '-' || type === ' ') {
+          line.old_line = oldLine++;
+        }
+        if (type === '+' || type === ' ') {
+          line.new_line = newLine++;
+        }
+        return line;
+      });
+      return { hunk_header: hunk.hunk_header, lines };
+    })
+  };
+}
+
+// How renames and copies were detected; limit_exceeded means git gave up on inexact matches
+export type GitDiffRenames = {
+  similarity: number;
+  copies: number;
+  limit: number;
+  limit_exceeded: boolean;
+};
+
+export type GitDiffSummary = {
+  lines_added: number;
+  lines_deleted: number;
+  files: number;
+  renames: GitDiffRenames;
+};
+
+type GitDiffStreamRecord =
+  | ({ type: 'file' } & GitDiffCompactFile)
+  | ({ type: 'summary' } & GitDiffSummary)
+  | { type: 'error'; detail: string };
+
+// Yields each record of an NDJSON response as soon as its line is complete
+async function* readNdjson<T>(response: Response): AsyncGenerator<T> {
+  if (!response.ok || !response.body) {
+    throw new Error(`Request failed: ${response.status}`);
+  }
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffered = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffered += value;
+    const lines = buffered.split('\n');
+    buffered = lines.pop() ?? '';
+    for (const line of lines) {
+      if (line) {
+        yield JSON.parse(line) as T;
+      }
     }
+  }
+}
+
+// Reads `/diff?stream=true` NDJSON and hands over each file as soon as the backend parsed it
+export async function streamDetailedDiff(
+  repoPath: string,
+  baseBranch: string,
+  mergedBranch: string,
+  onFile: (file: GitDiffFile) => void
+): Promise<GitDiffSummary> {
+  const parameters = new URLSearchParams({
+    repo_path: repoPath,
+    base_branch: baseBranch,
+    target_branch: mergedBranch,
+    detailed: 'true',
+    stream: 'true',
+    format: 'compact'
   });
-  return response.data.diff;
+  const response = await fetch(`${axiosInstance.defaults.baseURL}/diff?${parameters}`);
+  for await (const record of readNdjson<GitDiffStreamRecord>(response)) {
+    if (record.type === 'file') {
+      const { type: _type, ...file } = record;
+      onFile(decodeCompactFile(file));
+    } else if (record.type === 'summary') {
+      const { type: _type, ...summary } = record;
+      return summary;
+    } else {
+      throw new Error(record.detail);
+    }
+  }
+  throw new Error('Diff stream ended without a summary');
+}
+
+export type GitDiffFileIndexEntry = {
+  file: string;
+  old_file?: string;
+  status: string;
+  binary: boolean;
+  lines_added: number;
+  lines_deleted: number;
+  cursor: string;
+};
+
+export type GitDiffFileIndex = {
+  lines_added: number;
+  lines_deleted: number;
+  total_files: number;
+  offset: number;
+  files: GitDiffFileIndexEntry[];
+  renames: GitDiffRenames;
+};
+
+export async function getDiffFileIndex(
+  repoPath: string,
+  baseBranch: string,
+  mergedBranch: string
+): Promise<GitDiffFileIndex> {
+  const response = await axiosInstance.get('/diff/files', {
+    params: {
+      repo_path: repoPath,
+      base_branch: baseBranch,
+      target_branch: mergedBranch
+    }
+  });
+  return response.data;
+}
+
+export async function getDiffHunks(repoPath: string, cursors: string[]): Promise<GitDiffFile[]> {
+  const response = await axiosInstance.get('/diff/hunks', {
+    params: {
+      repo_path: repoPath,
+      cursor: cursors,
+      format: 'compact'
+    },
+    // FastAPI expects repeated `cursor=` keys rather than `cursor[]=`
+    paramsSerializer: { indexes: null }
+  });
+  return (response.data.changed_files as GitDiffCompactFile[]).map(decodeCompactFile);
+}
+
+export type StackEdgeSummary = {
+  parent: string;
+  child: string;
+  parent_sha?: string;
+  child_sha?: string;
+  lines_added?: number;
+  lines_deleted?: number;
+  files?: number;
+  ignored_files?: number;
+  cached?: boolean;
+  large?: boolean;
+  error?: string;
+};
+
+export type StackDiffSummary = {
+  base_branches: string[];
+  threshold: number;
+  edges: StackEdgeSummary[];
+  elapsed_ms: number;
+};
+
+export async function getStackDiffSummary(
+  repoPath: string,
+  branchTree?: Record<string, string[]>,
+  baseBranches?: string[]
+): Promise<StackDiffSummary> {
+  // Without a tree the server reads the stack from the repo's .git-barber config
+  const response = await axiosInstance.post('/stack-diff-summary', {
+    repo_path: repoPath,
+    branch_tree: branchTree,
+    base_branches: baseBranches
+  });
+  return response.data;
+}
+
+export type StackSyncBranchStatus = 'merged' | 'up-to-date' | 'conflict' | 'skipped' | 'failed';
+
+export type StackSyncBranchEvent = {
+  type: 'branch';
+  branch: string;
+  parent: string;
+  status: StackSyncBranchStatus;
+  commit?: string;
+  conflicts?: string[];
+  detail?: string;
+};
+
+export type StackSyncPullEvent = {
+  type: 'pull';
+  branch?: string;
+  status: 'up-to-date' | 'fast-forwarded' | 'diverged' | 'failed';
+  detail?: string;
+};
+
+export type StackSyncSummary = { start_branch: string; elapsed_ms: number } & Record<
+  StackSyncBranchStatus,
+  string[]
+>;
+
+type StackSyncRecord =
+  | StackSyncBranchEvent
+  | StackSyncPullEvent
+  | ({ type: 'summary' } & StackSyncSummary)
+  | { type: 'error'; detail: string };
+
+// Merges startBranch down the stack server-side, reporting every branch as it is synced
+export async function streamStackSync(
+  repoPath: string,
+  startBranch: string,
+  onEvent: (event: StackSyncBranchEvent | StackSyncPullEvent) => void,
+  pull = false
+): Promise<StackSyncSummary> {
+  const response = await fetch(`${axiosInstance.defaults.baseURL}/stack-sync`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ repo_path: repoPath, start_branch: startBranch, pull, stream: true })
+  });
+  for await (const record of readNdjson<StackSyncRecord>(response)) {
+    if (record.type === 'summary') {
+      const { type: _type, ...summary } = record;
+      return summary;
+    } else if (record.type === 'error') {
+      throw new Error(record.detail);
+    }
+    onEvent(record);
+  }
+  throw new Error('Stack sync stream ended without a summary');
+}
+
+export type RepoWatchBranch = {
+  name: string;
+  commit: string;
+  last_commit_time: string;
+  timestamp: number;
+};
+
+export type RepoWatchEvent =
+  | {
+      type: 'snapshot';
+      version: number;
+      current_branch: string | null;
+      head: string | null;
+      // Newest first, cut to the `limit` passed to watchRepo()
+      branches: RepoWatchBranch[];
+      total_branches: number;
+    }
+  | {
+      type: 'branches';
+      version: number;
+      added: RepoWatchBranch[];
+      updated: RepoWatchBranch[];
+      removed: string[];
+    }
+  | { type: 'head'; version: number; current_branch: string | null; head: string | null }
+  | { type: 'index'; version: number; index_mtime: number | null }
+  | { type: 'resync'; version: number };
+
+// Subscribes to HEAD and branch changes instead of polling; returns a function that unsubscribes.
+// `limit` and `prefix` narrow the branches the way they narrow a /branches page.
+export function watchRepo(
+  repoPath: string,
+  onEvent: (event: RepoWatchEvent) => void,
+  options: { limit?: number; prefix?: string } = {}
+): () => void {
+  const params = new URLSearchParams({ repo_path: repoPath });
+  if (options.limit !== undefined) {
+    params.append('limit', String(options.limit));
+  }
+  if (options.prefix) {
+    params.append('prefix', options.prefix);
+  }
+  const source = new EventSource(`${axiosInstance.defaults.baseURL}/watch?${params}`);
+  const listener = (message: MessageEvent<string>) => {
+    const event = JSON.parse(message.data) as RepoWatchEvent;
+    if (event.type === 'resync') {
+      // Deltas were dropped; reconnecting starts over with a fresh snapshot
+      source.close();
+      unsubscribe = watchRepo(repoPath, onEvent, options);
+      return;
+    }
+    onEvent(event);
+  };
+  for (const type of ['snapshot', 'branches', 'head', 'index', 'resync']) {
+    source.addEventListener(type, listener);
+  }
+  let unsubscribe = () => source.close();
+  return () => unsubscribe();
 }
@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
 
 import clsx from 'clsx';
 import CodeViewer from 'react-syntax-highlighter';
@@ -6,13 +6,47 @@ import { githubGist } from 'react-syntax-highlighter/dist/esm/styles/hljs';
 
 import DiffViewTopBar from '@/components/DiffViewTopBar';
 import { Button } from '@/components/ui/button';
-import { getDetailedDiff, GitDiffData } from '@/services/local-git-api.service';
+import {
+  getDiffFileIndex,
+  getDiffHunks,
+  GitDiffFile,
+  GitDiffFileIndex
+} from '@/services/local-git-api.service';
 
 interface DiffLine {
   text: string;
   line_type: string;
 }
 
+const HUNK_PAGE_SIZE = 50;
+
+type DisplayHunk = { code: string; lineTypes: string[] };
+// A file's hunks once fetched; truncated files have none, only a cursor for the full ones
+type LoadedFile = { hunks: DisplayHunk[]; truncated?: string; cursor?: string };
+
+function toDisplayHunks(file: GitDiffFile): DisplayHunk[] {
+  let hunks: DisplayHunk[] = [];
+  if (file.changed_hunks) {
+    file.changed_hunks.forEach((hunk) => {
+      let lines: DiffLine[] = [];
+      // Add hunk header line
+      lines.push({ text: hunk.hunk_header, line_type: 'header' });
+      // Add each line from the hunk with appropriate prefix
+      if (hunk.lines) {
+        hunk.lines.forEach((line) => {
+          const prefix =
+            line.line_type === 'added' ? '+' : line.line_type === 'deleted' ? '-' : ' ';
+          lines.push({ text: prefix + line.text, line_type: line.line_type });
+        });
+      }
+      const code = lines.map((l) => l.text).join('\n');
+      const lineTypes = lines.map((l) => l.line_type);
+      hunks.push({ code, lineTypes });
+    });
+  }
+  return hunks;
+}
+
 export default function DiffView({
   repoPath,
   baseBranch,
@@ -24,50 +58,101 @@ export default function DiffView({
   mergedBranch: string;
   className?: string;
 }) {
-  const [diffData, setDiffData] = useState<GitDiffData | null>(null);
-  const [fileDiffs, setFileDiffs] = useState<
-    Array<{
-      file: string;
-      status: string;
-      hunks: Array<{ code: string; lineTypes: string[] }>;
-    }>
-  >([]);
+  const [fileIndex, setFileIndex] = useState<GitDiffFileIndex | null>(null);
+  // Hunks keyed by file path, fetched as each file scrolls into view
+  const [fileHunks, setFileHunks] = useState<Record<string, LoadedFile>>({});
+  const containerRef = useRef<HTMLDivElement>(null);
+  // Files already asked for, and the ones waiting to go out in the next /diff/hunks request
+  const requested = useRef(new Set<string>());
+  const pending = useRef<{ file: string; cursor: string }[]>([]);
+  // Bumped whenever the diff changes, so responses for the previous one are dropped
+  const generation = useRef(0);
 
   useEffect(() => {
-    getDetailedDiff(repoPath, baseBranch, mergedBranch).then((diff) => {
-      setDiffData(diff);
+    generation.current += 1;
+    requested.current = new Set();
+    pending.current = [];
+    setFileIndex(null);
+    setFileHunks({});
+    getDiffFileIndex(repoPath, baseBranch, mergedBranch).then((index) => {
+      setFileIndex(index);
     });
   }, [repoPath, baseBranch, mergedBranch]);
 
-  useEffect(() => {
-    if (diffData && diffData.changed_files) {
-      const files = diffData.changed_files.map((file) => {
-        let hunks: { code: string; lineTypes: string[] }[] = [];
-        if (file.changed_hunks) {
-          file.changed_hunks.forEach((hunk) => {
-            let lines: DiffLine[] = [];
-            // Add hunk header line
-            lines.push({ text: hunk.hunk_header, line_type: 'header' });
-            // Add each line from the hunk with appropriate prefix
-            if (hunk.lines) {
-              hunk.lines.forEach((line) => {
-                const prefix =
-                  line.line_type === 'added' ? '+' : line.line_type === 'deleted' ? '-' : ' ';
-                lines.push({ text: prefix + line.text, line_type: line.line_type });
-              });
-            }
-            const code = lines.map((l) => l.text).join('\n');
-            const lineTypes = lines.map((l) => l.line_type);
-            hunks.push({ code, lineTypes });
+  const requestHunks = useCallback(
+    (file: string, cursor: string, force = false) => {
+      if (requested.current.has(file) && !force) {
+        return;
+      }
+      requested.current.add(file);
+      pending.current.push({ file, cursor });
+      if (pending.current.length > 1) {
+        // Already scheduled: files that come into view together share a request
+        return;
+      }
+      const requestGeneration = generation.current;
+      setTimeout(async () => {
+        const batch = pending.current.splice(0);
+        for (let start = 0; start < batch.length; start += HUNK_PAGE_SIZE) {
+          const page = batch.slice(start, start + HUNK_PAGE_SIZE);
+          const files = await getDiffHunks(repoPath, page.map((entry) => entry.cursor));
+          if (generation.current !== requestGeneration) {
+            return;
+          }
+          setFileHunks((previous) => {
+            const next = { ...previous };
+            page.forEach((entry) => {
+              next[entry.file] = { hunks: [] };
+            });
+            files.forEach((file) => {
+              next[file.file] = {
+                hunks: toDisplayHunks(file),
+                truncated: file.truncated,
+                cursor: file.cursor
+              };
+            });
+            return next;
           });
         }
-        return { file: file.file, status: file.status, hunks };
-      });
-      setFileDiffs(files);
+      }, 0);
+    },
+    [repoPath]
+  );
+
+  useEffect(() => {
+    const container = containerRef.current;
+    if (!fileIndex || !container) {
+      return;
+    }
+    const observer = new IntersectionObserver(
+      (entries) => {
+        entries.forEach((entry) => {
+          if (!entry.isIntersecting) {
+            return;
+          }
+          observer.unobserve(entry.target);
+          const file = fileIndex.files[Number((entry.target as HTMLElement).dataset.fileIndex)];
+          // Binary files have no hunks worth fetching
+          if (file && !file.binary) {
+            requestHunks(file.file, file.cursor);
+          }
+        });
+      },
+      { root: container, rootMargin: '400px 0px' }
+    );
+    container.querySelectorAll('[data-file-index]').forEach((element) => observer.observe(element));
+    return () => observer.disconnect();
+  }, [fileIndex, requestHunks]);
+
+  // Truncated files are only fetched in full when asked for
+  const loadFullFile = (file: string) => {
+    const cursor = fileHunks[file]?.cursor;
+    if (cursor) {
+      requestHunks(file, cursor, true);
     }
-  }, [diffData]);
+  };
 
-  if (!diffData) {
+  if (!fileIndex) {
     return <div>Loading diff...</div>;
   }
 
@@ -76,21 +161,40 @@ export default function DiffView({
   // TODO: support staging entire file
   // TODO: support line selection and staging
   return (
-    <div className={clsx('flex w-full flex-col overflow-y-auto', className)}>
+    <div ref={containerRef} className={clsx('flex w-full flex-col overflow-y-auto', className)}>
       <DiffViewTopBar
-        numberOfFiles={diffData.changed_files.length}
-        linesAdded={diffData.lines_added}
-        linesRemoved={diffData.lines_deleted}
+        numberOfFiles={fileIndex.total_files}
+        linesAdded={fileIndex.lines_added}
+        linesRemoved={fileIndex.lines_deleted}
       />
 
-      {fileDiffs.map((fileDiff, index) => (
-        <div key={index} className='mb-[30px] rounded-md border border-gray-300'>
+      {fileIndex.files.map((entry, index) => (
+        <div
+          key={index}
+          data-file-index={index}
+          className='mb-[30px] rounded-md border border-gray-300'
+        >
           <div className='flex border-b border-b-gray-300 bg-zinc-100/50 p-3'>
             <h3 style={{ fontFamily: 'monospace' }}>
-              {fileDiff.file} ({fileDiff.status})
+              {entry.file} ({entry.status})
             </h3>
           </div>
-          {fileDiff.hunks.map((hunk, hunkIndex) => (
+          {entry.binary && <div className='p-3 text-sm text-gray-500'>Binary file not shown.</div>}
+          {!entry.binary && !fileHunks[entry.file] && (
+            <div className='p-3 text-sm text-gray-500'>Loading...</div>
+          )}
+          {fileHunks[entry.file]?.truncated && (
+            <div className='flex items-center gap-3 p-3 text-sm text-gray-500'>
+              Large diff not shown.
+              <Button
+                className='rounded bg-slate-600 p-2 text-xs font-semibold hover:bg-slate-700'
+                onClick={() => loadFullFile(entry.file)}
+              >
+                Load diff
+              </Button>
+            </div>
+          )}
+          {(fileHunks[entry.file]?.hunks ?? []).map((hunk, hunkIndex, hunks) => (
             <div key={hunkIndex} className='relative mb-2'>
               <Button className='absolute right-2 top-2 rounded bg-slate-600 p-2 text-xs font-semibold hover:bg-slate-700'>
                 Stage Hunk
@@ -122,7 +226,7 @@ export default function DiffView({
               >
                 {hunk.code}
               </CodeViewer>
-              {hunkIndex < fileDiff.hunks.length - 1 && (
+              {hunkIndex < hunks.length - 1 && (
                 <div className='my-2 h-[2px] bg-gray-300'></div>
               )}
             </div>